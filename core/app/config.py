@@ -1,5 +1,5 @@
 import os
-from pymongo import MongoClient
+from pymongo import MongoClient, AsyncMongoClient
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -8,8 +8,112 @@ load_dotenv()
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
 DB_NAME = os.getenv("DB_NAME", "datamind_ai")
 
-client = MongoClient(MONGO_URI)
+# Connection pool and timeouts (a timeout of 0 means no timeout)
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "10000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "10000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "0"))
+
+MONGO_CLIENT_OPTIONS = {
+    "maxPoolSize": MONGO_MAX_POOL_SIZE,
+    "minPoolSize": MONGO_MIN_POOL_SIZE,
+    "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS or None,
+    "socketTimeoutMS": MONGO_SOCKET_TIMEOUT_MS or None
+}
+
+# How long startup waits for the DB before skipping index creation
+MONGO_STARTUP_PING_TIMEOUT_SECONDS = float(os.getenv("MONGO_STARTUP_PING_TIMEOUT_SECONDS", "2"))
+
+client = MongoClient(MONGO_URI, **MONGO_CLIENT_OPTIONS)
 db = client[DB_NAME]
 
+# Async client for the async request handlers; the sync `db` stays for
+# threadpool routes and the analysis worker processes
+async_client = AsyncMongoClient(MONGO_URI, **MONGO_CLIENT_OPTIONS)
+async_db = async_client[DB_NAME]
+
 # File size threshold for large file detection (5MB)
-LARGE_FILE_THRESHOLD = 5 * 1024 * 1024
\ No newline at end of file
+LARGE_FILE_THRESHOLD = 5 * 1024 * 1024
+
+# Memory budget for the process-wide parsed DataFrame cache (in MB)
+DATAFRAME_CACHE_MAX_MB = int(os.getenv("DATAFRAME_CACHE_MAX_MB", "1024"))
+
+# How long analysis endpoints wait on a running background analysis before reporting it as pending
+ANALYSIS_WAIT_TIMEOUT_SECONDS = float(os.getenv("ANALYSIS_WAIT_TIMEOUT_SECONDS", "60"))
+ANALYSIS_POLL_INTERVAL_SECONDS = float(os.getenv("ANALYSIS_POLL_INTERVAL_SECONDS", "0.5"))
+
+# Files above this size are profiled in chunks instead of being loaded whole
+STREAMING_PROFILE_THRESHOLD_MB = int(os.getenv("STREAMING_PROFILE_THRESHOLD_MB", "256"))
+STREAMING_CHUNK_ROWS = int(os.getenv("STREAMING_CHUNK_ROWS", "100000"))
+
+# In "auto" summary mode, frames with more rows than this are summarized with sketches
+SKETCH_SUMMARY_THRESHOLD_ROWS = int(os.getenv("SKETCH_SUMMARY_THRESHOLD_ROWS", "1000000"))
+
+# Memory-optimizing load mode: downcast numerics, categorize low-cardinality strings,
+# parse timestamp columns and (optionally) use Arrow-backed strings
+OPTIMIZE_DTYPES_ON_LOAD = os.getenv("OPTIMIZE_DTYPES_ON_LOAD", "false").lower() == "true"
+ARROW_STRINGS_ON_LOAD = os.getenv("ARROW_STRINGS_ON_LOAD", "false").lower() == "true"
+
+# Background analysis job executor: worker processes and admission budget
+# (total size of source files being analyzed at the same time)
+ANALYSIS_MAX_WORKERS = int(os.getenv("ANALYSIS_MAX_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+ANALYSIS_MAX_INFLIGHT_MB = int(os.getenv("ANALYSIS_MAX_INFLIGHT_MB", "2048"))
+
+# Minimum seconds between progress updates written to an analysis job record
+JOB_PROGRESS_INTERVAL_SECONDS = float(os.getenv("JOB_PROGRESS_INTERVAL_SECONDS", "1"))
+
+# Seconds between status polls of the server-sent progress feed
+STATUS_EVENTS_POLL_SECONDS = float(os.getenv("STATUS_EVENTS_POLL_SECONDS", "1"))
+
+# Page size of the uploaded files listing (default and maximum)
+FILES_PAGE_SIZE = int(os.getenv("FILES_PAGE_SIZE", "100"))
+FILES_PAGE_MAX = int(os.getenv("FILES_PAGE_MAX", "1000"))
+
+# Directory of the artifact store holding bulky results (profiles, anomaly lists,
+# aggregation outputs) as compressed files referenced from the Mongo records
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", "app/uploads/.artifacts")
+# Replaced artifacts stay readable this long (for readers still holding the old ID)
+# before a sweep removes them
+ARTIFACT_RETIRE_GRACE_SECONDS = int(os.getenv("ARTIFACT_RETIRE_GRACE_SECONDS", "600"))
+
+# Resumable chunked uploads: default and maximum chunk size (in MB)
+UPLOAD_CHUNK_MB = int(os.getenv("UPLOAD_CHUNK_MB", "8"))
+UPLOAD_CHUNK_MAX_MB = int(os.getenv("UPLOAD_CHUNK_MAX_MB", "64"))
+# Upload sessions not finalized within this many hours expire and their staged chunks are removed
+UPLOAD_SESSION_TTL_HOURS = float(os.getenv("UPLOAD_SESSION_TTL_HOURS", "24"))
+
+# Cache of LLM results (rules, insights, aggregation suggestions), keyed by model,
+# prompt template and profile; entries expire after LLM_CACHE_TTL_SECONDS
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", "app/uploads/.llm_cache")
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+# Expired entries are pruned from the cache directory at most this often
+LLM_CACHE_PRUNE_INTERVAL_SECONDS = int(os.getenv("LLM_CACHE_PRUNE_INTERVAL_SECONDS", "3600"))
+
+# Approximate token budget for the dataset profile embedded in LLM prompts
+LLM_PROMPT_TOKEN_BUDGET = int(os.getenv("LLM_PROMPT_TOKEN_BUDGET", "4000"))
+
+# Shared async LLM client: optional Gemini API endpoint override (e.g. the local
+# fake LLM server), per-call deadline covering all retries, concurrency limit
+# and retry policy (exponential backoff with full jitter)
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL") or None
+LLM_CALL_TIMEOUT_SECONDS = float(os.getenv("LLM_CALL_TIMEOUT_SECONDS", "60"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", "0.5"))
+
+# Grouped anomaly detection: parallel jobs for the per-group model fits and the
+# smallest group that gets its own model. Scans run at request time, so each uses
+# at most ANOMALY_N_JOBS processes and at most ANOMALY_MAX_PARALLEL_SCANS scans per
+# web worker run in parallel at once (the others run in their request thread)
+ANOMALY_N_JOBS = int(os.getenv("ANOMALY_N_JOBS", "2"))
+ANOMALY_MAX_PARALLEL_SCANS = int(os.getenv("ANOMALY_MAX_PARALLEL_SCANS", "2"))
+ANOMALY_MIN_GROUP_ROWS = int(os.getenv("ANOMALY_MIN_GROUP_ROWS", "10"))
+
+# Anomaly scans of frames with more than ANOMALY_SAMPLED_THRESHOLD_ROWS rows fit the
+# model on a sample of ANOMALY_SAMPLE_ROWS rows, then score every row in chunks of
+# ANOMALY_SCORE_CHUNK_ROWS rows, in parallel across ANOMALY_N_JOBS processes
+ANOMALY_SAMPLED_THRESHOLD_ROWS = int(os.getenv("ANOMALY_SAMPLED_THRESHOLD_ROWS", "1000000"))
+ANOMALY_SAMPLE_ROWS = int(os.getenv("ANOMALY_SAMPLE_ROWS", "100000"))
+ANOMALY_SCORE_CHUNK_ROWS = int(os.getenv("ANOMALY_SCORE_CHUNK_ROWS", "250000"))
@@ -1,8 +1,24 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from app.routes import file_upload, data_analysis
+from app.services.job_service import shutdown_executor, recover_interrupted_jobs
+from app.services.persistence_service import ensure_indexes
+from app.services.async_persistence_service import close_async_client
 
-app = FastAPI(root_path="/datamind_ai")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Make sure file_path/job_id lookups are indexed before serving requests
+    await run_in_threadpool(ensure_indexes)
+    # Jobs queued or running when the application last stopped were lost with its queue
+    await run_in_threadpool(recover_interrupted_jobs)
+    yield
+    # Stop the background analysis worker processes
+    shutdown_executor()
+    await close_async_client()
+
+app = FastAPI(root_path="/datamind_ai", lifespan=lifespan)
 
 # Enable CORS for frontend communication
 app.add_middleware(
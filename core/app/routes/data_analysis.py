@@ -1,17 +1,44 @@
 from fastapi import APIRouter, HTTPException
-from fastapi.responses import JSONResponse
-from app.services.ai_service import analyze_file, generate_visualization_rules, generate_ai_insights, detect_anomalies, load_dataframe, generate_aggregation_rules, execute_aggregation_rule
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from app.services.ai_service import (
+    generate_visualization_rules_async, generate_ai_insights_async, generate_aggregation_rules_async, generate_dashboard_plan_async,
+    stream_ai_insights_async,
+    get_cached_dataframe, execute_aggregation_rule, get_dataframe_cache_stats
+)
+from app.services.file_upload_service import get_file_analysis, get_file_anomalies, AnalysisPendingError
+from app.services.prompt_service import compact_profile
 import os
+import json
 
 router = APIRouter()
 
 UPLOAD_DIR = "app/uploads"
 
+def _analysis_pending(error: AnalysisPendingError) -> JSONResponse:
+    """
+    202 response for a file whose background analysis has not finished yet;
+    the client follows /sheets/status/{filename}/events and retries.
+    """
+    return JSONResponse(
+        content={"file_name": error.filename, "status": "pending", "job": error.job, "message": str(error)},
+        status_code=202
+    )
+
+@router.get("/analysis/cache/stats")
+def dataframe_cache_stats_endpoint():
+    """
+    Returns hit/miss counters and memory usage of the parsed DataFrame cache.
+    """
+    return JSONResponse(content=get_dataframe_cache_stats(), status_code=200)
+
 @router.post("/analysis/{filename}")
-def analyze_file_endpoint(filename: str):
+def analyze_file_endpoint(filename: str, summary_mode: str = "auto"):
     """
     Triggers the AI analysis for a specific uploaded file.
     Extracts metadata and statistical summary.
+    summary_mode: "exact", "sketch" (approximate, with error bounds) or "auto".
+    "exact" is rejected (400) for files too large to load whole.
     """
     file_path = os.path.join(UPLOAD_DIR, filename)
     
@@ -19,15 +46,38 @@ def analyze_file_endpoint(filename: str):
         raise HTTPException(status_code=404, detail="File not found")
         
     try:
-        analysis_result = analyze_file(file_path)
+        analysis_result = get_file_analysis(filename, file_path, summary_mode=summary_mode)
         return JSONResponse(content=analysis_result, status_code=200)
+    except AnalysisPendingError as e:
+        return _analysis_pending(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/analysis/{filename}/prompt-profile")
+def prompt_profile_endpoint(filename: str, token_budget: int = None):
+    """
+    Returns the compacted profile sent to the LLM and its estimated token count.
+    """
+    file_path = os.path.join(UPLOAD_DIR, filename)
+    
+    if not os.path.exists(file_path):
+        raise HTTPException(status_code=404, detail="File not found")
+        
+    try:
+        analysis_result = get_file_analysis(filename, file_path)
+        profile = compact_profile(analysis_result, token_budget) if token_budget else compact_profile(analysis_result)
+        return JSONResponse(content=profile, status_code=200)
+    except AnalysisPendingError as e:
+        return _analysis_pending(e)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/analysis/{filename}/rules")
-def generate_rules_endpoint(filename: str):
+async def generate_rules_endpoint(filename: str):
     """
     Triggers the LLM to generate visualization rules based on the file analysis.
     """
@@ -37,20 +87,22 @@ def generate_rules_endpoint(filename: str):
         raise HTTPException(status_code=404, detail="File not found")
         
     try:
-        # First, analyze the file to get stats
-        analysis_result = analyze_file(file_path)
+        # First, get the stored (or freshly computed) file profile
+        analysis_result = await run_in_threadpool(get_file_analysis, filename, file_path)
         
         # Then, generate rules based on stats
-        rules = generate_visualization_rules(analysis_result)
+        rules = await generate_visualization_rules_async(analysis_result)
         
         return JSONResponse(content={"rules": rules}, status_code=200)
+    except AnalysisPendingError as e:
+        return _analysis_pending(e)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/analysis/{filename}/insights")
-def generate_insights_endpoint(filename: str):
+async def generate_insights_endpoint(filename: str):
     """
     Triggers the LLM to generate narrative insights, trends, and quality scores.
     """
@@ -60,23 +112,91 @@ def generate_insights_endpoint(filename: str):
         raise HTTPException(status_code=404, detail="File not found")
         
     try:
-        # First, analyze the file to get stats
-        analysis_result = analyze_file(file_path)
+        # First, get the stored (or freshly computed) file profile
+        analysis_result = await run_in_threadpool(get_file_analysis, filename, file_path)
         
         # Then, generate insights based on stats
-        insights = generate_ai_insights(analysis_result)
+        insights = await generate_ai_insights_async(analysis_result)
         
         return JSONResponse(content=insights, status_code=200)
+    except AnalysisPendingError as e:
+        return _analysis_pending(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@router.get("/analysis/{filename}/insights/stream")
+async def stream_insights_endpoint(filename: str):
+    """
+    Server-sent events version of /insights: forwards the reply as it is generated
+    ("chunk" events), each parsed top-level field and array element ("field" / "item"
+    events) and a final "done" event with the complete insights. Cached insights are
+    sent straight away as the "done" event.
+    """
+    file_path = os.path.join(UPLOAD_DIR, filename)
+
+    if not os.path.exists(file_path):
+        raise HTTPException(status_code=404, detail="File not found")
+
+    try:
+        analysis_result = await run_in_threadpool(get_file_analysis, filename, file_path)
+    except AnalysisPendingError as e:
+        return _analysis_pending(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def events():
+        async for event in stream_ai_insights_async(analysis_result):
+            yield _sse_event(event["event"], event["data"])
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post("/analysis/{filename}/dashboard-plan")
+async def generate_dashboard_plan_endpoint(filename: str):
+    """
+    Gets visualization rules, insights and aggregation suggestions from one LLM call.
+    The parts are cached for the /rules, /insights and /aggregations/suggest endpoints.
+    """
+    file_path = os.path.join(UPLOAD_DIR, filename)
+    
+    if not os.path.exists(file_path):
+        raise HTTPException(status_code=404, detail="File not found")
+        
+    try:
+        # First, get the stored (or freshly computed) file profile
+        analysis_result = await run_in_threadpool(get_file_analysis, filename, file_path)
+        
+        plan = await generate_dashboard_plan_async(analysis_result)
+        
+        return JSONResponse(content=plan, status_code=200)
+    except AnalysisPendingError as e:
+        return _analysis_pending(e)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/analysis/{filename}/anomalies")
-def detect_anomalies_endpoint(filename: str):
+def detect_anomalies_endpoint(filename: str, group_by: str = None, mode: str = None, contamination: str = None,
+                              threshold: float = None, stratify_by: str = None):
     """
     Triggers the statistical anomaly detection on the uploaded file.
-    Returns indices and values of detected anomalies.
+    Returns indices, scores and values of detected anomalies.
+    With group_by (e.g. ?group_by=DeviceID) each group gets its own model; grouped scans
+    take no other parameters and are refused (400) for files too large to load whole.
+    mode ("full", "sampled" or "auto"), contamination ("auto" or a fraction), threshold
+    (a score cutoff) and stratify_by (the column the fitting sample is stratified by)
+    tune the whole-file scan.
     """
     file_path = os.path.join(UPLOAD_DIR, filename)
     
@@ -84,11 +204,13 @@ def detect_anomalies_endpoint(filename: str):
         raise HTTPException(status_code=404, detail="File not found")
         
     try:
-        # Load the dataframe using the shared service function
-        df = load_dataframe(file_path)
-        
-        # Detect anomalies
-        anomalies = detect_anomalies(df)
+        # Serve the scan stored by the background analysis, or detect anomalies now
+        options = {
+            key: value for key, value in
+            {"mode": mode, "contamination": contamination, "threshold": threshold, "stratify_by": stratify_by}.items()
+            if value is not None
+        }
+        anomalies = get_file_anomalies(filename, file_path, group_by, options)
         
         return JSONResponse(content=anomalies, status_code=200)
     except ValueError as e:
@@ -97,7 +219,7 @@ def detect_anomalies_endpoint(filename: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/analysis/{filename}/aggregations/suggest")
-def generate_aggregation_rules_endpoint(filename: str):
+async def generate_aggregation_rules_endpoint(filename: str):
     """
     Triggers the LLM to suggest Pandas aggregation rules based on file analysis.
     """
@@ -107,13 +229,15 @@ def generate_aggregation_rules_endpoint(filename: str):
         raise HTTPException(status_code=404, detail="File not found")
         
     try:
-        # First, analyze the file to get stats
-        analysis_result = analyze_file(file_path)
+        # First, get the stored (or freshly computed) file profile
+        analysis_result = await run_in_threadpool(get_file_analysis, filename, file_path)
         
         # generate rules
-        rules = generate_aggregation_rules(analysis_result)
+        rules = await generate_aggregation_rules_async(analysis_result)
         
         return JSONResponse(content={"rules": rules}, status_code=200)
+    except AnalysisPendingError as e:
+        return _analysis_pending(e)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -131,8 +255,11 @@ def execute_aggregation_endpoint(filename: str, rule: dict):
         raise HTTPException(status_code=404, detail="File not found")
         
     try:
-        # Load the dataframe
-        df = load_dataframe(file_path)
+        # Only the grouped and aggregated columns are needed for the rule
+        columns = list(dict.fromkeys(list(rule.get("group_by", [])) + list(rule.get("aggregations", {}).keys())))
+
+        # Load the dataframe through the shared process-wide cache
+        df = get_cached_dataframe(file_path, columns=columns or None)
         
         # Execute the rule
         result = execute_aggregation_rule(df, rule)
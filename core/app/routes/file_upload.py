@@ -1,10 +1,29 @@
 import os
 import uuid
-from fastapi import APIRouter, UploadFile, File, BackgroundTasks
-from fastapi.responses import JSONResponse, FileResponse
-from app.services.file_upload_service import save_uploaded_file, get_uploaded_files, get_file_columns, update_file_analysis
-from app.services.ai_service import analyze_file
-from app.config import LARGE_FILE_THRESHOLD
+import json
+import asyncio
+import time
+from fastapi import APIRouter, UploadFile, File, Request
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from pymongo.errors import DuplicateKeyError
+from app.services.file_upload_service import (
+    update_file_analysis, get_source_signature, get_uploaded_files, prefetch_documents, stream_files_listing,
+    read_file_columns, get_stored_column_classification, store_column_classification, classify_columns_async
+)
+from app.services.ai_service import invalidate_dataframe_cache
+from app.services.job_service import get_analysis_job, get_queue_stats, get_file_status
+from app.services.async_persistence_service import (
+    save_uploaded_file_async, submit_analysis_job_async, get_file_status_async, find_file_by_hash_async, release_content_hash_async,
+    create_upload_session_async, get_upload_session_async, update_upload_session_async, claim_upload_session_async,
+    delete_upload_sessions_created_before_async
+)
+from app.services.ingest_service import new_upload_ingest, ingest_chunk, finish_upload_ingest, abort_upload_ingest
+from app.services.chunked_upload_service import (
+    new_upload_session, write_chunk, profiles_upload, advance_upload_profile, upload_progress, assemble_upload, discard_upload,
+    session_expired, session_expiry_cutoff, sweep_expired_uploads
+)
+from app.config import LARGE_FILE_THRESHOLD, STATUS_EVENTS_POLL_SECONDS, FILES_PAGE_SIZE
 
 
 
@@ -12,74 +31,329 @@ router = APIRouter()
 
 UPLOAD_DIR = "app/uploads"
 
+# Seconds of silence after which the progress feed sends a keep-alive comment
+STATUS_EVENTS_HEARTBEAT_SECONDS = 15
+TERMINAL_STATUSES = ("completed", "failed")
+
 # Ensure upload directory exists
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-def process_file_background(filename: str, file_path: str):
-    """
-    Background task to analyze file.
-    """
-    try:
-        print(f"Starting background analysis for {filename}...")
-        
-        # Analyze file (Metadata + Stats)
-        analysis_result = analyze_file(file_path)
-
-        # Update DB
-        update_file_analysis(filename, analysis_result)
-        print(f"Background analysis completed for {filename}.")
-        return True
-        
-    except Exception as e:
-        print(f"Error in background processing for {filename}: {e}")
-        update_file_analysis(filename, {"error": str(e)}, status="failed")
-        return False
-
 @router.post("/upload-file")
-async def upload_file(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
+async def upload_file(file: UploadFile = File(...)):
     """
     Generate a unique filename: data-sheet-<uuid> and add it into db and folder[apps/uploads]
-    Triggers background analysis.
+    Queues background analysis on the analysis job executor.
+    If a file with identical content was uploaded before, the new copy is discarded
+    and the existing file (with its columnar cache, profile and AI results) is returned.
     """
     # Generate unique filename with original extension
     unique_filename = f"data-sheet-{uuid.uuid4().hex[:8]}{os.path.splitext(file.filename)[1] if file.filename else ''}"
     file_path = os.path.join(UPLOAD_DIR, unique_filename)
 
-    # Check file size (approximate by reading into memory - careful with RAM)
-    # Better: read chunks and write.
-    file_size = 0
-    with open(file_path, "wb") as f:
+    # Write and hash in a worker thread so disk I/O never blocks the event loop.
+    # Profiling is left to the background job (process pool, admission control).
+    ingest = await run_in_threadpool(new_upload_ingest, file_path)
+    try:
         while chunk := await file.read(1024 * 1024):  # Read in 1MB chunks
-            file_size += len(chunk)
-            f.write(chunk)
+            await run_in_threadpool(ingest_chunk, ingest, chunk)
+    except Exception:
+        await run_in_threadpool(abort_upload_ingest, ingest)
+        raise
+    ingested = await run_in_threadpool(finish_upload_ingest, ingest)
+
+    return await _register_upload(unique_filename, file_path, ingested["file_size"], ingested["content_hash"])
 
-    # Save filename to DB (initial record)
-    save_uploaded_file(unique_filename)
+async def _reuse_duplicate_upload(existing: dict, file_path: str, file_size: int) -> JSONResponse:
+    """
+    Discards a freshly written upload in favour of the stored file with the same content.
+    """
+    await run_in_threadpool(os.remove, file_path)
+    return JSONResponse(
+        content={
+            "message": "File already uploaded, reusing its analysis.",
+            "file_name": existing["file_path"],
+            "file_size_bytes": file_size,
+            "background_analysis": "reused",
+            "duplicate": True,
+            "status": existing.get("status")
+        },
+        status_code=200
+    )
+
+async def _register_upload(unique_filename: str, file_path: str, file_size: int, content_hash: str, analysis_result: dict = None) -> JSONResponse:
+    """
+    Records a fully written upload and queues its analysis, or links it to an
+    earlier upload with identical content.
+    analysis_result is a profile built while the file was uploaded; it is stored
+    right away and the background job skips profiling.
+    """
+    # Link re-uploads of the same content to the stored file instead of analyzing it again
+    existing = await find_file_by_hash_async(content_hash)
+    if existing:
+        if os.path.exists(os.path.join(UPLOAD_DIR, existing["file_path"])):
+            return await _reuse_duplicate_upload(existing, file_path, file_size)
+        # The stored copy is gone: let this upload take over its content hash
+        await release_content_hash_async(existing["file_path"])
+
+    # Drop any DataFrame parsed from a previous upload at the same path
+    invalidate_dataframe_cache(file_path)
+
+    # Save filename to DB (initial record). The unique content_hash index makes
+    # this the tie-breaker between identical uploads arriving at the same time.
+    try:
+        await save_uploaded_file_async(unique_filename, content_hash)
+    except DuplicateKeyError:
+        existing = await find_file_by_hash_async(content_hash)
+        if existing is None:
+            raise
+        return await _reuse_duplicate_upload(existing, file_path, file_size)
 
     # Determine response message based on size
     message = "File uploaded successfully"
     if file_size > LARGE_FILE_THRESHOLD:
         message = "File uploaded. Large file detected, analysis running in background."
 
-    # Add background task
-    background_tasks.add_task(process_file_background, unique_filename, file_path)
+    profile_ready = False
+    if analysis_result:
+        try:
+            await run_in_threadpool(
+                update_file_analysis, unique_filename, analysis_result, source_signature=get_source_signature(file_path)
+            )
+            profile_ready = True
+        except Exception as e:
+            print(f"Could not store the upload profile of {unique_filename}: {e}")
+
+    # Queue the analysis on the process pool
+    job_id = await submit_analysis_job_async(unique_filename, file_path, file_size, analysis_ready=profile_ready)
 
     return JSONResponse(
         content={
             "message": message,
             "file_name": unique_filename,
             "file_size_bytes": file_size,
-            "background_analysis": "started"
+            "background_analysis": "started",
+            "profile_ready": profile_ready,
+            "job_id": job_id
         },
         status_code=200
     )
+
+@router.post("/uploads")
+async def initiate_upload(body: dict):
+    """
+    Starts a resumable upload.
+    Expects {"filename", "total_size", optional "chunk_size" and "sha256" of the whole file}.
+    Returns the upload_id and the chunk size to PUT chunks with.
+    """
+    try:
+        session = new_upload_session(
+            body.get("filename", ""),
+            int(body.get("total_size", 0)),
+            int(body["chunk_size"]) if body.get("chunk_size") else None,
+            body.get("sha256")
+        )
+    except (TypeError, ValueError) as e:
+        return JSONResponse(content={"message": str(e)}, status_code=400)
+
+    # Clear out the staged chunks and session records of abandoned uploads
+    await run_in_threadpool(sweep_expired_uploads)
+    await delete_upload_sessions_created_before_async(session_expiry_cutoff())
+    await create_upload_session_async(session)
+    return JSONResponse(
+        content={
+            "upload_id": session["upload_id"],
+            "chunk_size": session["chunk_size"],
+            "chunk_count": session["chunk_count"]
+        },
+        status_code=200
+    )
+
+def _session_error(session):
+    """
+    Error response for an upload session that cannot receive chunks or be finalized, or None.
+    """
+    if not session:
+        return JSONResponse(content={"message": "Upload not found"}, status_code=404)
+    if session["status"] != "uploading":
+        return JSONResponse(content={"message": f"Upload is already {session['status']}"}, status_code=409)
+    if session_expired(session):
+        return JSONResponse(content={"message": "Upload has expired"}, status_code=409)
+    return None
+
+async def _get_open_session(upload_id: str):
+    """
+    The upload session if it can still receive chunks, else an error response.
+    """
+    session = await get_upload_session_async(upload_id)
+    error = _session_error(session)
+    return (None, error) if error else (session, None)
+
+@router.put("/uploads/{upload_id}/chunks/{index}")
+async def upload_chunk(upload_id: str, index: int, offset: int, request: Request):
+    """
+    Stores chunk `index` (raw request body) of a resumable upload.
+    `offset` is the chunk's byte offset in the file and the X-Chunk-SHA256 header
+    its SHA-256 hex digest; chunks may be sent in any order and re-sent.
+    Large uploads are profiled as chunks arrive in order (see chunked_upload_service).
+    """
+    session, error = await _get_open_session(upload_id)
+    if error:
+        return error
+
+    data = await request.body()
+    try:
+        await run_in_threadpool(write_chunk, session, index, offset, data, request.headers.get("X-Chunk-SHA256"))
+    except ValueError as e:
+        return JSONResponse(content={"message": str(e)}, status_code=400)
+    if profiles_upload(session):
+        await run_in_threadpool(advance_upload_profile, session, index)
+    return JSONResponse(content={"upload_id": upload_id, "index": index, "received": len(data)}, status_code=200)
+
+@router.get("/uploads/{upload_id}")
+async def get_upload(upload_id: str):
+    """
+    Received and missing chunks of a resumable upload, to resume after a dropped connection
+    """
+    session = await get_upload_session_async(upload_id)
+    if not session:
+        return JSONResponse(content={"message": "Upload not found"}, status_code=404)
+    return JSONResponse(content=await run_in_threadpool(upload_progress, session), status_code=200)
+
+@router.post("/uploads/{upload_id}/finalize")
+async def finalize_upload(upload_id: str):
+    """
+    Assembles the chunks of a resumable upload into the uploaded file and
+    starts its analysis, like a regular upload. The profile of a large upload built
+    while its chunks arrived is stored right away (profile_ready in the response).
+    """
+    session, error = await _get_open_session(upload_id)
+    if error:
+        return error
+    # Claim the session so concurrent finalize calls and chunk writes are turned away
+    session = await claim_upload_session_async(upload_id, "uploading", "finalizing")
+    if session is None:
+        error = _session_error(await get_upload_session_async(upload_id))
+        return error or JSONResponse(content={"message": "Upload is already finalizing"}, status_code=409)
+
+    file_path = os.path.join(UPLOAD_DIR, session["file_name"])
+    try:
+        ingested = await run_in_threadpool(assemble_upload, session, file_path)
+    except ValueError as e:
+        # Missing chunks or a checksum mismatch: the client may resend and finalize again
+        await update_upload_session_async(upload_id, {"status": "uploading"})
+        return JSONResponse(content={"message": str(e)}, status_code=400)
+    except Exception:
+        # The session cannot be resumed, so its chunks are of no further use
+        await update_upload_session_async(upload_id, {"status": "failed"})
+        await run_in_threadpool(discard_upload, upload_id)
+        raise
+
+    await update_upload_session_async(upload_id, {"status": "completed"})
+    return await _register_upload(
+        session["file_name"], file_path, ingested["file_size"], ingested["content_hash"], ingested["analysis"]
+    )
+
+@router.delete("/uploads/{upload_id}")
+async def cancel_upload(upload_id: str):
+    """
+    Cancels a resumable upload that is not being finalized and deletes its staged chunks.
+    """
+    session = await claim_upload_session_async(upload_id, "uploading", "cancelled")
+    if session is None:
+        session = await get_upload_session_async(upload_id)
+        if not session:
+            return JSONResponse(content={"message": "Upload not found"}, status_code=404)
+        return JSONResponse(content={"message": f"Upload is already {session['status']}"}, status_code=409)
+
+    await run_in_threadpool(discard_upload, upload_id)
+    return JSONResponse(content={"upload_id": upload_id, "status": "cancelled"}, status_code=200)
+
 @router.get("/get-files")
-def get_files(filename: str = None):
+def get_files(filename: str = None, include_analysis: bool = False, limit: int = FILES_PAGE_SIZE, cursor: str = None):
+    """
+    Fetch uploaded files, one page at a time.
+    Pass the returned next_cursor as `cursor` to get the next page (null on the last page).
+    Analysis results are only included with include_analysis=true.
+    """
+    try:
+        files = prefetch_documents(get_uploaded_files(filename, include_analysis=include_analysis, limit=limit, cursor=cursor))
+    except ValueError as e:
+        return JSONResponse(content={"message": str(e)}, status_code=400)
+    except Exception as e:
+        return JSONResponse(content={"message": f"Could not fetch files: {e}"}, status_code=500)
+    return StreamingResponse(stream_files_listing(files, limit, include_analysis), media_type="application/json")
+
+@router.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    """
+    Get status and timings of a background analysis job
+    """
+    job = get_analysis_job(job_id)
+    if not job:
+        return JSONResponse(content={"message": "Job not found"}, status_code=404)
+    return JSONResponse(content=job, status_code=200)
+
+@router.get("/jobs")
+def get_jobs_queue():
     """
-    Fetch all uploaded files
+    Get queue depth and in-flight work of the analysis job executor
     """
-    files = get_uploaded_files(filename)
-    return JSONResponse(content={"files": files}, status_code=200)
+    return JSONResponse(content=get_queue_stats(), status_code=200)
+
+@router.get("/status/{filename}")
+def get_status(filename: str):
+    """
+    Lightweight processing status of an uploaded file: record status and the
+    phase, rows processed and ETA of its analysis job, without the analysis payload
+    """
+    status = get_file_status(filename)
+    if status is None:
+        return JSONResponse(content={"message": "File not found"}, status_code=404)
+    return JSONResponse(content=status, status_code=200)
+
+def _is_terminal(status: dict) -> bool:
+    job = status.get("job")
+    if job:
+        return job.get("status") in TERMINAL_STATUSES
+    return status.get("status") in TERMINAL_STATUSES
+
+def _sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@router.get("/status/{filename}/events")
+async def stream_status(filename: str, request: Request):
+    """
+    Server-sent events feed of a file's processing status.
+    Emits a "progress" event whenever the status changes and a final "done" event
+    once the analysis has completed or failed.
+    """
+    if await get_file_status_async(filename) is None:
+        return JSONResponse(content={"message": "File not found"}, status_code=404)
+
+    async def events():
+        last_sent = None
+        last_write = time.monotonic()
+        while not await request.is_disconnected():
+            status = await get_file_status_async(filename)
+            if status is None:
+                yield _sse_event("error", {"message": "File not found"})
+                return
+            if status != last_sent:
+                last_sent, last_write = status, time.monotonic()
+                if _is_terminal(status):
+                    yield _sse_event("done", status)
+                    return
+                yield _sse_event("progress", status)
+            elif time.monotonic() - last_write >= STATUS_EVENTS_HEARTBEAT_SECONDS:
+                last_write = time.monotonic()
+                yield ": keep-alive\n\n"
+            await asyncio.sleep(STATUS_EVENTS_POLL_SECONDS)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @router.get("/download-file/{filename}")
 def download_file(filename: str):
@@ -95,12 +369,22 @@ def download_file(filename: str):
 
 
 @router.get("/get-columns")
-def get_columns(filename: str):
+async def get_columns(filename: str):
     """
-    Get column names of the uploaded file
+    Get column names of the uploaded file, classified by the AI as water-quality
+    parameters with their ideal values.
+    The classification is stored on the file record, so it is only requested once
+    per header; the plain list of columns is returned if the AI is unavailable.
     """
-    columns = get_file_columns(filename)
+    columns = await run_in_threadpool(read_file_columns, filename)
     if not columns:
          return JSONResponse(content={"error": "File not found or unreadable"}, status_code=404)
-         
-    return JSONResponse(content={"columns": columns}, status_code=200)
+
+    classification = await run_in_threadpool(get_stored_column_classification, filename, columns)
+    if classification is None:
+        classification = await classify_columns_async(columns)
+        if classification is None:
+            return JSONResponse(content={"columns": columns}, status_code=200)
+        await run_in_threadpool(store_column_classification, filename, columns, classification)
+
+    return JSONResponse(content={"columns": classification}, status_code=200)
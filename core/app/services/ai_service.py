@@ -1,15 +1,36 @@
 
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import numpy as np
 import os
-import json
+import csv
+import gzip
+import codecs
+import zipfile
+import threading
+import asyncio
+from contextlib import contextmanager
+from collections import OrderedDict
 from sklearn.ensemble import IsolationForest
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.messages import HumanMessage
+from joblib import Parallel, delayed
 from dotenv import load_dotenv
+from app.config import DATAFRAME_CACHE_MAX_MB, STREAMING_PROFILE_THRESHOLD_MB, STREAMING_CHUNK_ROWS, SKETCH_SUMMARY_THRESHOLD_ROWS, OPTIMIZE_DTYPES_ON_LOAD, ARROW_STRINGS_ON_LOAD, ANOMALY_N_JOBS, ANOMALY_MAX_PARALLEL_SCANS, ANOMALY_MIN_GROUP_ROWS, ANOMALY_SAMPLED_THRESHOLD_ROWS, ANOMALY_SAMPLE_ROWS, ANOMALY_SCORE_CHUNK_ROWS
+from app.services.prompt_service import compact_profile
+from app.services.llm_service import LLM_MODEL, parse_llm_json, aquery_llm_json, astream_llm
+from app.services.json_stream import new_json_stream_state, feed_json_stream
+from app.services.llm_cache_service import llm_cache_key, get_cached_llm_result, set_cached_llm_result
+from app.services import sketches
+from app.services.profiling_service import new_profile_state, update_profile_state, finalize_profile_state, profile_dataframe, json_safe_value, json_safe_records, head_records
 
 load_dotenv()
 
+# Process-wide LRU cache of parsed DataFrames, keyed by (path, mtime, size).
+# Entries are shared between requests, so callers must treat them as read-only.
+_dataframe_cache = OrderedDict()
+_dataframe_cache_lock = threading.Lock()
+_dataframe_cache_stats = {"hits": 0, "misses": 0, "evictions": 0, "size_bytes": 0}
+
 def extract_metadata(df: pd.DataFrame) -> dict:
     """
     Extracts metadata from the DataFrame, including column names and data types.
@@ -19,171 +40,813 @@ def extract_metadata(df: pd.DataFrame) -> dict:
         metadata[col] = str(df[col].dtype)
     return metadata
 
+SAMPLE_SCAN_ROWS = 1000
+SAMPLE_SIZE = 5
+
+def _column_samples(df: pd.DataFrame) -> dict:
+    """
+    First 5 distinct non-null values of every column within the first SAMPLE_SCAN_ROWS rows,
+    in order of appearance. Columns with fewer distinct values there are topped up by
+    generate_statistical_summary() from the values its block pass has already gathered.
+    """
+    head = df.head(SAMPLE_SCAN_ROWS)
+    samples = {}
+    for position, col in enumerate(df.columns):
+        values = head.iloc[:, position].dropna().unique()[:SAMPLE_SIZE]
+        samples[col] = [json_safe_value(v) for v in values.tolist()]
+    return samples
+
+def _top_up_samples(samples: list, values):
+    """
+    Appends values not yet in `samples` until it holds SAMPLE_SIZE of them.
+    """
+    for value in values:
+        if len(samples) >= SAMPLE_SIZE:
+            break
+        value = json_safe_value(value)
+        if value not in samples:
+            samples.append(value)
+
+NUMERIC_BLOCK_COLUMNS = 64
+
+def _numeric_blocks(df: pd.DataFrame, numeric_cols: list):
+    """
+    Yields (columns, 2-D array) batches of numeric columns that share a dtype,
+    one row per column, so each batch can be sorted with a single call.
+    Nullable extension dtypes are converted to float64 with NaN for missing values.
+    """
+    groups = {}
+    for col in numeric_cols:
+        dtype = df[col].dtype
+        key = dtype if isinstance(dtype, np.dtype) else np.dtype("float64")
+        groups.setdefault(key, []).append(col)
+
+    for dtype, cols in groups.items():
+        for start in range(0, len(cols), NUMERIC_BLOCK_COLUMNS):
+            batch = cols[start:start + NUMERIC_BLOCK_COLUMNS]
+            if dtype.kind == "f":
+                block = df[batch].to_numpy(dtype=dtype, na_value=np.nan)
+            else:
+                block = df[batch].to_numpy(dtype=dtype)
+            yield batch, block.T
+
+def _sorted_block_stats(block: np.ndarray) -> dict:
+    """
+    Sorts every row of the block once and derives count, min, max, quartiles (linear
+    interpolation, as pandas/numpy) and distinct counts. NaNs sort to the end of each row.
+    """
+    sorted_block = np.sort(block, axis=1)
+    rows, width = sorted_block.shape
+    if sorted_block.dtype.kind == "f":
+        count = (~np.isnan(sorted_block)).sum(axis=1)
+    else:
+        count = np.full(rows, width)
+
+    stats = {"count": count, "sorted": sorted_block}
+    row_index = np.arange(rows)
+    last = np.maximum(count - 1, 0)
+    if width == 0:
+        stats["unique"] = np.zeros(rows, dtype=int)
+        return stats
+
+    # Distinct values: number of changes between neighbours within the non-null prefix
+    changes = np.diff(sorted_block, axis=1) != 0
+    within = np.arange(width - 1)[None, :] < last[:, None]
+    stats["unique"] = np.where(count > 0, (changes & within).sum(axis=1) + 1, 0)
+
+    stats["min"] = sorted_block[:, 0].astype(np.float64)
+    stats["max"] = sorted_block[row_index, last].astype(np.float64)
+    for q, label in ((0.25, "25%"), (0.5, "50%"), (0.75, "75%")):
+        position = q * last
+        lower = np.floor(position).astype(int)
+        upper = np.ceil(position).astype(int)
+        t = position - lower
+        low_values = sorted_block[row_index, lower].astype(np.float64)
+        high_values = sorted_block[row_index, upper].astype(np.float64)
+        diff = high_values - low_values
+        # Same two-sided lerp numpy uses, so results match describe() bit for bit
+        stats[label] = np.where(t >= 0.5, high_values - diff * (1 - t), low_values + diff * t)
+    return stats
+
 def generate_statistical_summary(df: pd.DataFrame) -> dict:
     """
     Generates a statistical summary for each column in the DataFrame.
     Includes count, mean, std, min, 25%, 50%, 75%, max for numeric columns.
     Includes count, unique, top, freq for object columns.
     Also calculates missing values and unique value counts for all columns.
+    Stats are computed once per dtype block (numeric, datetime, categorical) rather
+    than column by column; the output matches describe(include='all').
     """
-    summary = {}
-    
-    # improved description that handles both numeric and object types
-    desc = df.describe(include='all').to_dict()
-    
+    summary = {col: {} for col in df.columns}
+    if df.shape[1] == 0:
+        return summary
+
+    missing = df.isna().sum()
+    counts = len(df) - missing
+
+    numeric_cols = [col for col in df.columns if pd.api.types.is_numeric_dtype(df[col]) and not pd.api.types.is_bool_dtype(df[col])]
+    datetime_cols = [col for col in df.columns if pd.api.types.is_datetime64_any_dtype(df[col])]
+    range_cols = set(numeric_cols) | set(datetime_cols)
+    categorical_cols = [col for col in df.columns if col not in range_cols]
+
+    unique = {col: int(df[col].nunique()) for col in datetime_cols}
+
+    # Samples come from the first rows; columns with too few distinct values there are
+    # topped up below from each block's sorted values or value counts. Datetime columns
+    # have no such pass and keep what the first rows hold.
+    samples = _column_samples(df)
+    top_up = len(df) > SAMPLE_SCAN_ROWS
+
+    # Numeric block: one sort per batch of same-dtype columns yields extremes,
+    # quartiles and distinct counts; moments come from one vectorized reduction
+    if numeric_cols:
+        means = df[numeric_cols].mean()
+        stds = df[numeric_cols].std()
+        for cols, block in _numeric_blocks(df, numeric_cols):
+            block_stats = _sorted_block_stats(block)
+            for i, col in enumerate(cols):
+                col_summary = summary[col]
+                col_summary["count"] = float(counts[col])
+                unique[col] = int(block_stats["unique"][i])
+                if not block_stats["count"][i]:
+                    continue
+                if top_up and len(samples[col]) < SAMPLE_SIZE:
+                    values = block_stats["sorted"][i, :block_stats["count"][i]]
+                    _top_up_samples(samples[col], values[np.r_[True, values[1:] != values[:-1]]])
+                col_summary["mean"] = float(means[col])
+                if pd.notna(stds[col]):
+                    col_summary["std"] = float(stds[col])
+                for label in ("min", "25%", "50%", "75%", "max"):
+                    col_summary[label] = float(block_stats[label][i])
+
+    # Datetime block: describe() reports mean/min/quartiles/max but no std
+    if datetime_cols:
+        datetime_df = df[datetime_cols]
+        means, mins, maxs = datetime_df.mean(), datetime_df.min(), datetime_df.max()
+        quartiles = datetime_df.quantile([0.25, 0.5, 0.75])
+        for col in datetime_cols:
+            col_summary = summary[col]
+            col_summary["count"] = int(counts[col])
+            for label, value in (
+                ("mean", means[col]), ("min", mins[col]),
+                ("25%", quartiles.at[0.25, col]), ("50%", quartiles.at[0.5, col]),
+                ("75%", quartiles.at[0.75, col]), ("max", maxs[col])
+            ):
+                if pd.notna(value):
+                    col_summary[label] = json_safe_value(value)
+
+    # Categorical block: a single value_counts per column yields unique, top and freq
+    for col in categorical_cols:
+        col_summary = summary[col]
+        value_counts = df[col].value_counts(dropna=True)
+        # Categoricals also list categories that do not occur in this frame
+        value_counts = value_counts[value_counts > 0]
+        col_summary["count"] = int(counts[col])
+        col_summary["unique"] = int(len(value_counts))
+        if len(value_counts):
+            col_summary["top"] = json_safe_value(value_counts.index[0])
+            col_summary["freq"] = int(value_counts.iloc[0])
+        unique[col] = len(value_counts)
+        if top_up and len(samples[col]) < SAMPLE_SIZE:
+            _top_up_samples(samples[col], value_counts.index[:2 * SAMPLE_SIZE])
+
     for col in df.columns:
-        col_summary = {}
-        
-        # Add basic stats from describe()
-        # Filter out NaN values from the description
-        if col in desc:
-            for k, v in desc[col].items():
-                if pd.notna(v):
-                    col_summary[k] = v
-        
-        # Add additional stats
-        col_summary['missing_values'] = int(df[col].isnull().sum())
-        col_summary['unique_values'] = int(df[col].nunique())
-        
-        # Add sample values (top 5 unique)
-        try:
-            col_summary['samples'] = df[col].dropna().unique()[:5].tolist()
-        except Exception:
-             col_summary['samples'] = []
+        summary[col]["missing_values"] = int(missing[col])
+        summary[col]["unique_values"] = int(unique[col])
+        summary[col]["samples"] = samples[col]
 
-        summary[col] = col_summary
-        
     return summary
 
-def load_dataframe(file_path: str) -> pd.DataFrame:
+def get_columnar_sidecar_path(file_path: str) -> str:
     """
-    Loads a file into a Pandas DataFrame. Supports CSV, Excel, and JSON.
+    Returns the path of the Parquet sidecar written next to an uploaded file.
+    """
+    directory, filename = os.path.split(file_path)
+    return os.path.join(directory, ".columnar", f"{filename}.parquet")
+
+def is_streaming_size(file_path: str) -> bool:
+    """
+    Whether a file is above STREAMING_PROFILE_THRESHOLD_MB, i.e. too large to load whole.
+    """
+    return os.path.getsize(file_path) > STREAMING_PROFILE_THRESHOLD_MB * 1024 * 1024
+
+def _has_fresh_sidecar(file_path: str) -> bool:
+    """
+    A sidecar is only trusted if it was written after the source file was last modified.
+    """
+    sidecar_path = get_columnar_sidecar_path(file_path)
+    return (
+        os.path.exists(sidecar_path)
+        and os.path.getmtime(sidecar_path) >= os.path.getmtime(file_path)
+    )
+
+def write_columnar_sidecar(file_path: str, df: pd.DataFrame) -> str:
+    """
+    Writes the parsed DataFrame as a Parquet sidecar so later loads skip text parsing
+    and can read only the columns they need. Returns the sidecar path, or None if
+    the frame could not be converted (e.g. mixed-type object columns).
+    """
+    sidecar_path = get_columnar_sidecar_path(file_path)
+    tmp_path = f"{sidecar_path}.tmp"
+    try:
+        os.makedirs(os.path.dirname(sidecar_path), exist_ok=True)
+        df.to_parquet(tmp_path, index=False)
+        # Atomic rename so readers never see a partially written sidecar
+        os.replace(tmp_path, sidecar_path)
+        return sidecar_path
+    except Exception as e:
+        print(f"Could not write columnar sidecar for {file_path}: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
+
+def write_columnar_sidecar_chunked(file_path: str, dtypes: dict) -> str:
+    """
+    Streams the source file into a Parquet sidecar chunk by chunk, forcing the dtypes
+    inferred by the streaming profiler so every chunk shares one schema.
+    Used for files too large to load whole. Returns the sidecar path, or None on failure.
     """
+    sidecar_path = get_columnar_sidecar_path(file_path)
+    tmp_path = f"{sidecar_path}.tmp"
+    writer = None
     try:
+        os.makedirs(os.path.dirname(sidecar_path), exist_ok=True)
+        for chunk in iter_dataframe_chunks(file_path, dtype=dtypes):
+            if writer is None:
+                schema = pa.Schema.from_pandas(chunk, preserve_index=False)
+                writer = pq.ParquetWriter(tmp_path, schema)
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+        if writer is None:
+            return None
+        writer.close()
+        os.replace(tmp_path, sidecar_path)
+        return sidecar_path
+    except Exception as e:
+        print(f"Could not write columnar sidecar for {file_path}: {e}")
+        if writer is not None:
+            writer.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
+
+def _load_sidecar(file_path: str, columns: list = None) -> pd.DataFrame:
+    """
+    Reads the Parquet sidecar, pruned to the requested columns that exist in it.
+    Unknown columns are left out so callers can report them with their own validation.
+    """
+    sidecar_path = get_columnar_sidecar_path(file_path)
+    if columns is not None:
+        available = set(pq.read_schema(sidecar_path).names)
+        columns = [col for col in columns if col in available]
+    return pd.read_parquet(sidecar_path, columns=columns)
+
+# Object columns with at most this share of distinct values become categoricals
+CATEGORY_MAX_UNIQUE_RATIO = 0.5
+DATETIME_SNIFF_ROWS = 1000
+
+def _parse_datetime_column(series: pd.Series):
+    """
+    Returns the column parsed as datetime64 if every non-null value is a timestamp, else None.
+    A small sample is tried first so free-text columns are rejected cheaply.
+    """
+    non_null = series.dropna()
+    if non_null.empty or not isinstance(non_null.iloc[0], str):
+        return None
+    try:
+        pd.to_datetime(non_null.head(DATETIME_SNIFF_ROWS), format="mixed")
+    except (ValueError, TypeError, OverflowError):
+        return None
+    parsed = pd.to_datetime(series, errors="coerce", format="mixed")
+    # Values that failed to parse became NaT, so the column is not purely timestamps
+    if parsed.isna().sum() != series.isna().sum():
+        return None
+    return parsed
+
+def optimize_dataframe_dtypes(df: pd.DataFrame, arrow_strings: bool = ARROW_STRINGS_ON_LOAD) -> pd.DataFrame:
+    """
+    Returns a copy of the DataFrame with memory-efficient dtypes:
+    integers are downcast, floats become float32 when that is lossless, timestamp-like strings are parsed to datetime64,
+    low-cardinality strings (e.g. DeviceID, Status) become categoricals and, with
+    arrow_strings, the remaining strings use the Arrow-backed string dtype.
+    Before/after sizes and the conversions made are stored in df.attrs["memory_optimization"].
+    """
+    before_bytes = int(df.memory_usage(deep=True).sum())
+    optimized = df.copy()
+    conversions = {}
+
+    for col in optimized.columns:
+        series = optimized[col]
+        original_dtype = str(series.dtype)
+
+        if pd.api.types.is_bool_dtype(series):
+            continue
+        if pd.api.types.is_integer_dtype(series):
+            downcast = "unsigned" if len(series) and series.min() >= 0 else "integer"
+            optimized[col] = pd.to_numeric(series, downcast=downcast)
+        elif pd.api.types.is_float_dtype(series) and series.dtype == np.float64:
+            # Only downcast to float32 when no value changes, so summaries stay exact
+            values = series.to_numpy()
+            if np.array_equal(values.astype(np.float32).astype(np.float64), values, equal_nan=True):
+                optimized[col] = series.astype(np.float32)
+        elif series.dtype == object:
+            parsed = _parse_datetime_column(series)
+            non_null = series.count()
+            if parsed is not None:
+                optimized[col] = parsed
+            elif non_null and series.nunique() / non_null <= CATEGORY_MAX_UNIQUE_RATIO:
+                optimized[col] = series.astype("category")
+            elif arrow_strings and series.dropna().map(type).eq(str).all():
+                optimized[col] = series.astype("string[pyarrow]")
+
+        if str(optimized[col].dtype) != original_dtype:
+            conversions[col] = f"{original_dtype} -> {optimized[col].dtype}"
+
+    after_bytes = int(optimized.memory_usage(deep=True).sum())
+    optimized.attrs["memory_optimization"] = {
+        "before_mb": round(before_bytes / (1024 * 1024), 2),
+        "after_mb": round(after_bytes / (1024 * 1024), 2),
+        "conversions": conversions
+    }
+    return optimized
+
+def load_dataframe(file_path: str, columns: list = None, optimize: bool = False) -> pd.DataFrame:
+    """
+    Loads a file into a Pandas DataFrame. Supports CSV, Excel, and JSON.
+    Prefers the columnar sidecar when one is fresh; `columns` limits the load to
+    the given columns where present. optimize=True applies optimize_dataframe_dtypes().
+    """
+    df = None
+    if _has_fresh_sidecar(file_path):
         try:
-            df = pd.read_csv(file_path)
-            # Basic validation to ensure it's a valid CSV (has columns)
-            if df.empty and len(df.columns) == 0:
-                 raise ValueError("Empty CSV")
-            return df
-        except Exception:
-            try:
-                return pd.read_excel(file_path)
-            except Exception:
-                try:
-                    return pd.read_json(file_path)
-                except Exception:
-                    raise ValueError("Unsupported file format or unable to read file")
+            df = _load_sidecar(file_path, columns)
+        except Exception as e:
+            print(f"Error reading columnar sidecar, falling back to source file: {e}")
+
+    if df is None:
+        df = _load_source_file(file_path, columns)
+        if columns is not None:
+            df = df[[col for col in columns if col in df.columns]]
+
+    if optimize:
+        df = optimize_dataframe_dtypes(df)
+    return df
+
+# Extension hints used when the content itself is not conclusive
+CSV_EXTENSIONS = {".csv", ".tsv", ".txt"}
+EXCEL_EXTENSIONS = {".xlsx", ".xlsm", ".xls"}
+JSON_EXTENSIONS = {".json", ".jsonl", ".ndjson"}
+SNIFF_BYTES = 64 * 1024
+
+def _read_head(file_path: str, compression: str) -> tuple:
+    """
+    Returns (head_bytes, inner_name) for the first SNIFF_BYTES of the (decompressed) file.
+    inner_name is the archived member name for zip files, otherwise None.
+    """
+    if compression == "gzip":
+        with gzip.open(file_path, "rb") as f:
+            return f.read(SNIFF_BYTES), None
+    if compression == "zip":
+        with zipfile.ZipFile(file_path) as archive:
+            members = [m for m in archive.namelist() if not m.endswith("/")]
+            if len(members) != 1:
+                raise ValueError("Zip archives must contain exactly one data file")
+            with archive.open(members[0]) as f:
+                return f.read(SNIFF_BYTES), members[0]
+    with open(file_path, "rb") as f:
+        return f.read(SNIFF_BYTES), None
+
+def _sniff_encoding(head: bytes) -> str:
+    """
+    Picks a text encoding from the BOM, falling back to latin-1 when the head is not valid UTF-8.
+    """
+    if head.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if head.startswith(codecs.BOM_UTF16_LE) or head.startswith(codecs.BOM_UTF16_BE):
+        return "utf-16"
+    try:
+        head.decode("utf-8")
+    except UnicodeDecodeError as e:
+        # A multi-byte character cut off at the end of the sniffed block is still UTF-8
+        if e.start < len(head) - 3:
+            return "latin-1"
+    return "utf-8"
+
+def _sniff_delimiter(text: str) -> str:
+    """
+    Detects the CSV delimiter from the first few lines of the file.
+    """
+    sample = "\n".join(text.splitlines()[:20])
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=",;\t|").delimiter
+    except csv.Error:
+        return ","
+
+def detect_file_format(file_path: str) -> dict:
+    """
+    Detects how a file should be read without attempting a full parse.
+    Uses magic bytes first (gzip, zip/xlsx, legacy xls, parquet), then the file
+    extension, then a sniff of the first bytes for JSON vs delimited text.
+    Returns a dict with 'format' and the reader options ('compression', 'encoding',
+    'delimiter', 'lines') that apply to it.
+    """
+    with open(file_path, "rb") as f:
+        magic = f.read(8)
+
+    extension = os.path.splitext(file_path)[1].lower()
+    detected = {"format": None, "compression": None}
+
+    if magic.startswith(b"PAR1"):
+        detected["format"] = "parquet"
+        return detected
+    if magic.startswith(b"\xd0\xcf\x11\xe0"):
+        detected["format"] = "excel"
+        return detected
+    if magic.startswith(b"PK\x03\x04"):
+        with zipfile.ZipFile(file_path) as archive:
+            names = archive.namelist()
+        if "[Content_Types].xml" in names and any(name.startswith("xl/") for name in names):
+            detected["format"] = "excel"
+            return detected
+        detected["compression"] = "zip"
+    elif magic.startswith(b"\x1f\x8b"):
+        detected["compression"] = "gzip"
+
+    head, inner_name = _read_head(file_path, detected["compression"])
+    if inner_name:
+        extension = os.path.splitext(inner_name)[1].lower()
+    elif detected["compression"] == "gzip" and extension == ".gz":
+        extension = os.path.splitext(file_path[:-3])[1].lower()
+
+    if extension in EXCEL_EXTENSIONS and not detected["compression"]:
+        raise ValueError("File has an Excel extension but is not a valid Excel workbook")
+
+    encoding = _sniff_encoding(head)
+    text = head.decode(encoding, errors="ignore").lstrip()
+    detected["encoding"] = encoding
+
+    if extension in JSON_EXTENSIONS or (extension not in CSV_EXTENSIONS and text[:1] in ("{", "[")):
+        detected["format"] = "json"
+        # JSON Lines: one object per line rather than a single document
+        lines = [line.strip() for line in text.splitlines() if line.strip()]
+        detected["lines"] = extension in (".jsonl", ".ndjson") or (
+            len(lines) > 1 and lines[0].startswith("{") and lines[0].endswith("}")
+        )
+        return detected
+
+    if not text:
+        raise ValueError("File is empty")
+
+    detected["format"] = "csv"
+    detected["delimiter"] = "\t" if extension == ".tsv" else _sniff_delimiter(text)
+    return detected
+
+def _load_source_file(file_path: str, columns: list = None) -> pd.DataFrame:
+    """
+    Parses the uploaded source file itself with the reader chosen by detect_file_format().
+    Reader errors are reported as ValueError with the detected format.
+    """
+    file_format = detect_file_format(file_path)
+    reader = file_format["format"]
+
+    try:
+        if reader == "csv":
+            options = {
+                "sep": file_format["delimiter"],
+                "encoding": file_format["encoding"],
+                "compression": file_format["compression"],
+            }
+            if columns is not None:
+                # Only parse the requested columns that exist in the header
+                header = pd.read_csv(file_path, nrows=0, **options).columns
+                options["usecols"] = [col for col in columns if col in header]
+            return pd.read_csv(file_path, **options)
+        if reader == "excel":
+            return pd.read_excel(file_path)
+        if reader == "json":
+            return pd.read_json(
+                file_path,
+                lines=file_format["lines"],
+                encoding=file_format["encoding"],
+                compression=file_format["compression"],
+            )
+        if reader == "parquet":
+            return pd.read_parquet(file_path, columns=columns)
     except Exception as e:
-        raise e
+        raise ValueError(f"Unable to read file as {reader.upper()}: {e}") from e
+
+    raise ValueError("Unsupported file format or unable to read file")
+
+def iter_dataframe_chunks(file_path: str, chunk_rows: int = STREAMING_CHUNK_ROWS, dtype: dict = None, progress=None):
+    """
+    Yields the file as DataFrames of at most `chunk_rows` rows without loading it whole.
+    Reads the columnar sidecar when fresh, otherwise delimited text, JSON Lines or Parquet
+    in chunks. Formats that cannot be streamed (Excel, JSON documents) are yielded in one piece.
+    `progress`, if given, is called after each chunk with the fraction of the file consumed.
+    """
+    report = progress or (lambda fraction: None)
+
+    if _has_fresh_sidecar(file_path):
+        yield from _iter_parquet_chunks(get_columnar_sidecar_path(file_path), chunk_rows, report)
+        return
+
+    file_format = detect_file_format(file_path)
+    reader = file_format["format"]
+    total_bytes = max(os.path.getsize(file_path), 1)
+
+    if reader == "csv":
+        # Read through our own handle so its position tells how far parsing has got
+        with open(file_path, "rb") as handle, pd.read_csv(
+            handle,
+            sep=file_format["delimiter"],
+            encoding=file_format["encoding"],
+            compression=file_format["compression"],
+            chunksize=chunk_rows,
+            dtype=dtype
+        ) as chunks:
+            for chunk in chunks:
+                yield chunk
+                report(min(handle.tell() / total_bytes, 1.0))
+    elif reader == "json" and file_format["lines"]:
+        with open(file_path, "rb") as handle, pd.read_json(
+            handle,
+            lines=True,
+            encoding=file_format["encoding"],
+            compression=file_format["compression"],
+            chunksize=chunk_rows
+        ) as chunks:
+            for chunk in chunks:
+                yield chunk
+                report(min(handle.tell() / total_bytes, 1.0))
+    elif reader == "parquet":
+        yield from _iter_parquet_chunks(file_path, chunk_rows, report)
+    else:
+        yield _load_source_file(file_path)
+        report(1.0)
+
+def _iter_parquet_chunks(parquet_path: str, chunk_rows: int, report):
+    """
+    Yields a Parquet file as DataFrames of at most `chunk_rows` rows.
+    """
+    parquet_file = pq.ParquetFile(parquet_path)
+    total_rows = max(parquet_file.metadata.num_rows, 1)
+    rows_read = 0
+    for batch in parquet_file.iter_batches(batch_size=chunk_rows):
+        rows_read += batch.num_rows
+        yield batch.to_pandas()
+        report(rows_read / total_rows)
+
+def _dataframe_cache_key(file_path: str, columns: list = None, optimize: bool = False) -> tuple:
+    """
+    Builds the cache key for a file from its absolute path, mtime, size, the
+    requested column subset and load mode, so a file that changes on disk never
+    serves a stale DataFrame.
+    """
+    stat = os.stat(file_path)
+    return (
+        os.path.abspath(file_path),
+        stat.st_mtime_ns,
+        stat.st_size,
+        bool(optimize),
+        tuple(columns) if columns is not None else None
+    )
+
+def get_cached_dataframe(file_path: str, columns: list = None, optimize: bool = None) -> pd.DataFrame:
+    """
+    Returns the parsed DataFrame for a file, loading it at most once per process.
+    When `columns` is given, a cached full frame is reused if present, otherwise only
+    those columns are loaded (and cached separately).
+    optimize defaults to OPTIMIZE_DTYPES_ON_LOAD (see optimize_dataframe_dtypes()).
+    Entries are evicted least-recently-used first once the cache exceeds
+    DATAFRAME_CACHE_MAX_MB. The returned DataFrame is shared and must not be mutated.
+    """
+    if optimize is None:
+        optimize = OPTIMIZE_DTYPES_ON_LOAD
+    key = _dataframe_cache_key(file_path, columns, optimize)
+    full_key = key[:4] + (None,)
+
+    with _dataframe_cache_lock:
+        if key in _dataframe_cache:
+            _dataframe_cache.move_to_end(key)
+            _dataframe_cache_stats["hits"] += 1
+            return _dataframe_cache[key][0]
+        if columns is not None and full_key in _dataframe_cache:
+            _dataframe_cache.move_to_end(full_key)
+            _dataframe_cache_stats["hits"] += 1
+            full_df = _dataframe_cache[full_key][0]
+            return full_df[[col for col in columns if col in full_df.columns]]
+        _dataframe_cache_stats["misses"] += 1
+
+    df = load_dataframe(file_path, columns, optimize)
+    size_bytes = int(df.memory_usage(deep=True).sum())
+    budget_bytes = DATAFRAME_CACHE_MAX_MB * 1024 * 1024
+
+    # Frames larger than the whole budget are returned without being cached
+    if size_bytes > budget_bytes:
+        return df
+
+    with _dataframe_cache_lock:
+        # Drop any older versions of the same file before inserting the new one
+        for stale_key in [k for k in _dataframe_cache if k[0] == key[0] and k[1:3] != key[1:3]]:
+            _dataframe_cache_stats["size_bytes"] -= _dataframe_cache.pop(stale_key)[1]
+
+        if key not in _dataframe_cache:
+            _dataframe_cache[key] = (df, size_bytes)
+            _dataframe_cache_stats["size_bytes"] += size_bytes
+        _dataframe_cache.move_to_end(key)
+
+        while _dataframe_cache_stats["size_bytes"] > budget_bytes and len(_dataframe_cache) > 1:
+            _, (_, evicted_size) = _dataframe_cache.popitem(last=False)
+            _dataframe_cache_stats["size_bytes"] -= evicted_size
+            _dataframe_cache_stats["evictions"] += 1
+
+        return _dataframe_cache[key][0]
+
+def invalidate_dataframe_cache(file_path: str = None):
+    """
+    Drops cached DataFrames for a single file, or the whole cache when no path is given.
+    """
+    with _dataframe_cache_lock:
+        if file_path is None:
+            _dataframe_cache.clear()
+            _dataframe_cache_stats["size_bytes"] = 0
+            return
+
+        abs_path = os.path.abspath(file_path)
+        for key in [k for k in _dataframe_cache if k[0] == abs_path]:
+            _dataframe_cache_stats["size_bytes"] -= _dataframe_cache.pop(key)[1]
 
-def analyze_file(file_path: str) -> dict:
+def get_dataframe_cache_stats() -> dict:
+    """
+    Returns hit/miss/eviction counters and current memory usage of the DataFrame cache.
+    """
+    with _dataframe_cache_lock:
+        stats = dict(_dataframe_cache_stats)
+        stats["entries"] = len(_dataframe_cache)
+    stats["size_mb"] = round(stats["size_bytes"] / (1024 * 1024), 2)
+    stats["max_mb"] = DATAFRAME_CACHE_MAX_MB
+    return stats
+
+SUMMARY_MODES = ("auto", "exact", "sketch")
+
+def analyze_file(file_path: str, streaming: bool = None, summary_mode: str = "auto", optimize_dtypes: bool = None, progress_callback=None) -> dict:
     """
     Orchestrates the analysis of a file.
     Loads the file, extracts metadata, and generates a statistical summary.
+    Files larger than STREAMING_PROFILE_THRESHOLD_MB (or streaming=True) are profiled
+    in chunks with bounded memory instead of being loaded whole, so summary_mode "exact"
+    is rejected for them with a ValueError unless streaming=False is passed explicitly.
+    summary_mode selects the summary engine: "exact" (describe/nunique), "sketch"
+    (approximate quantiles, distinct counts and top values with error bounds), or
+    "auto" (exact up to SKETCH_SUMMARY_THRESHOLD_ROWS rows, sketches above).
+    optimize_dtypes (default OPTIMIZE_DTYPES_ON_LOAD) loads the file with memory-efficient
+    dtypes and reports the before/after sizes under "memory_optimization".
+    progress_callback(phase, rows_processed=None, fraction=None), if given, is called as
+    the analysis moves through its "parsing" and "profiling" phases.
     """
+    if summary_mode not in SUMMARY_MODES:
+        raise ValueError(f"Invalid summary_mode '{summary_mode}', expected one of {', '.join(SUMMARY_MODES)}")
+
     try:
-        df = load_dataframe(file_path)
+        if streaming is None:
+            streaming = is_streaming_size(file_path)
+            if streaming and summary_mode == "exact":
+                raise ValueError(
+                    f"summary_mode 'exact' loads the whole file, which is above the {STREAMING_PROFILE_THRESHOLD_MB} MB "
+                    f"streaming threshold; use 'sketch' or 'auto'."
+                )
+        if streaming:
+            return analyze_file_streaming(file_path, progress_callback=progress_callback)
 
-        metadata = extract_metadata(df)
-        summary = generate_statistical_summary(df)
+        if progress_callback:
+            progress_callback("parsing")
+        df = get_cached_dataframe(file_path, optimize=optimize_dtypes)
+        if progress_callback:
+            progress_callback("profiling", rows_processed=len(df))
+
+        if summary_mode == "auto":
+            summary_mode = "sketch" if len(df) > SKETCH_SUMMARY_THRESHOLD_ROWS else "exact"
 
+        metadata = extract_metadata(df)
         memory_usage_mb = float(df.memory_usage(deep=True).sum() / (1024 * 1024))
-        head_df = df.head(100).replace({np.nan: None})
-        head_rows = head_df.to_dict(orient="records")
+        head_rows = head_records(df)
 
-        return {
+        result = {
             "metadata": metadata,
-            "summary": summary,
             "memory_usage_mb": round(memory_usage_mb, 2),
-            "head_rows": head_rows
+            "head_rows": head_rows,
+            "row_count": len(df),
+            "profile_mode": "in_memory",
+            "summary_mode": summary_mode
         }
+        if "memory_optimization" in df.attrs:
+            result["memory_optimization"] = df.attrs["memory_optimization"]
+
+        if summary_mode == "sketch":
+            sketched = finalize_profile_state(profile_dataframe(df, STREAMING_CHUNK_ROWS))
+            result["summary"] = sketched["summary"]
+            result["summary_error_bounds"] = sketched["summary_error_bounds"]
+        else:
+            result["summary"] = generate_statistical_summary(df)
+
+        return result
 
     except Exception as e:
         print(f"Error analyzing file: {e}")
         raise e
 
-def _query_gemini_json(prompt_text: str):
+def analyze_file_streaming(file_path: str, chunk_rows: int = STREAMING_CHUNK_ROWS, progress_callback=None) -> dict:
     """
-    Helper function to query Gemini and parse JSON response.
+    Profiles a file chunk by chunk with mergeable accumulators (Welford moments,
+    min/max, null counts, quantile/distinct/top-k sketches), so peak memory is bounded
+    by the chunk size rather than the file size. Returns the same schema as analyze_file();
+    quantiles, distinct counts and top values are approximate.
     """
-    api_key = os.getenv("GOOGLE_API_KEY") or os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        print("GOOGLE_API_KEY or GEMINI_API_KEY not found in environment variables.")
-        return None
+    state = new_profile_state()
+    fraction = {"done": 0.0}
 
-    try:
-        llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash", google_api_key=api_key)
-        response = llm.invoke([HumanMessage(content=prompt_text)])
-        json_str = response.content.strip()
-        
-        # Clean up code blocks if present
-        if json_str.startswith("```json"):
-            json_str = json_str[7:-3]
-        elif json_str.startswith("```"):
-            json_str = json_str[3:-3]
-            
-        return json.loads(json_str)
-        
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        print(f"Error querying Gemini: {e}")
-        return None
+    def track(done):
+        fraction["done"] = done
+
+    for chunk in iter_dataframe_chunks(file_path, chunk_rows, progress=track):
+        update_profile_state(state, chunk)
+        if progress_callback:
+            progress_callback("profiling", rows_processed=state["rows"], fraction=fraction["done"])
+
+    result = finalize_profile_state(state)
+    result["profile_mode"] = "streaming"
+    result["summary_mode"] = "sketch"
+    return result
+
+# Prompt building blocks shared by the per-artifact prompts and the combined dashboard plan
+
+PROMPT_INTRO = "You are an expert data analyst. Analyze the following dataset metadata and statistical summary.\n"
 
-def generate_visualization_rules(analysis_result: dict) -> list:
+VISUALIZATION_RULES_TASK = (
+    "Suggest 3 to 5 insightful visualizations that would help a user understand this data.\n"
+    "For each visualization, provide a JSON object with the following keys:\n"
+    "- 'type': The type of chart (e.g., 'bar', 'line', 'scatter', 'pie', 'histogram').\n"
+    "- 'title': A descriptive title for the chart.\n"
+    "- 'x': The column name for the X-axis.\n"
+    "- 'y': The column name for the Y-axis (if applicable).\n"
+    "- 'description': A specific insight or analysis of the data based on the provided statistics (e.g., mention range, central tendency, or specific patterns observed), not just a generic description of the chart type.\n"
+)
+
+AI_INSIGHTS_TASK = (
+    "Generate a comprehensive analysis of this dataset for a dashboard.\n"
+    "Return ONLY a valid JSON object with the following keys:\n"
+    "- 'summary': A 2-3 sentence narrative describing what the dataset is about and its key characteristics. Be professional and insightful.\n"
+    "- 'trends': A list of strings, each describing a notable trend, correlation, or regular pattern you might infer from the stats (e.g., specific ranges, dominant categories). If strict correlations are impossible to know for sure, make reasonable inferences based on the distributions.\n"
+    "- 'data_quality': An object containing:\n"
+    "    - 'score': An integer from 0 to 100 representing the overall health of the data (penalize for missing values).\n"
+    "    - 'alerts': A list of strings describing data quality issues (e.g., '10% missing values in Column X').\n"
+    "- 'stat_highlights': A list of objects to be displayed as a summary table. Each object should have 'label' (e.g., 'Average Churn'), 'value' (e.g., '25%'), and 'insight' (e.g., 'High Risk'). Choose 3-4 most important metrics.\n"
+)
+
+AGGREGATION_RULES_TASK = (
+    "Suggest 3 to 5 meaningful Pandas aggregation queries that would reveal hidden patterns or insights.\n"
+    "For each suggestion, provide a JSON object with the following keys:\n"
+    "- 'title': A short, descriptive title.\n"
+    "- 'group_by': A list of column names to group by. Choose categorical or discrete columns (e.g., IDs, Status, Location, Date).\n"
+    "- 'aggregations': A dictionary where keys are column names (numeric) and values are aggregation functions ('mean', 'sum', 'count', 'min', 'max').\n"
+    "- 'description': A brief explanation of what this aggregation reveals.\n"
+    "Ensure strictly that valid columns are used. Do not group by unique IDs or continuous high-cardinality numeric variables unless they are likely categories (e.g. 'Month').\n"
+)
+
+def _profile_prompt_section(analysis_result: dict) -> str:
     """
-    Uses Google Gemini to generate visualization rules based on the analysis result.
-    Returns a list of recommended charts.
+    The dataset profile as embedded in the LLM prompts, compacted to LLM_PROMPT_TOKEN_BUDGET.
     """
-    metadata_str = json.dumps(analysis_result.get("metadata", {}), indent=2)
-    summary_str = json.dumps(analysis_result.get("summary", {}), indent=2)
-
-    prompt_text = (
-        f"You are an expert data analyst. Analyze the following dataset metadata and statistical summary.\n"
-        f"Metadata: {metadata_str}\n"
-        f"Summary: {summary_str}\n\n"
-        f"Suggest 3 to 5 insightful visualizations that would help a user understand this data.\n"
-        f"For each visualization, provide a JSON object with the following keys:\n"
-        f"- 'type': The type of chart (e.g., 'bar', 'line', 'scatter', 'pie', 'histogram').\n"
-        f"- 'title': A descriptive title for the chart.\n"
-        f"- 'x': The column name for the X-axis.\n"
-        f"- 'y': The column name for the Y-axis (if applicable).\n"
-        f"- 'description': A specific insight or analysis of the data based on the provided statistics (e.g., mention range, central tendency, or specific patterns observed), not just a generic description of the chart type.\n\n"
-        f"Return ONLY a valid JSON list of these objects. Do not include markdown formatting or explanations outside the JSON."
+    profile = compact_profile(analysis_result)
+    return (
+        f"Profile ({profile['columns_included']} of {profile['columns_total']} columns, "
+        f"one JSON object per column, most relevant first):\n{profile['text']}\n"
     )
 
-    result = _query_gemini_json(prompt_text)
-    return result if isinstance(result, list) else []
+def _visualization_rules_prompt(analysis_result: dict) -> str:
+    return (
+        PROMPT_INTRO
+        + _profile_prompt_section(analysis_result)
+        + VISUALIZATION_RULES_TASK
+        + "\nReturn ONLY a valid JSON list of these objects. Do not include markdown formatting or explanations outside the JSON."
+    )
 
-def generate_ai_insights(analysis_result: dict) -> dict:
-    """
-    Uses Google Gemini to generate a narrative summary, identify trends, 
-    and calculate a data quality score based on the analysis result.
-    """
-    metadata_str = json.dumps(analysis_result.get("metadata", {}), indent=2)
-    summary_str = json.dumps(analysis_result.get("summary", {}), indent=2)
-
-    prompt_text = (
-        f"You are an expert data analyst. Analyze the following dataset metadata and statistical summary.\n"
-        f"Metadata: {metadata_str}\n"
-        f"Summary: {summary_str}\n\n"
-        f"Generate a comprehensive analysis of this dataset for a dashboard.\n"
-        f"Return ONLY a valid JSON object with the following keys:\n"
-        f"- 'summary': A 2-3 sentence narrative describing what the dataset is about and its key characteristics. Be professional and insightful.\n"
-        f"- 'trends': A list of strings, each describing a notable trend, correlation, or regular pattern you might infer from the stats (e.g., specific ranges, dominant categories). If strict correlations are impossible to know for sure, make reasonable inferences based on the distributions.\n"
-        f"- 'data_quality': An object containing:\n"
-        f"    - 'score': An integer from 0 to 100 representing the overall health of the data (penalize for missing values).\n"
-        f"    - 'alerts': A list of strings describing data quality issues (e.g., '10% missing values in Column X').\n"
-        f"- 'stat_highlights': A list of objects to be displayed as a summary table. Each object should have 'label' (e.g., 'Average Churn'), 'value' (e.g., '25%'), and 'insight' (e.g., 'High Risk'). Choose 3-4 most important metrics.\n\n"
-        f"Return ONLY the JSON. No markdown."
+def _ai_insights_prompt(analysis_result: dict) -> str:
+    return (
+        PROMPT_INTRO
+        + _profile_prompt_section(analysis_result)
+        + AI_INSIGHTS_TASK
+        + "\nReturn ONLY the JSON. No markdown."
     )
 
-    result = _query_gemini_json(prompt_text)
-    
-    if result and isinstance(result, dict):
-        return result
-    
+def _aggregation_rules_prompt(analysis_result: dict) -> str:
+    return (
+        PROMPT_INTRO
+        + _profile_prompt_section(analysis_result)
+        + AGGREGATION_RULES_TASK
+        + "Return ONLY a valid JSON list of these objects. No markdown."
+    )
+
+def _fallback_insights() -> dict:
     return {
         "summary": "Unable to generate insights at this time.",
         "trends": [],
@@ -191,12 +854,145 @@ def generate_ai_insights(analysis_result: dict) -> dict:
         "stat_highlights": []
     }
 
-def detect_anomalies(df: pd.DataFrame) -> dict:
+async def generate_visualization_rules_async(analysis_result: dict) -> list:
+    """
+    Uses Google Gemini to generate visualization rules based on the analysis result.
+    Returns a list of recommended charts.
+    """
+    result = await aquery_llm_json(_visualization_rules_prompt(analysis_result), template="visualization_rules")
+    return result if isinstance(result, list) else []
+
+async def generate_ai_insights_async(analysis_result: dict) -> dict:
+    """
+    Uses Google Gemini to generate a narrative summary, identify trends,
+    and calculate a data quality score based on the analysis result.
+    """
+    result = await aquery_llm_json(_ai_insights_prompt(analysis_result), template="ai_insights")
+    return result if result and isinstance(result, dict) else _fallback_insights()
+
+async def stream_ai_insights_async(analysis_result: dict):
+    """
+    generate_ai_insights_async() as it is being written: yields {"event", "data"} dicts.
+    "chunk" events carry raw reply text, "item" and "field" events carry each element of
+    the top-level arrays (trends, stat_highlights) and each top-level field as soon as it
+    has been parsed, and a final "done" event carries the whole result (with "cached": True
+    when it came from the LLM result cache, in which case nothing else is sent).
+    On failure an "error" event is sent before "done" with the fallback insights.
+    """
+    prompt_text = _ai_insights_prompt(analysis_result)
+    key = llm_cache_key(LLM_MODEL, "ai_insights", prompt_text)
+    cached = get_cached_llm_result(key)
+    if isinstance(cached, dict):
+        yield {"event": "done", "data": {"insights": cached, "cached": True}}
+        return
+
+    state = new_json_stream_state()
+    try:
+        async for text in astream_llm(prompt_text, json_mode=True):
+            yield {"event": "chunk", "data": {"text": text}}
+            for event in feed_json_stream(state, text):
+                yield event
+        result = parse_llm_json(state["text"])
+    except Exception as e:
+        print(f"Error streaming Gemini insights: {e!r}")
+        yield {"event": "error", "data": {"message": "Error generating analysis"}}
+        result = None
+
+    if isinstance(result, dict) and result:
+        set_cached_llm_result(key, result)
+    else:
+        result = _fallback_insights()
+    yield {"event": "done", "data": {"insights": result, "cached": False}}
+
+ANOMALY_MODES = ("auto", "full", "sampled")
+ANOMALY_SKETCH_SEED = 0
+SCORE_QUANTILES = {"min": 0.0, "1%": 0.01, "5%": 0.05, "50%": 0.5, "max": 1.0}
+
+# Bounds the parallel anomaly scans of this process (see ANOMALY_MAX_PARALLEL_SCANS)
+_parallel_scan_slots = threading.BoundedSemaphore(ANOMALY_MAX_PARALLEL_SCANS)
+
+@contextmanager
+def _anomaly_scan_jobs(n_jobs: int):
+    """
+    The number of processes a scan may use: n_jobs while a parallel-scan slot is
+    free, otherwise 1 (the scan then runs in the calling thread).
+    """
+    if n_jobs == 1 or not _parallel_scan_slots.acquire(blocking=False):
+        yield 1
+        return
+    try:
+        yield n_jobs
+    finally:
+        _parallel_scan_slots.release()
+
+def parse_contamination(value):
+    """
+    Validates an IsolationForest contamination: "auto" or a fraction in (0, 0.5].
+    Numbers may be given as strings (query parameters). Raises ValueError otherwise.
+    """
+    if value is None or value == "auto":
+        return "auto"
+    try:
+        fraction = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"contamination must be 'auto' or a number, got {value!r}")
+    if not 0 < fraction <= 0.5:
+        raise ValueError("contamination must be in (0, 0.5]")
+    return fraction
+
+def _anomaly_sample_positions(df: pd.DataFrame, sample_rows: int, stratify_by: str = None) -> np.ndarray:
+    """
+    Row positions of a random sample of about sample_rows rows. With stratify_by,
+    every value of that column is sampled in proportion to its share of the rows.
+    """
+    if len(df) <= sample_rows:
+        return np.arange(len(df))
+    rng = np.random.default_rng(42)
+    if stratify_by is None:
+        return np.sort(rng.choice(len(df), sample_rows, replace=False))
+    fraction = sample_rows / len(df)
+    return np.sort(np.concatenate([
+        rng.choice(positions, max(1, int(round(len(positions) * fraction))), replace=False)
+        for positions in df.groupby(stratify_by, sort=False, observed=True).indices.values()
+    ]))
+
+def _score_anomaly_chunk(clf: IsolationForest, features: np.ndarray, threshold: float):
+    """
+    Scores one chunk of rows. Returns the positions (within the chunk) and scores of the
+    rows below the threshold, plus a quantile sketch of all the chunk's scores.
+    """
+    scores = clf.score_samples(features)
+    hits = np.where(scores < threshold)[0]
+    # A fixed seed, so repeated scans of the same data report the same score quantiles
+    sketch = sketches.kll_new(seed=ANOMALY_SKETCH_SEED)
+    sketches.kll_add(sketch, scores)
+    return hits, scores[hits], sketch
+
+def detect_anomalies(df: pd.DataFrame, mode: str = "auto", contamination="auto", threshold: float = None,
+                     stratify_by: str = None, sample_rows: int = ANOMALY_SAMPLE_ROWS,
+                     chunk_rows: int = ANOMALY_SCORE_CHUNK_ROWS, n_jobs: int = ANOMALY_N_JOBS) -> dict:
     """
     Detects anomalies in the DataFrame using Isolation Forest.
     Returns a dictionary with indices of anomalies and the anomalous data points.
     Only considers numeric columns for detection.
+
+    mode "full" fits and scores all rows in one go; "sampled" fits on a sample of
+    sample_rows rows (stratified by `stratify_by` if given) and scores every row in chunks
+    of chunk_rows rows across n_jobs processes, so scoring needs memory for one chunk per
+    process on top of the frame; "auto" picks "sampled" above ANOMALY_SAMPLED_THRESHOLD_ROWS
+    rows. Files too large to load whole are scanned with detect_file_anomalies() instead.
+    Rows whose score (IsolationForest.score_samples, lower is more anomalous) is below
+    `threshold` are anomalies. By default the threshold follows from `contamination`
+    ("auto" or the expected fraction of anomalies). The result also holds the score of
+    each anomaly ('scores'), the threshold used and approximate quantiles of all scores.
+    Raises ValueError for an unknown mode, invalid contamination or unknown stratify_by column.
     """
+    if mode not in ANOMALY_MODES:
+        raise ValueError(f"mode must be one of {', '.join(ANOMALY_MODES)}")
+    contamination = parse_contamination(contamination)
+    if stratify_by is not None and stratify_by not in df.columns:
+        raise ValueError(f"Column '{stratify_by}' not found to stratify the anomaly sample by.")
+
     # Select only numeric columns
     numeric_df = df.select_dtypes(include=[np.number])
     
@@ -205,36 +1001,56 @@ def detect_anomalies(df: pd.DataFrame) -> dict:
         
     # Handle missing values by filling with mean (simple imputation for this MVP)
     # IsolationForest does not support NaN values natively in older versions or some implementations
-    numeric_df_clean = numeric_df.fillna(numeric_df.mean())
-    
-    # If still empty (e.g. all NaNs), return empty
-    if numeric_df_clean.empty:
-         return {"anomalies": [], "count": 0, "message": "Not enough data for anomaly detection."}
+    means = numeric_df.mean()
+
+    if mode == "auto":
+        mode = "sampled" if len(df) > ANOMALY_SAMPLED_THRESHOLD_ROWS else "full"
 
     # Initialize Isolation Forest
     # contamination='auto' lets the algorithm determine the threshold
-    clf = IsolationForest(contamination='auto', random_state=42)
+    clf = IsolationForest(contamination=contamination, random_state=42)
     
     try:
-        # Fit and predict
-        # -1 indicates anomaly, 1 indicates normal
-        predictions = clf.fit_predict(numeric_df_clean)
+        if mode == "full":
+            features = numeric_df.fillna(means).to_numpy(dtype=np.float64)
+            clf.fit(features)
+            starts = [0]
+            chunks = [_score_anomaly_chunk(clf, features, clf.offset_ if threshold is None else threshold)]
+            fit_rows = len(features)
+        else:
+            sample = _anomaly_sample_positions(df, sample_rows, stratify_by)
+            clf.fit(numeric_df.iloc[sample].fillna(means).to_numpy(dtype=np.float64))
+            cutoff = clf.offset_ if threshold is None else threshold
+            starts = range(0, len(numeric_df), chunk_rows)
+            # Chunks are materialized only as they are dispatched to the workers
+            with _anomaly_scan_jobs(n_jobs) as jobs:
+                chunks = Parallel(n_jobs=jobs)(
+                    delayed(_score_anomaly_chunk)(clf, numeric_df.iloc[start:start + chunk_rows].fillna(means).to_numpy(dtype=np.float64), cutoff)
+                    for start in starts
+                )
+            fit_rows = len(sample)
         
-        # Get indices of anomalies
-        # predictions == -1 gives a boolean mask
-        anomaly_indices = np.where(predictions == -1)[0]
-        
-        # Convert to list of standard Python ints for JSON serialization
-        anomaly_indices_list = anomaly_indices.tolist()
+        # Get indices of anomalies (hits are positions within each chunk)
+        anomaly_indices = np.concatenate([start + hits for start, (hits, _, _) in zip(starts, chunks)])
+        anomaly_scores = np.concatenate([scores for _, scores, _ in chunks])
+        score_sketch = chunks[0][2]
+        for _, _, sketch in chunks[1:]:
+            score_sketch = sketches.kll_merge(score_sketch, sketch)
         
         # Get the actual data points that are anomalous
         # restricting to numeric columns for the response to highlight *why* it might be anomalous statistically
-        anomalies_data = df.iloc[anomaly_indices].to_dict(orient='records')
+        anomalies_data = json_safe_records(df.iloc[anomaly_indices])
         
         return {
             "anomalies": anomalies_data,
-            "indices": anomaly_indices_list,
-            "count": len(anomaly_indices_list),
+            "indices": anomaly_indices.tolist(),
+            "scores": anomaly_scores.tolist(),
+            "count": len(anomaly_indices),
+            "mode": mode,
+            "fit_rows": fit_rows,
+            "contamination": contamination,
+            "threshold": float(clf.offset_ if threshold is None else threshold),
+            "score_quantiles": dict(zip(SCORE_QUANTILES, sketches.kll_quantiles(score_sketch, list(SCORE_QUANTILES.values())))),
             "message": "Anomaly detection successful."
         }
         
@@ -242,7 +1058,164 @@ def detect_anomalies(df: pd.DataFrame) -> dict:
         print(f"Error in anomaly detection: {e}")
         return {"anomalies": [], "count": 0, "message": f"Error during anomaly detection: {str(e)}"}
 
-def generate_aggregation_rules(analysis_result: dict) -> list:
+def _numeric_features(chunk: pd.DataFrame, columns: list) -> pd.DataFrame:
+    """
+    The chunk's values of the numeric columns as floats. Values of a chunk that was
+    parsed as text (e.g. a stray string in a CSV chunk) that are not numbers become NaN.
+    """
+    return pd.DataFrame({
+        col: pd.to_numeric(chunk[col], errors="coerce") if col in chunk.columns else np.nan
+        for col in columns
+    }, index=chunk.index).astype(np.float64)
+
+def _score_anomaly_frame(clf: IsolationForest, chunk: pd.DataFrame, columns: list, means: pd.Series, threshold: float):
+    """
+    Scores one chunk read from a file. Returns _score_anomaly_chunk()'s result plus the
+    chunk's row count and the records of its anomalous rows.
+    """
+    hits, scores, sketch = _score_anomaly_chunk(clf, _numeric_features(chunk, columns).fillna(means).to_numpy(), threshold)
+    return len(chunk), hits, scores, sketch, json_safe_records(chunk.iloc[hits])
+
+def detect_file_anomalies(file_path: str, mode: str = "sampled", contamination="auto", threshold: float = None,
+                          sample_rows: int = ANOMALY_SAMPLE_ROWS, chunk_rows: int = ANOMALY_SCORE_CHUNK_ROWS,
+                          n_jobs: int = ANOMALY_N_JOBS) -> dict:
+    """
+    The sampled detect_anomalies() scan for files too large to load whole. The file is
+    read twice in chunks of chunk_rows rows (from the columnar sidecar when fresh): once
+    to draw a uniform sample of sample_rows rows and the column means, once to score
+    every row across n_jobs processes. Memory is bounded by the sample and one chunk per
+    process. The numeric columns are those of the first chunk.
+    Returns the detect_anomalies() keys.
+    Raises ValueError for a mode other than "auto" or "sampled", or invalid contamination.
+    """
+    if mode not in ("auto", "sampled"):
+        raise ValueError("Files scanned in chunks support mode 'auto' or 'sampled' only.")
+    contamination = parse_contamination(contamination)
+
+    try:
+        # Bottom-k sampling: every row gets a random key and the rows with the
+        # sample_rows smallest keys form a uniform sample of the whole file
+        rng = np.random.default_rng(42)
+        columns, sample, keys = None, None, np.empty(0)
+        sums, counts = None, None
+        for chunk in iter_dataframe_chunks(file_path, chunk_rows=chunk_rows):
+            if columns is None:
+                columns = list(chunk.select_dtypes(include=[np.number]).columns)
+                if not columns:
+                    return {"anomalies": [], "count": 0, "message": "No numeric columns found for anomaly detection."}
+                sample = np.empty((0, len(columns)))
+                sums, counts = pd.Series(0.0, index=columns), pd.Series(0, index=columns)
+            features = _numeric_features(chunk, columns)
+            sums += features.sum()
+            counts += features.count()
+            sample = np.concatenate([sample, features.to_numpy()])
+            keys = np.concatenate([keys, rng.random(len(features))])
+            if len(keys) > sample_rows:
+                keep = np.argpartition(keys, sample_rows)[:sample_rows]
+                sample, keys = sample[keep], keys[keep]
+        if columns is None:
+            return {"anomalies": [], "count": 0, "message": "No numeric columns found for anomaly detection."}
+
+        means = sums / counts.replace(0, np.nan)
+        clf = IsolationForest(contamination=contamination, random_state=42)
+        clf.fit(pd.DataFrame(sample, columns=columns).fillna(means).fillna(0.0).to_numpy())
+        cutoff = clf.offset_ if threshold is None else threshold
+
+        # Chunks are read only as they are dispatched to the workers
+        with _anomaly_scan_jobs(n_jobs) as jobs:
+            chunks = Parallel(n_jobs=jobs)(
+                delayed(_score_anomaly_frame)(clf, chunk, columns, means, cutoff)
+                for chunk in iter_dataframe_chunks(file_path, chunk_rows=chunk_rows)
+            )
+
+        starts = np.cumsum([0] + [rows for rows, _, _, _, _ in chunks[:-1]])
+        anomaly_indices = np.concatenate([start + hits for start, (_, hits, _, _, _) in zip(starts, chunks)])
+        score_sketch = chunks[0][3]
+        for _, _, _, sketch, _ in chunks[1:]:
+            score_sketch = sketches.kll_merge(score_sketch, sketch)
+
+        return {
+            "anomalies": [record for _, _, _, _, records in chunks for record in records],
+            "indices": anomaly_indices.tolist(),
+            "scores": np.concatenate([scores for _, _, scores, _, _ in chunks]).tolist(),
+            "count": len(anomaly_indices),
+            "mode": "sampled",
+            "fit_rows": len(sample),
+            "contamination": contamination,
+            "threshold": float(cutoff),
+            "score_quantiles": dict(zip(SCORE_QUANTILES, sketches.kll_quantiles(score_sketch, list(SCORE_QUANTILES.values())))),
+            "message": "Anomaly detection successful."
+        }
+
+    except Exception as e:
+        print(f"Error in anomaly detection: {e}")
+        return {"anomalies": [], "count": 0, "message": f"Error during anomaly detection: {str(e)}"}
+
+def _group_anomaly_positions(features: np.ndarray) -> np.ndarray:
+    """
+    Fits an Isolation Forest to one group's rows and returns the positions of its outliers.
+    """
+    clf = IsolationForest(contamination='auto', random_state=42)
+    return np.where(clf.fit_predict(features) == -1)[0]
+
+def detect_anomalies_by_group(df: pd.DataFrame, group_by: str, n_jobs: int = ANOMALY_N_JOBS,
+                              min_group_rows: int = ANOMALY_MIN_GROUP_ROWS) -> dict:
+    """
+    Detects anomalies with one Isolation Forest per value of `group_by` (e.g. per device),
+    so each row is judged against its own group's baseline. The groups are fitted in
+    parallel across n_jobs processes. Groups with fewer than min_group_rows rows, and rows
+    without a group (missing group_by value), are not scanned.
+    Returns the detect_anomalies() keys plus 'group_by', 'groups' (rows and anomaly count
+    per group, most anomalous first), 'skipped_groups' (groups too small to scan) and
+    'ungrouped_rows' (rows without a group). Every anomaly record carries its group
+    label in the group_by column.
+    Raises ValueError if group_by is not a column.
+    """
+    if group_by not in df.columns:
+        raise ValueError(f"Column '{group_by}' not found for grouped anomaly detection.")
+
+    result = {
+        "anomalies": [], "indices": [], "count": 0, "group_by": group_by, "groups": [], "skipped_groups": 0,
+        # groupby() leaves out rows whose key is missing
+        "ungrouped_rows": int(df[group_by].isna().sum())
+    }
+    numeric_df = df.select_dtypes(include=[np.number]).drop(columns=[group_by], errors="ignore").dropna(axis=1, how="all")
+    if numeric_df.empty:
+        return {**result, "message": "No numeric columns found for anomaly detection."}
+
+    # Impute with each group's own means, falling back to the file's means
+    keys = df[group_by]
+    numeric_df = numeric_df.fillna(numeric_df.groupby(keys, observed=True).transform("mean")).fillna(numeric_df.mean())
+    values = numeric_df.to_numpy(dtype=np.float64)
+
+    groups = [(label, positions) for label, positions in df.groupby(group_by, sort=False, observed=True).indices.items()]
+    fitted = [(label, positions) for label, positions in groups if len(positions) >= min_group_rows]
+    result["skipped_groups"] = len(groups) - len(fitted)
+    if not fitted:
+        return {**result, "message": f"No group has the {min_group_rows} rows needed for anomaly detection."}
+
+    try:
+        with _anomaly_scan_jobs(n_jobs) as jobs:
+            outliers = Parallel(n_jobs=jobs)(delayed(_group_anomaly_positions)(values[positions]) for _, positions in fitted)
+    except Exception as e:
+        print(f"Error in grouped anomaly detection: {e}")
+        return {**result, "message": f"Error during anomaly detection: {str(e)}"}
+
+    anomaly_indices = np.sort(np.concatenate([positions[hits] for (_, positions), hits in zip(fitted, outliers)]))
+    group_counts = [
+        {"group": json_safe_value(label), "rows": len(positions), "count": len(hits)}
+        for (label, positions), hits in zip(fitted, outliers)
+    ]
+    return {
+        **result,
+        "anomalies": json_safe_records(df.iloc[anomaly_indices]),
+        "indices": anomaly_indices.tolist(),
+        "count": len(anomaly_indices),
+        "groups": sorted(group_counts, key=lambda group: group["count"], reverse=True),
+        "message": "Anomaly detection successful."
+    }
+
+async def generate_aggregation_rules_async(analysis_result: dict) -> list:
     """
     Uses Google Gemini to suggest meaningful Pandas aggregation rules based on the analysis result.
     Returns a list of rule objects, where each rule is:
@@ -253,25 +1226,74 @@ def generate_aggregation_rules(analysis_result: dict) -> list:
         "description": "Calculates the average temperature for each device to identify overheating units."
     }
     """
-    metadata_str = json.dumps(analysis_result.get("metadata", {}), indent=2)
-    summary_str = json.dumps(analysis_result.get("summary", {}), indent=2)
-
-    prompt_text = (
-        f"You are an expert data analyst. Analyze the following dataset metadata and statistical summary.\n"
-        f"Metadata: {metadata_str}\n"
-        f"Summary: {summary_str}\n\n"
-        f"Suggest 3 to 5 meaningful Pandas aggregation queries that would reveal hidden patterns or insights.\n"
-        f"For each suggestion, provide a JSON object with the following keys:\n"
-        f"- 'title': A short, descriptive title.\n"
-        f"- 'group_by': A list of column names to group by. Choose categorical or discrete columns (e.g., IDs, Status, Location, Date).\n"
-        f"- 'aggregations': A dictionary where keys are column names (numeric) and values are aggregation functions ('mean', 'sum', 'count', 'min', 'max').\n"
-        f"- 'description': A brief explanation of what this aggregation reveals.\n\n"
-        f"Ensure strictly that valid columns are used. Do not group by unique IDs or continuous high-cardinality numeric variables unless they are likely categories (e.g. 'Month').\n"
-        f"Return ONLY a valid JSON list of these objects. No markdown."
+    result = await aquery_llm_json(_aggregation_rules_prompt(analysis_result), template="aggregation_rules")
+    return result if isinstance(result, list) else []
+
+def _dashboard_plan_parts(analysis_result: dict) -> dict:
+    """
+    Per-artifact (cache template, prompt, expected type) of the dashboard plan.
+    """
+    return {
+        "rules": ("visualization_rules", _visualization_rules_prompt(analysis_result), list),
+        "insights": ("ai_insights", _ai_insights_prompt(analysis_result), dict),
+        "aggregations": ("aggregation_rules", _aggregation_rules_prompt(analysis_result), list)
+    }
+
+def _dashboard_plan_prompt(analysis_result: dict) -> str:
+    return (
+        PROMPT_INTRO
+        + _profile_prompt_section(analysis_result)
+        + "Plan a dashboard for this dataset. Return ONLY a valid JSON object with exactly these keys:\n\n"
+        + "'rules': a JSON list of visualizations.\n" + VISUALIZATION_RULES_TASK + "\n"
+        + "'insights': a JSON object.\n" + AI_INSIGHTS_TASK + "\n"
+        + "'aggregations': a JSON list of aggregation suggestions.\n" + AGGREGATION_RULES_TASK + "\n"
+        + "Return ONLY the JSON object. No markdown."
     )
 
-    result = _query_gemini_json(prompt_text)
-    return result if isinstance(result, list) else []
+def _fill_dashboard_plan(plan: dict, result, parts: dict, keys: dict):
+    """
+    Takes the valid parts of a combined reply into `plan` and the per-artifact caches.
+    """
+    result = result if isinstance(result, dict) else {}
+    for name, (_, _, expected_type) in parts.items():
+        if plan[name] is None and isinstance(result.get(name), expected_type) and result[name]:
+            plan[name] = result[name]
+            set_cached_llm_result(keys[name], plan[name])
+
+def _complete_dashboard_plan(plan: dict) -> dict:
+    return {
+        "rules": plan["rules"] or [],
+        "insights": plan["insights"] or _fallback_insights(),
+        "aggregations": plan["aggregations"] or []
+    }
+
+async def generate_dashboard_plan_async(analysis_result: dict) -> dict:
+    """
+    Gets visualization rules, insights and aggregation suggestions from a single
+    structured-output Gemini call (the profile is sent once instead of three times).
+    Each part is also stored in the cache of its per-artifact endpoint, and parts
+    already cached there are reused. Parts missing from the combined reply are then
+    requested with their own prompts, concurrently.
+    Returns {"rules": [...], "insights": {...}, "aggregations": [...]}.
+    """
+    parts = _dashboard_plan_parts(analysis_result)
+    keys = {name: llm_cache_key(LLM_MODEL, template, prompt) for name, (template, prompt, _) in parts.items()}
+    plan = {name: get_cached_llm_result(key) for name, key in keys.items()}
+
+    if any(value is None for value in plan.values()):
+        result = await aquery_llm_json(_dashboard_plan_prompt(analysis_result), template="dashboard_plan", json_mode=True)
+        _fill_dashboard_plan(plan, result, parts, keys)
+
+    missing = [name for name, value in plan.items() if value is None]
+    if missing:
+        results = await asyncio.gather(*(
+            aquery_llm_json(parts[name][1], template=parts[name][0]) for name in missing
+        ))
+        for name, result in zip(missing, results):
+            if isinstance(result, parts[name][2]):
+                plan[name] = result
+
+    return _complete_dashboard_plan(plan)
 
 def execute_aggregation_rule(df: pd.DataFrame, rule: dict) -> dict:
     """
@@ -294,10 +1316,12 @@ def execute_aggregation_rule(df: pd.DataFrame, rule: dict) -> dict:
 
         # Perform aggregation
         # reset_index() flattens the result back to a regular DataFrame
-        grouped_df = df.groupby(group_cols).agg(aggs).reset_index()
+        # observed=True keeps categorical keys from expanding to every category combination
+        grouped_df = df.groupby(group_cols, observed=True).agg(aggs).reset_index()
         
-        # Convert to dictionary for JSON response (records format is usually best for charts)
-        result_data = grouped_df.to_dict(orient='records')
+        # Convert to dictionary for JSON response (records format is usually best for charts);
+        # timestamps become ISO strings and missing values None
+        result_data = json_safe_records(grouped_df)
         
         return {
             "rule": rule,
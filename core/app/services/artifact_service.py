@@ -0,0 +1,101 @@
+import os
+import re
+import gzip
+import json
+import time
+import uuid
+from app.config import ARTIFACT_DIR, ARTIFACT_RETIRE_GRACE_SECONDS
+
+# Bulky analysis results are kept out of the Mongo documents (16 MB BSON limit,
+# slow collection reads) and stored here as gzip-compressed JSON files.
+# Records hold only the artifact ID and a small summary.
+# An artifact replaced by a newer one is only retired: a marker under .retired
+# records when, and the sweep deletes it once ARTIFACT_RETIRE_GRACE_SECONDS have passed.
+
+RETIRED_DIR_NAME = ".retired"
+
+_last_sweep = {"at": 0.0}
+
+ARTIFACT_ID_PATTERN = re.compile(r"^[a-z_]+-[0-9a-f]{32}$")
+
+def _artifact_path(artifact_id: str) -> str:
+    # IDs end up in file paths, so never accept anything but our own format
+    if not ARTIFACT_ID_PATTERN.match(artifact_id or ""):
+        raise ValueError(f"Invalid artifact ID: {artifact_id}")
+    return os.path.join(ARTIFACT_DIR, f"{artifact_id}.json.gz")
+
+def put_artifact(kind: str, data) -> str:
+    """
+    Stores a JSON-serializable result and returns its artifact ID ("<kind>-<uuid>").
+    Values JSON cannot represent (timestamps etc.) are stored as strings.
+    """
+    artifact_id = f"{kind}-{uuid.uuid4().hex}"
+    path = _artifact_path(artifact_id)
+    os.makedirs(ARTIFACT_DIR, exist_ok=True)
+    # Write under a temporary name so readers never see a partial artifact
+    tmp_path = f"{path}.tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=6) as f:
+        json.dump(data, f, default=str)
+    os.replace(tmp_path, path)
+    sweep_retired_artifacts()
+    return artifact_id
+
+def get_artifact(artifact_id: str):
+    """
+    Loads a stored result, or returns None if the artifact does not exist.
+    """
+    try:
+        with gzip.open(_artifact_path(artifact_id), "rt", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def delete_artifact(artifact_id: str):
+    """
+    Removes a stored result; missing artifacts are ignored.
+    """
+    try:
+        os.remove(_artifact_path(artifact_id))
+    except (FileNotFoundError, ValueError):
+        pass
+
+def retire_artifact(artifact_id: str):
+    """
+    Marks a replaced result for deletion after the grace period, so readers that
+    fetched the old ID just before the switch can still load it.
+    """
+    _artifact_path(artifact_id)
+    retired_dir = os.path.join(ARTIFACT_DIR, RETIRED_DIR_NAME)
+    os.makedirs(retired_dir, exist_ok=True)
+    with open(os.path.join(retired_dir, artifact_id), "w"):
+        pass
+
+def sweep_retired_artifacts(grace_seconds: float = None, force: bool = False) -> int:
+    """
+    Deletes retired artifacts whose grace period is over; returns how many.
+    Runs at most once per grace period unless forced.
+    """
+    grace = ARTIFACT_RETIRE_GRACE_SECONDS if grace_seconds is None else grace_seconds
+    now = time.time()
+    if not force and now - _last_sweep["at"] < grace:
+        return 0
+    _last_sweep["at"] = now
+
+    retired_dir = os.path.join(ARTIFACT_DIR, RETIRED_DIR_NAME)
+    try:
+        markers = os.listdir(retired_dir)
+    except FileNotFoundError:
+        return 0
+
+    removed = 0
+    for artifact_id in markers:
+        marker = os.path.join(retired_dir, artifact_id)
+        try:
+            if now - os.path.getmtime(marker) < grace:
+                continue
+            delete_artifact(artifact_id)
+            os.remove(marker)
+            removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
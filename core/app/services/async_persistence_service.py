@@ -0,0 +1,121 @@
+from pymongo import ReturnDocument
+from app.config import async_db, async_client
+from app.services.job_service import new_analysis_job, enqueue_analysis_job, build_file_status, LATEST_JOB_SORT
+from app.services.file_upload_service import FILE_STATUS_PROJECTION
+
+# Async counterparts of the DB access used by async route handlers, so a Mongo
+# round trip awaits instead of blocking the event loop. Sync code (threadpool
+# routes, analysis worker processes) keeps using the functions on `db`.
+
+async def save_uploaded_file_async(filename: str, content_hash: str = None) -> dict:
+    """
+    store the file like data-sheet-<uuid>
+    Raises DuplicateKeyError if another live record already has this content_hash.
+    """
+    document = {
+        "file_path": filename,
+        "status": "processing"
+    }
+    if content_hash:
+        document["content_hash"] = content_hash
+    # insert_one adds an _id to the dict it is given, so pass a copy
+    await async_db.uploaded_files.insert_one(dict(document))
+    return document
+
+async def release_content_hash_async(filename: str):
+    """
+    Async counterpart of file_upload_service.release_content_hash().
+    """
+    try:
+        await async_db.uploaded_files.update_one(
+            {"file_path": filename, "content_hash": {"$exists": True}},
+            {"$rename": {"content_hash": "failed_content_hash"}}
+        )
+    except Exception as e:
+        print(f"Database error releasing content hash of {filename}: {e}")
+
+async def find_file_by_hash_async(content_hash: str):
+    """
+    The record of a previously uploaded file with the same content (SHA-256), or None.
+    Files whose analysis failed are not reused.
+    """
+    try:
+        return await async_db.uploaded_files.find_one(
+            {"content_hash": content_hash, "status": {"$ne": "failed"}},
+            {"_id": 0, "file_path": 1, "status": 1}
+        )
+    except Exception as e:
+        print(f"Database error looking up file by content hash: {e}")
+        return None
+
+async def submit_analysis_job_async(filename: str, file_path: str, file_size: int, analysis_ready: bool = False) -> str:
+    """
+    Records and queues a background analysis for an uploaded file; returns its job ID.
+    analysis_ready: see job_service.process_uploaded_file().
+    """
+    job = new_analysis_job(filename, file_size, analysis_ready)
+    try:
+        await async_db.analysis_jobs.insert_one(dict(job))
+    except Exception as e:
+        print(f"Database error recording analysis job {job['job_id']}: {e}")
+
+    enqueue_analysis_job(job, file_path)
+    return job["job_id"]
+
+async def get_file_status_async(filename: str):
+    """
+    Lightweight status of an uploaded file (see job_service.get_file_status), or None.
+    """
+    try:
+        record = await async_db.uploaded_files.find_one({"file_path": filename}, FILE_STATUS_PROJECTION)
+        if record is None:
+            return None
+        job = await async_db.analysis_jobs.find_one({"file_path": filename}, {"_id": 0}, sort=LATEST_JOB_SORT)
+    except Exception as e:
+        print(f"Database error fetching file status: {e}")
+        return None
+
+    return build_file_status(filename, record, job)
+
+async def create_upload_session_async(session: dict):
+    """
+    Stores a new resumable upload session (see chunked_upload_service.new_upload_session).
+    """
+    await async_db.upload_sessions.insert_one(dict(session))
+
+async def get_upload_session_async(upload_id: str):
+    """
+    Get a resumable upload session, or None
+    """
+    return await async_db.upload_sessions.find_one({"upload_id": upload_id}, {"_id": 0})
+
+async def update_upload_session_async(upload_id: str, fields: dict):
+    """
+    Updates a resumable upload session.
+    """
+    await async_db.upload_sessions.update_one({"upload_id": upload_id}, {"$set": fields})
+
+async def claim_upload_session_async(upload_id: str, from_status: str, to_status: str):
+    """
+    Atomically moves an upload session from one status to another; returns the
+    updated session, or None if it does not exist or is not in from_status.
+    """
+    return await async_db.upload_sessions.find_one_and_update(
+        {"upload_id": upload_id, "status": from_status},
+        {"$set": {"status": to_status}},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
+
+async def delete_upload_sessions_created_before_async(created_before: str) -> int:
+    """
+    Deletes the upload sessions created before an ISO timestamp; returns how many were deleted.
+    """
+    result = await async_db.upload_sessions.delete_many({"created_at": {"$lt": created_before}})
+    return result.deleted_count
+
+async def close_async_client():
+    """
+    Closes the async client's connection pool; called when the application shuts down.
+    """
+    await async_client.close()
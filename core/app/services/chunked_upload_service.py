@@ -0,0 +1,306 @@
+import os
+import re
+import uuid
+import time
+import shutil
+import threading
+import hashlib
+import pandas as pd
+from app.config import UPLOAD_CHUNK_MB, UPLOAD_CHUNK_MAX_MB, UPLOAD_SESSION_TTL_HOURS, STREAMING_PROFILE_THRESHOLD_MB
+from app.services.ingest_service import (
+    new_upload_ingest, ingest_chunk, finish_upload_ingest, abort_upload_ingest,
+    new_stream_profile, feed_stream_profile, finish_stream_profile
+)
+
+# Resumable uploads: a session is initiated with the total size, numbered chunks
+# are PUT (in any order, retried as needed) into a staging directory, and
+# finalize assembles them into the uploaded file.
+# Received chunks are whatever part files exist on disk, so a client can ask
+# which ones are missing after a dropped connection and only resend those.
+# Finalize first claims the session (status "uploading" -> "finalizing") so it runs
+# once, then moves the staging directory aside and assembles that snapshot, so a
+# chunk written concurrently can never change the file being assembled.
+# Sessions expire after UPLOAD_SESSION_TTL_HOURS; their staging files and records
+# are swept. A cancelled upload, or one whose finalize failed, is discarded at once.
+# Uploads above STREAMING_PROFILE_THRESHOLD_MB (which would be profiled in chunks
+# anyway) are profiled while they arrive: after each stored chunk, the contiguous
+# run of chunks after the last one profiled is folded into a stream profile held in
+# this process. Each profiled chunk's inode is remembered, so a chunk re-sent after
+# it was profiled drops the profile; finalize then hands over the profile only if
+# every assembled chunk is one that was profiled.
+
+UPLOAD_DIR = "app/uploads"
+UPLOAD_STAGING_DIR = os.path.join(UPLOAD_DIR, ".partial")
+PART_FILE_PATTERN = re.compile(r"^(\d+)\.part$")
+ASSEMBLING_SUFFIX = ".assembling"
+COPY_BUFFER_BYTES = 1024 * 1024
+
+def new_upload_session(filename: str, total_size: int, chunk_size: int = None, sha256: str = None) -> dict:
+    """
+    Builds the record of a new upload session.
+    Raises ValueError for an invalid size, chunk size or checksum.
+    """
+    chunk_size = chunk_size or UPLOAD_CHUNK_MB * 1024 * 1024
+    if total_size <= 0:
+        raise ValueError("total_size must be positive")
+    if not 0 < chunk_size <= UPLOAD_CHUNK_MAX_MB * 1024 * 1024:
+        raise ValueError(f"chunk_size must be between 1 byte and {UPLOAD_CHUNK_MAX_MB} MB")
+    if sha256 is not None and not re.fullmatch(r"[0-9a-f]{64}", sha256.lower()):
+        raise ValueError("sha256 must be a hex SHA-256 digest")
+
+    return {
+        "upload_id": uuid.uuid4().hex,
+        "original_filename": filename,
+        "file_name": f"data-sheet-{uuid.uuid4().hex[:8]}{os.path.splitext(filename)[1] if filename else ''}",
+        "total_size": total_size,
+        "chunk_size": chunk_size,
+        "chunk_count": -(-total_size // chunk_size),
+        "sha256": sha256.lower() if sha256 else None,
+        "status": "uploading",
+        "created_at": pd.Timestamp.now().isoformat()
+    }
+
+_upload_profiles = {}
+_upload_profiles_lock = threading.Lock()
+
+def _staging_dir(upload_id: str) -> str:
+    return os.path.join(UPLOAD_STAGING_DIR, upload_id)
+
+def _part_path(upload_id: str, index: int, staging_dir: str = None) -> str:
+    return os.path.join(staging_dir or _staging_dir(upload_id), f"{index}.part")
+
+def session_expired(session: dict) -> bool:
+    """
+    Whether an upload session is older than UPLOAD_SESSION_TTL_HOURS.
+    """
+    age = pd.Timestamp.now() - pd.Timestamp(session["created_at"])
+    return age > pd.Timedelta(hours=UPLOAD_SESSION_TTL_HOURS)
+
+def session_expiry_cutoff() -> str:
+    """
+    Creation time (ISO) before which upload sessions have expired.
+    """
+    return (pd.Timestamp.now() - pd.Timedelta(hours=UPLOAD_SESSION_TTL_HOURS)).isoformat()
+
+def expected_chunk_size(session: dict, index: int) -> int:
+    """
+    Size of chunk `index`: chunk_size for every chunk but the last.
+    """
+    if index == session["chunk_count"] - 1:
+        return session["total_size"] - index * session["chunk_size"]
+    return session["chunk_size"]
+
+def write_chunk(session: dict, index: int, offset: int, data: bytes, checksum: str):
+    """
+    Verifies and stores one chunk. Re-sending a chunk replaces it.
+    Raises ValueError if the index, offset, size or SHA-256 checksum do not match.
+    """
+    if not 0 <= index < session["chunk_count"]:
+        raise ValueError(f"Chunk index must be between 0 and {session['chunk_count'] - 1}")
+    if offset != index * session["chunk_size"]:
+        raise ValueError(f"Chunk {index} must start at offset {index * session['chunk_size']}")
+    if len(data) != expected_chunk_size(session, index):
+        raise ValueError(f"Chunk {index} must be {expected_chunk_size(session, index)} bytes, got {len(data)}")
+    if hashlib.sha256(data).hexdigest() != (checksum or "").lower():
+        raise ValueError(f"Checksum mismatch for chunk {index}")
+
+    os.makedirs(_staging_dir(session["upload_id"]), exist_ok=True)
+    part_path = _part_path(session["upload_id"], index)
+    # Write under a temporary name so an interrupted write never looks like a received chunk
+    tmp_path = f"{part_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, part_path)
+
+def profiles_upload(session: dict) -> bool:
+    """
+    Whether an upload is profiled while its chunks arrive.
+    """
+    return session["total_size"] > STREAMING_PROFILE_THRESHOLD_MB * 1024 * 1024
+
+def advance_upload_profile(session: dict, index: int):
+    """
+    Called after chunk `index` is stored: folds every chunk that now follows the
+    profiled ones without a gap into the upload's stream profile, or drops the
+    profile if the chunk replaced one that was already profiled.
+    """
+    upload_id = session["upload_id"]
+    with _upload_profiles_lock:
+        entry = _upload_profiles.setdefault(
+            upload_id, {"lock": threading.Lock(), "profile": None, "next": 0, "inodes": [], "dropped": False}
+        )
+    with entry["lock"]:
+        if entry["dropped"]:
+            return
+        try:
+            if index < entry["next"] and os.stat(_part_path(upload_id, index)).st_ino != entry["inodes"][index]:
+                print(f"Chunk {index} of upload {upload_id} was re-sent after it was profiled; profiling stopped")
+                entry.update(dropped=True, profile=None)
+                return
+            while entry["next"] < session["chunk_count"]:
+                part_path = _part_path(upload_id, entry["next"])
+                try:
+                    part = open(part_path, "rb")
+                except FileNotFoundError:
+                    break
+                with part:
+                    inode = os.fstat(part.fileno()).st_ino
+                    data = part.read()
+                if entry["profile"] is None:
+                    entry["profile"] = new_stream_profile(part_path)
+                feed_stream_profile(entry["profile"], data)
+                if not entry["profile"]["active"]:
+                    entry.update(dropped=True, profile=None)
+                    return
+                entry["inodes"].append(inode)
+                entry["next"] += 1
+        except Exception as e:
+            # Profiling is an optimization: the background analysis profiles the file instead
+            print(f"Upload profiling stopped for {upload_id}: {e}")
+            entry.update(dropped=True, profile=None)
+
+def _take_upload_profile(session: dict, snapshot_dir: str):
+    """
+    Removes the upload's stream profile and returns the finished profile if it covers
+    exactly the chunks in snapshot_dir, else None.
+    """
+    with _upload_profiles_lock:
+        entry = _upload_profiles.pop(session["upload_id"], None)
+    if entry is None:
+        return None
+    with entry["lock"]:
+        if entry["dropped"] or entry["next"] != session["chunk_count"]:
+            return None
+        inodes = [os.stat(_part_path(session["upload_id"], index, snapshot_dir)).st_ino for index in range(session["chunk_count"])]
+        if inodes != entry["inodes"]:
+            return None
+        return finish_stream_profile(entry["profile"])
+
+def _forget_upload_profile(upload_id: str):
+    with _upload_profiles_lock:
+        _upload_profiles.pop(upload_id, None)
+
+def received_chunks(upload_id: str) -> list:
+    """
+    Sorted indexes of the chunks stored for an upload.
+    """
+    try:
+        names = os.listdir(_staging_dir(upload_id))
+    except FileNotFoundError:
+        return []
+    return sorted(int(match.group(1)) for match in map(PART_FILE_PATTERN.match, names) if match)
+
+def upload_progress(session: dict) -> dict:
+    """
+    Received and missing chunk indexes of an upload session.
+    """
+    received = received_chunks(session["upload_id"])
+    received_set = set(received)
+    return {
+        "upload_id": session["upload_id"],
+        "status": session["status"],
+        "chunk_size": session["chunk_size"],
+        "chunk_count": session["chunk_count"],
+        "received_chunks": received,
+        "missing_chunks": [i for i in range(session["chunk_count"]) if i not in received_set],
+        "bytes_received": sum(expected_chunk_size(session, i) for i in received)
+    }
+
+def assemble_upload(session: dict, file_path: str) -> dict:
+    """
+    Concatenates the chunks of a complete upload into file_path and removes the staging files.
+    Call only after claiming the session for finalize; on failure the chunks are put back.
+    Returns finish_upload_ingest()'s {"file_size", "content_hash"} plus "analysis": the
+    profile built while the chunks arrived (see advance_upload_profile()), or None.
+    Raises ValueError if chunks are missing or the file does not match the checksum
+    given when the upload was initiated.
+    """
+    upload_id = session["upload_id"]
+    # Assemble a snapshot: chunk writes racing with finalize land in a fresh staging directory
+    snapshot_dir = _staging_dir(upload_id) + ASSEMBLING_SUFFIX
+    try:
+        os.rename(_staging_dir(upload_id), snapshot_dir)
+    except FileNotFoundError:
+        os.makedirs(snapshot_dir, exist_ok=True)
+
+    try:
+        ingested = _assemble_snapshot(session, snapshot_dir, file_path)
+    except Exception:
+        _restore_staging(upload_id, snapshot_dir)
+        raise
+    try:
+        ingested["analysis"] = _take_upload_profile(session, snapshot_dir)
+    except Exception as e:
+        print(f"Upload profile of {upload_id} could not be used: {e}")
+        ingested["analysis"] = None
+    shutil.rmtree(snapshot_dir, ignore_errors=True)
+    return ingested
+
+def _assemble_snapshot(session: dict, snapshot_dir: str, file_path: str) -> dict:
+    received = set(int(match.group(1)) for match in map(PART_FILE_PATTERN.match, os.listdir(snapshot_dir)) if match)
+    missing = [i for i in range(session["chunk_count"]) if i not in received]
+    if missing:
+        raise ValueError(f"Upload is missing chunks: {missing[:20]}")
+
+    tmp_path = f"{file_path}.tmp"
+    ingest = new_upload_ingest(tmp_path)
+    try:
+        for index in range(session["chunk_count"]):
+            with open(_part_path(session["upload_id"], index, snapshot_dir), "rb") as part:
+                while buffer := part.read(COPY_BUFFER_BYTES):
+                    ingest_chunk(ingest, buffer)
+    except Exception:
+        abort_upload_ingest(ingest)
+        os.remove(tmp_path)
+        raise
+    ingested = finish_upload_ingest(ingest)
+
+    if session.get("sha256") and ingested["content_hash"] != session["sha256"]:
+        os.remove(tmp_path)
+        raise ValueError("Checksum mismatch for the assembled file")
+
+    os.replace(tmp_path, file_path)
+    return ingested
+
+def _restore_staging(upload_id: str, snapshot_dir: str):
+    """
+    Moves the chunks of a failed assembly back so the client can resend the missing ones.
+    Chunks written meanwhile are newer and win.
+    """
+    staging_dir = _staging_dir(upload_id)
+    os.makedirs(staging_dir, exist_ok=True)
+    for name in os.listdir(snapshot_dir):
+        target = os.path.join(staging_dir, name)
+        if PART_FILE_PATTERN.match(name) and not os.path.exists(target):
+            os.replace(os.path.join(snapshot_dir, name), target)
+    shutil.rmtree(snapshot_dir, ignore_errors=True)
+
+def discard_upload(upload_id: str):
+    """
+    Deletes the staged chunks and stream profile of an upload.
+    """
+    _forget_upload_profile(upload_id)
+    shutil.rmtree(_staging_dir(upload_id), ignore_errors=True)
+
+def sweep_expired_uploads(now: float = None) -> int:
+    """
+    Deletes staging directories untouched for UPLOAD_SESSION_TTL_HOURS (abandoned
+    uploads and snapshots of crashed finalizes); returns how many were removed.
+    """
+    cutoff = (now or time.time()) - UPLOAD_SESSION_TTL_HOURS * 3600
+    try:
+        names = os.listdir(UPLOAD_STAGING_DIR)
+    except FileNotFoundError:
+        return 0
+
+    removed = 0
+    for name in names:
+        path = os.path.join(UPLOAD_STAGING_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+                _forget_upload_profile(name)
+                removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
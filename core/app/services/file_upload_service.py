@@ -1,111 +1,410 @@
-from app.config import db
+from app.config import db, ANALYSIS_WAIT_TIMEOUT_SECONDS, ANALYSIS_POLL_INTERVAL_SECONDS, FILES_PAGE_SIZE, FILES_PAGE_MAX
 import os
+import time
 import pandas as pd
 import json
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.messages import HumanMessage
+import hashlib
+import itertools
+from bson import ObjectId
+from app.services.ai_service import analyze_file, detect_anomalies, detect_file_anomalies, detect_anomalies_by_group, get_cached_dataframe, is_streaming_size
+from app.services.artifact_service import put_artifact, get_artifact, delete_artifact, retire_artifact
+from app.services.llm_service import aquery_llm_json
 from dotenv import load_dotenv
 
 load_dotenv()
 
 UPLOAD_DIR = "app/uploads"
 
-def save_uploaded_file(filename: str):
+# Bulky fields left out of file listings unless explicitly requested
+# (records written before the artifact store embed their results inline)
+FILE_LISTING_EXCLUDED_FIELDS = ("analysis", "anomalies")
+
+# Small fields of an analysis result kept on the file record next to the artifact ID
+ANALYSIS_SUMMARY_FIELDS = ("row_count", "memory_usage_mb", "profile_mode", "summary_mode", "error")
+
+def save_uploaded_file(filename: str, content_hash: str = None):
     """
     store the file like data-sheet-<uuid>
+    content_hash (SHA-256 of the file) lets identical re-uploads be linked to this file.
     """
     document = {
-        "file_path": filename  
+        "file_path": filename,
+        "status": "processing"
     }
+    if content_hash:
+        document["content_hash"] = content_hash
     db.uploaded_files.insert_one(document)
     return document
 
-def update_file_analysis(filename: str, analysis_result: dict, status: str = "completed"):
+def release_content_hash(filename: str):
+    """
+    Moves a file record's content_hash aside (to failed_content_hash) so a new
+    upload of the same content can take its place in the unique index.
+    Used when the file's analysis fails.
+    """
+    try:
+        db.uploaded_files.update_one(
+            {"file_path": filename, "content_hash": {"$exists": True}},
+            {"$rename": {"content_hash": "failed_content_hash"}}
+        )
+    except Exception as e:
+        print(f"Database error releasing content hash of {filename}: {e}")
+
+def get_source_signature(file_path: str) -> dict:
+    """
+    Fingerprint of the file on disk used to detect stale stored analysis profiles.
+    """
+    stat = os.stat(file_path)
+    return {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+def summarize_analysis(analysis_result: dict) -> dict:
+    """
+    Small summary of an analysis result stored on the file record.
+    """
+    summary = {field: analysis_result[field] for field in ANALYSIS_SUMMARY_FIELDS if field in analysis_result}
+    if "metadata" in analysis_result:
+        summary["column_count"] = len(analysis_result["metadata"])
+    return summary
+
+def load_file_analysis(record: dict):
+    """
+    The full analysis result of a file record, read from the artifact store
+    (or inline for older records). None if there is none.
+    """
+    if record.get("analysis"):
+        return record["analysis"]
+    if record.get("analysis_ref"):
+        return get_artifact(record["analysis_ref"])
+    return None
+
+def _replace_artifact(filename: str, ref_field: str, artifact_id: str, fields: dict, inline_field: str):
+    """
+    Points the file record at a new artifact and retires the one it replaces
+    (deleted after a grace period, see artifact_service). The new artifact is
+    deleted again if the record is missing or the update fails.
+    """
+    try:
+        previous = db.uploaded_files.find_one_and_update(
+            {"file_path": filename},
+            {"$set": {ref_field: artifact_id, **fields}, "$unset": {inline_field: ""}},
+            projection={ref_field: 1}
+        )
+    except Exception:
+        delete_artifact(artifact_id)
+        raise
+    if previous is None:
+        print(f"Warning: No document found with file_path: {filename}")
+        delete_artifact(artifact_id)
+    elif previous.get(ref_field):
+        retire_artifact(previous[ref_field])
+    return previous
+
+def update_file_analysis(filename: str, analysis_result: dict, status: str = "completed", source_signature: dict = None):
     """
     Updates the file record with analysis results.
+    The result itself goes to the artifact store; the record keeps its ID and a small summary.
     """
     if db is None:
         raise ConnectionError("Database connection is not available")
     
+    update_fields = {
+        "analysis_summary": summarize_analysis(analysis_result),
+        "status": status,
+        "processed_at": pd.Timestamp.now().isoformat()
+    }
+    if source_signature is not None:
+        update_fields["source_signature"] = source_signature
+
+    analysis_ref = put_artifact("analysis", analysis_result)
     try:
-        result = db.uploaded_files.update_one(
-            {"file_path": filename},
-            {
-                "$set": {
-                    "analysis": analysis_result,
-                    "status": status,
-                    "processed_at": pd.Timestamp.now().isoformat()
-                }
-            }
-        )
-        if result.matched_count == 0:
-            print(f"Warning: No document found with file_path: {filename}")
-        return result
+        return _replace_artifact(filename, "analysis_ref", analysis_ref, update_fields, "analysis")
     except Exception as e:
         print(f"Database error updating file analysis: {e}")
         raise
 
+def update_file_anomalies(filename: str, anomalies: dict, source_signature: dict):
+    """
+    Stores the anomaly scan of a file in the artifact store and references it from the file record,
+    logging instead of failing if the DB is unavailable.
+    """
+    anomalies_ref = put_artifact("anomalies", anomalies)
+    try:
+        _replace_artifact(
+            filename,
+            "anomalies_ref",
+            anomalies_ref,
+            {"anomaly_count": anomalies.get("count", 0), "anomalies_signature": source_signature},
+            "anomalies"
+        )
+    except Exception as e:
+        print(f"Database error updating file anomalies: {e}")
 
-def get_uploaded_files(filename: str = None):
+def get_uploaded_files(filename: str = None, include_analysis: bool = False, limit: int = FILES_PAGE_SIZE, cursor: str = None):
     """
-    Get uploaded files from DB
+    Get one page of uploaded files from DB, oldest first.
+    The listing leaves out the analysis results unless include_analysis is set.
+    `cursor` is the next_cursor of the previous page. Returns a DB cursor over
+    up to limit + 1 documents; the extra one only tells whether another page exists.
+    Raises ValueError for an invalid cursor or limit.
     """
+    if not 1 <= limit <= FILES_PAGE_MAX:
+        raise ValueError(f"limit must be between 1 and {FILES_PAGE_MAX}")
+
     query = {}
     if filename:
         query["file_path"] = filename
+    if cursor:
+        if not ObjectId.is_valid(cursor):
+            raise ValueError("Invalid cursor")
+        query["_id"] = {"$gt": ObjectId(cursor)}
+
+    projection = None if include_analysis else {field: 0 for field in FILE_LISTING_EXCLUDED_FIELDS}
+    return db.uploaded_files.find(query, projection).sort("_id", 1).limit(limit + 1)
+
+def prefetch_documents(documents):
+    """
+    Reads the first document of a DB cursor right away, so a failing query raises
+    here instead of after a streamed response has already started.
+    Returns an iterator over all the documents.
+    """
+    documents = iter(documents)
+    first = next(documents, None)
+    return iter(()) if first is None else itertools.chain([first], documents)
+
+def stream_files_listing(documents, limit: int, include_analysis: bool = False):
+    """
+    Serializes a page from get_uploaded_files() as {"files": [...], "next_cursor": ...}
+    one document at a time, so the page is never held in memory as a whole.
+    With include_analysis, each file's analysis is loaded from the artifact store.
+    If reading fails part-way, the body is closed with next_cursor null and an "error"
+    message, so clients can tell a truncated page from a complete one.
+    """
+    yield '{"files": ['
+    last_id = None
+    has_more = False
+    try:
+        for index, document in enumerate(documents):
+            if index == limit:
+                has_more = True
+                break
+            last_id = document.pop("_id")
+            if include_analysis and "analysis" not in document:
+                document["analysis"] = load_file_analysis(document)
+            yield ("," if index else "") + json.dumps(document, default=str)
+    except Exception as e:
+        print(f"Database error while streaming the files listing: {e}")
+        yield '], "next_cursor": null, "error": ' + json.dumps(f"Listing interrupted: {e}") + "}"
+        return
+    next_cursor = str(last_id) if has_more else None
+    yield '], "next_cursor": ' + json.dumps(next_cursor) + "}"
 
-    # Exclude _id to avoid serialization issues
-    files = list(db.uploaded_files.find(query, {"_id": 0}))
-    return files
+def get_file_record(filename: str):
+    """
+    Get a single file record from DB, or None if it is missing or the DB is unreachable
+    """
+    try:
+        return db.uploaded_files.find_one({"file_path": filename}, {"_id": 0})
+    except Exception as e:
+        print(f"Database error fetching file record: {e}")
+        return None
+
+# Projection of a file record without its (bulky) analysis results
+FILE_STATUS_PROJECTION = {"_id": 0, "analysis": 0, "anomalies": 0}
 
-def get_file_columns(filename: str):
+def get_file_status_record(filename: str):
     """
-    Get column names from the uploaded CSV file
+    Get a file record without its (bulky) analysis results, or None
+    """
+    try:
+        return db.uploaded_files.find_one({"file_path": filename}, FILE_STATUS_PROJECTION)
+    except Exception as e:
+        print(f"Database error fetching file status: {e}")
+        return None
+
+# Sort that puts a file's most recently queued job first
+LATEST_JOB_SORT = [("queued_at", -1)]
+
+def get_latest_job_for_file(filename: str):
+    """
+    Get the most recently queued job record for an uploaded file, or None
+    """
+    try:
+        return db.analysis_jobs.find_one({"file_path": filename}, {"_id": 0}, sort=LATEST_JOB_SORT)
+    except Exception as e:
+        print(f"Database error fetching analysis job for {filename}: {e}")
+        return None
+
+class AnalysisPendingError(Exception):
+    """
+    Raised when a file's background analysis is still queued, or still running after
+    ANALYSIS_WAIT_TIMEOUT_SECONDS. `job` is the latest job record.
+    """
+    def __init__(self, filename: str, job: dict):
+        super().__init__(f"Analysis of {filename} is still {job.get('status')}.")
+        self.filename = filename
+        self.job = job
+
+def get_file_analysis(filename: str, file_path: str, summary_mode: str = "auto") -> dict:
+    """
+    Returns the analysis profile for an uploaded file.
+    Serves the stored profile when it is completed and still matches the file on disk,
+    waits up to ANALYSIS_WAIT_TIMEOUT_SECONDS for an analysis job that is running, and
+    only recomputes when the stored profile is missing, failed or stale.
+    Raises AnalysisPendingError if the job is still queued, or still running after the wait.
+    An explicit summary_mode ("exact"/"sketch") that differs from the stored profile
+    is computed on demand without replacing the stored profile.
+    """
+    record = get_file_record(filename)
+
+    # Join a background analysis that is running instead of duplicating it. A queued
+    # job may wait behind others for a long time, so it is reported straight away.
+    deadline = time.monotonic() + ANALYSIS_WAIT_TIMEOUT_SECONDS
+    while record and record.get("status") == "processing":
+        job = get_latest_job_for_file(filename)
+        job_status = job.get("status") if job else None
+        if job_status == "queued" or (job_status == "running" and time.monotonic() >= deadline):
+            raise AnalysisPendingError(filename, job)
+        if job_status != "running":
+            # No live job behind the record (e.g. it was never queued): recompute below
+            break
+        time.sleep(ANALYSIS_POLL_INTERVAL_SECONDS)
+        record = get_file_record(filename)
+
+    source_signature = get_source_signature(file_path)
+    stored_analysis = None
+    if record and record.get("status") == "completed" and record.get("source_signature") == source_signature:
+        stored_analysis = load_file_analysis(record)
+
+    if stored_analysis:
+        stored_mode = stored_analysis.get("summary_mode", "exact")
+        if summary_mode in ("auto", stored_mode):
+            return stored_analysis
+        return analyze_file(file_path, summary_mode=summary_mode)
+
+    analysis_result = analyze_file(file_path, summary_mode=summary_mode)
+
+    if record:
+        try:
+            update_file_analysis(filename, analysis_result, source_signature=source_signature)
+        except Exception as e:
+            print(f"Could not persist recomputed analysis for {filename}: {e}")
+
+    return analysis_result
+
+def get_file_anomalies(filename: str, file_path: str, group_by: str = None, options: dict = None) -> dict:
+    """
+    Returns the anomaly scan for an uploaded file, serving the one stored by the
+    background analysis while it still matches the file on disk.
+    With group_by, the file is scanned with one model per group instead; with options
+    (detect_anomalies() keyword arguments such as mode, contamination or threshold) it is
+    scanned with those settings. Neither kind of scan is stored.
+    Files too large to load whole are scanned in chunks unless the options ask for a
+    full or stratified scan. A grouped scan loads the whole file, so it is refused for
+    such files, and it takes no options.
+    """
+    if group_by:
+        if options:
+            raise ValueError(f"{', '.join(options)} cannot be combined with group_by")
+        if is_streaming_size(file_path):
+            raise ValueError("File is too large for a grouped anomaly scan")
+        return detect_anomalies_by_group(get_cached_dataframe(file_path), group_by)
+    if options:
+        if is_streaming_size(file_path) and options.get("mode") != "full" and not options.get("stratify_by"):
+            return detect_file_anomalies(file_path, **{key: value for key, value in options.items() if key != "stratify_by"})
+        return detect_anomalies(get_cached_dataframe(file_path), **options)
+
+    record = get_file_record(filename)
+    if record and record.get("anomalies_signature") == get_source_signature(file_path):
+        anomalies = record.get("anomalies") or (get_artifact(record["anomalies_ref"]) if record.get("anomalies_ref") else None)
+        if anomalies:
+            return anomalies
+    if is_streaming_size(file_path):
+        return detect_file_anomalies(file_path)
+    return detect_anomalies(get_cached_dataframe(file_path))
+
+def column_set_signature(columns: list) -> str:
+    """
+    Fingerprint of a header that ignores column order, case and whitespace,
+    so files with the same schema (e.g. daily exports from one site) share it.
+    """
+    normalized = sorted({_normalize_column_name(col) for col in columns})
+    return hashlib.sha256(json.dumps(normalized).encode("utf-8")).hexdigest()
+
+def _canonical_column_name(name) -> str:
+    return " ".join(str(name).split())
+
+def _normalize_column_name(name) -> str:
+    return _canonical_column_name(name).casefold()
+
+def _column_classification_prompt(columns: list) -> str:
+    # Columns are listed in a canonical order and spelling, so every file with
+    # this header gets the same prompt (and cache entry)
+    canonical = sorted({_canonical_column_name(col) for col in columns}, key=str.casefold)
+    return (
+        f"Analyze the following list of parameters (columns): {canonical}\n\n"
+        f"1. Identify which ones are related to 'Water Quality'.\n"
+        f"2. For each identified parameter, provide the globally accepted ideal values (min, max, ideal).\n\n"
+        f"Return ONLY a valid JSON object where keys are the parameter names and values are objects containing 'min', 'max', 'ideal', and 'unit'.\n"
+        f"Example: {{ \"pH\": {{ \"min\": 6.5, \"max\": 8.5, \"ideal\": 7.0, \"unit\": \"\" }} }}\n"
+        f"Do not include markdown formatting.\n"
+    )
+
+def _match_column_names(classification: dict, columns: list) -> dict:
+    """
+    Renames the parameters of a classification shared by a same-schema file
+    to this file's spelling of the column names.
+    """
+    names = {_normalize_column_name(col): col for col in columns}
+    return {names.get(_normalize_column_name(param), param): values for param, values in classification.items()}
+
+def read_file_columns(filename: str) -> list:
+    """
+    Column names from the header of an uploaded CSV file, or [] if it is missing or unreadable.
     """
     full_path = os.path.join(UPLOAD_DIR, filename)
     if not os.path.exists(full_path):
         return []
 
     try:
-        df = pd.read_csv(full_path, nrows=0)
-        columns = list(df.columns)
-        
-        # AI Filtering
-        api_key = os.getenv("GOOGLE_API_KEY")
-        if not api_key:
-            return columns # Fallback to all columns if no key
-
-        llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash", google_api_key=api_key)
-        prompt_text = (
-            f"Analyze the following list of parameters (columns): {columns}\n\n"
-            f"1. Identify which ones are related to 'Water Quality'.\n"
-            f"2. For each identified parameter, provide the globally accepted ideal values (min, max, ideal).\n\n"
-            f"Return ONLY a valid JSON object where keys are the parameter names and values are objects containing 'min', 'max', 'ideal', and 'unit'.\n"
-            f"Example: {{ \"pH\": {{ \"min\": 6.5, \"max\": 8.5, \"ideal\": 7.0, \"unit\": \"\" }} }}\n"
-            f"Do not include markdown formatting.\n"
-        )
-        
-        try:
-            response = llm.invoke([HumanMessage(content=prompt_text)])
-            json_str = response.content.strip()
-            if json_str.startswith("```json"):
-                json_str = json_str[7:-3]
-            elif json_str.startswith("```"):
-                 json_str = json_str[3:-3]
-            
-            # This is a dict {"param": {...}}
-            filtered_data = json.loads(json_str)
-            return filtered_data
-            
-        except Exception as ai_e:
-            print(f"AI Filtering Error: {ai_e}")
-            # Fallback: return structure with empty values? Or just list?
-            # User expectation is JSON with values. If AI fails, we might just return the list as keys with null values?
-            # Let's return a simple dict for all columns to match type if possible, or just the list and let the frontend handle fallback.
-            # But the route expects "columns".
-            # Let's return the original list if AI fails, client will see list instead of dict.
-            return columns
-
+        return list(pd.read_csv(full_path, nrows=0).columns)
     except Exception as e:
         print(f"Error reading file columns: {e}")
         return []
+
+def get_stored_column_classification(filename: str, columns: list):
+    """
+    The column classification stored on the file record, if it was made for this header; else None.
+    """
+    try:
+        record = db.uploaded_files.find_one({"file_path": filename}, {"_id": 0, "column_classification": 1})
+    except Exception as e:
+        print(f"Database error fetching column classification: {e}")
+        return None
+    stored = (record or {}).get("column_classification")
+    if stored and stored.get("signature") == column_set_signature(columns):
+        return stored["parameters"]
+    return None
+
+def store_column_classification(filename: str, columns: list, classification: dict):
+    """
+    Stores a column classification on the file record, tagged with the header's signature.
+    """
+    try:
+        db.uploaded_files.update_one(
+            {"file_path": filename},
+            {"$set": {"column_classification": {"signature": column_set_signature(columns), "parameters": classification}}}
+        )
+    except Exception as e:
+        print(f"Database error storing column classification: {e}")
+
+async def classify_columns_async(columns: list):
+    """
+    Asks Gemini which columns are water-quality parameters and their ideal ranges.
+    Returns {"param": {"min", "max", "ideal", "unit"}} keyed by this file's column
+    names, or None on failure. Answers are cached by prompt, so files with the
+    same schema are classified once.
+    """
+    classification = await aquery_llm_json(_column_classification_prompt(columns), template="column_classification")
+    if not isinstance(classification, dict):
+        return None
+    return _match_column_names(classification, columns)
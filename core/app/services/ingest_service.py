@@ -0,0 +1,135 @@
+import io
+import codecs
+import hashlib
+import pandas as pd
+from app.services.ai_service import detect_file_format
+from app.services.profiling_service import new_profile_state, update_profile_state, finalize_profile_state
+
+# Upload ingest pipeline: each received chunk is written to disk and hashed as it
+# arrives, so the content hash is ready when the last byte lands.
+# A stream profile parses plain delimited text from the bytes of an upload as they
+# arrive and folds the rows into a streaming profile, so a resumable upload is
+# profiled while it is transferred (see chunked_upload_service) instead of in a
+# second pass over the file.
+# The functions are blocking and meant to run in a worker thread.
+
+PROFILE_BLOCK_BYTES = 8 * 1024 * 1024
+
+def new_upload_ingest(file_path: str) -> dict:
+    """
+    Opens file_path for writing and returns the ingest state.
+    """
+    return {
+        "file_path": file_path,
+        "handle": open(file_path, "wb"),
+        "hash": hashlib.sha256(),
+        "size": 0
+    }
+
+def ingest_chunk(ingest: dict, chunk: bytes):
+    """
+    Writes and hashes the next chunk of the upload.
+    """
+    ingest["handle"].write(chunk)
+    ingest["hash"].update(chunk)
+    ingest["size"] += len(chunk)
+
+def finish_upload_ingest(ingest: dict) -> dict:
+    """
+    Closes the file and returns {"file_size", "content_hash"}.
+    """
+    ingest["handle"].close()
+    return {
+        "file_size": ingest["size"],
+        "content_hash": ingest["hash"].hexdigest()
+    }
+
+def abort_upload_ingest(ingest: dict):
+    """
+    Closes the file of an upload that failed midway.
+    """
+    ingest["handle"].close()
+
+def new_stream_profile(head_path: str) -> dict:
+    """
+    Starts profiling an upload whose first bytes are stored at head_path.
+    Only uncompressed delimited text in an ASCII-compatible encoding (so rows can be
+    split on b"\\n") is profiled; for anything else the profile is inactive from the start.
+    """
+    profile = {"active": False, "format": None, "buffer": b"", "columns": None, "state": new_profile_state()}
+    try:
+        file_format = detect_file_format(head_path)
+    except Exception:
+        # e.g. a compressed stream cut off after its first chunk
+        return profile
+    encoding = codecs.lookup(file_format["encoding"] or "utf-8").name
+    if file_format["format"] != "csv" or file_format["compression"] or encoding.startswith(("utf-16", "utf-32")):
+        return profile
+    profile["active"] = True
+    profile["format"] = file_format
+    return profile
+
+def _complete_rows_end(buffer: bytes) -> int:
+    """
+    Position just after the last newline that ends a row, i.e. is not inside a
+    quoted field, or 0 if the buffer holds no complete row.
+    """
+    quotes = buffer.count(b'"')
+    end = len(buffer)
+    while True:
+        end = buffer.rfind(b"\n", 0, end)
+        if end < 0:
+            return 0
+        if (quotes - buffer.count(b'"', end)) % 2 == 0:
+            return end + 1
+
+def _profile_rows(profile: dict, block: bytes):
+    """
+    Parses a block of complete rows and folds it into the profile state.
+    Gives up on profiling (the background analysis then does it) if the block does not parse.
+    """
+    file_format = profile["format"]
+    try:
+        chunk = pd.read_csv(
+            io.BytesIO(block),
+            sep=file_format["delimiter"],
+            encoding=file_format["encoding"],
+            header=0 if profile["columns"] is None else None,
+            names=profile["columns"]
+        )
+    except Exception as e:
+        print(f"Upload profiling stopped: {e}")
+        profile["active"] = False
+        return
+    if profile["columns"] is None:
+        profile["columns"] = list(chunk.columns)
+    update_profile_state(profile["state"], chunk)
+
+def feed_stream_profile(profile: dict, data: bytes):
+    """
+    Adds the next bytes of the upload; complete rows are parsed in blocks of about
+    PROFILE_BLOCK_BYTES.
+    """
+    if not profile["active"]:
+        return
+    profile["buffer"] += data
+    if len(profile["buffer"]) >= PROFILE_BLOCK_BYTES:
+        end = _complete_rows_end(profile["buffer"])
+        if end:
+            block, profile["buffer"] = profile["buffer"][:end], profile["buffer"][end:]
+            _profile_rows(profile, block)
+
+def finish_stream_profile(profile: dict):
+    """
+    Parses the remaining rows and returns the profile (same schema as
+    analyze_file_streaming()), or None if the upload could not be profiled.
+    """
+    if profile["active"] and profile["buffer"].strip():
+        _profile_rows(profile, profile["buffer"])
+    profile["buffer"] = b""
+    if not profile["active"] or not profile["state"]["rows"]:
+        return None
+    analysis = finalize_profile_state(profile["state"])
+    analysis["profile_mode"] = "streaming"
+    analysis["summary_mode"] = "sketch"
+    return analysis
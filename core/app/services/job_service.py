@@ -0,0 +1,358 @@
+import os
+import threading
+import time
+import uuid
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import pandas as pd
+from app.config import db, ANALYSIS_MAX_WORKERS, ANALYSIS_MAX_INFLIGHT_MB, JOB_PROGRESS_INTERVAL_SECONDS
+from app.services.ai_service import analyze_file, get_cached_dataframe, invalidate_dataframe_cache, detect_anomalies, detect_file_anomalies, write_columnar_sidecar, write_columnar_sidecar_chunked
+from app.services.file_upload_service import update_file_analysis, update_file_anomalies, get_source_signature, get_file_status_record, release_content_hash, get_latest_job_for_file, LATEST_JOB_SORT, UPLOAD_DIR, get_file_record, load_file_analysis
+
+# Background analysis jobs run in a bounded process pool so CPU-heavy profiling
+# never competes with request handling in the web worker. Jobs are admitted
+# strictly in FIFO order while the total size of the files being analyzed stays
+# within ANALYSIS_MAX_INFLIGHT_MB (a single oversized file still runs on its own).
+# If a worker dies (e.g. OOM-killed) the pool breaks and is replaced by a new one.
+
+_executor = None
+_dispatcher = None
+_pending = deque()
+_running = {}
+_condition = threading.Condition()
+
+def _now() -> str:
+    return pd.Timestamp.now().isoformat()
+
+def _update_job(job_id: str, fields: dict):
+    """
+    Updates the job record, logging instead of failing if the DB is unavailable.
+    """
+    try:
+        db.analysis_jobs.update_one({"job_id": job_id}, {"$set": fields})
+    except Exception as e:
+        print(f"Database error updating analysis job {job_id}: {e}")
+
+def get_analysis_job(job_id: str):
+    """
+    Get a job record from DB
+    """
+    return db.analysis_jobs.find_one({"job_id": job_id}, {"_id": 0})
+
+def get_file_status(filename: str):
+    """
+    Lightweight status of an uploaded file: its record without analysis results,
+    plus the status and progress of its latest analysis job. None if unknown.
+    """
+    record = get_file_status_record(filename)
+    if record is None:
+        return None
+    return build_file_status(filename, record, get_latest_job_for_file(filename))
+
+def build_file_status(filename: str, record: dict, job: dict) -> dict:
+    """
+    The status response of a file from its record and latest job record (or None).
+    Shared by the sync and async status lookups so both return the same shape.
+    """
+    return {
+        "file_name": filename,
+        "status": record.get("status"),
+        "processed_at": record.get("processed_at"),
+        "job": job
+    }
+
+def make_progress_reporter(job_id: str, interval: float = JOB_PROGRESS_INTERVAL_SECONDS):
+    """
+    Returns a progress_callback(phase, rows_processed=None, fraction=None) that records
+    the current phase, rows processed and an ETA on the job record.
+    Writes are throttled to one per `interval` seconds, except on a phase change.
+    """
+    started = time.monotonic()
+    last = {"phase": None, "at": 0.0}
+
+    def report(phase: str, rows_processed: int = None, fraction: float = None):
+        now = time.monotonic()
+        if phase == last["phase"] and now - last["at"] < interval:
+            return
+        last["phase"], last["at"] = phase, now
+
+        eta_s = None
+        if fraction:
+            # Linear extrapolation from the time spent so far in the job
+            eta_s = round((now - started) * (1 - fraction) / fraction, 1)
+        _update_job(job_id, {"progress": {
+            "phase": phase,
+            "rows_processed": rows_processed,
+            "percent": round(fraction * 100, 1) if fraction is not None else None,
+            "eta_s": eta_s,
+            "updated_at": _now()
+        }})
+
+    return report
+
+def process_uploaded_file(filename: str, file_path: str, progress_callback=None, analysis_ready: bool = False) -> bool:
+    """
+    Analyzes an uploaded file, stores the profile, scans it for anomalies and
+    writes its columnar sidecar. progress_callback, if given, is told about each phase.
+    analysis_ready is set when the profile was built and stored while the file was
+    uploaded; profiling is then skipped unless the stored profile cannot be loaded.
+    """
+    report = progress_callback or (lambda phase, rows_processed=None, fraction=None: None)
+    try:
+        print(f"Starting background analysis for {filename}...")
+
+        # Fingerprint the file before analysis so the stored profile can be checked for staleness
+        source_signature = get_source_signature(file_path)
+
+        analysis_result = None
+        if analysis_ready:
+            record = get_file_record(filename)
+            analysis_result = load_file_analysis(record) if record else None
+
+        if analysis_result is None:
+            # Analyze file (Metadata + Stats)
+            analysis_result = analyze_file(file_path, progress_callback=report)
+
+            # Update DB
+            update_file_analysis(filename, analysis_result, source_signature=source_signature)
+
+        # Each pool worker scans with a single process; the pool already spreads jobs over the cores
+        if analysis_result.get("profile_mode") == "streaming":
+            # Write a columnar copy so later requests skip text parsing and prune columns.
+            # Files too large to profile in memory are scanned in chunks from that copy.
+            report("writing_sidecar", rows_processed=analysis_result["row_count"])
+            write_columnar_sidecar_chunked(file_path, analysis_result["metadata"])
+            report("anomaly_scan", rows_processed=analysis_result["row_count"])
+            update_file_anomalies(filename, detect_file_anomalies(file_path, n_jobs=1), source_signature)
+        else:
+            df = get_cached_dataframe(file_path)
+            report("anomaly_scan", rows_processed=len(df))
+            update_file_anomalies(filename, detect_anomalies(df, n_jobs=1), source_signature)
+            report("writing_sidecar", rows_processed=len(df), fraction=1.0)
+            write_columnar_sidecar(file_path, df)
+        print(f"Background analysis completed for {filename}.")
+        return True
+
+    except Exception as e:
+        print(f"Error in background processing for {filename}: {e}")
+        mark_file_failed(filename, e)
+        return False
+
+def mark_file_failed(filename: str, error):
+    """
+    Marks a file's analysis as failed and releases its content hash, so identical
+    re-uploads are analyzed afresh instead of being linked to the failed record.
+    """
+    try:
+        update_file_analysis(filename, {"error": str(error)}, status="failed")
+    except Exception as e:
+        print(f"Could not mark analysis of {filename} as failed: {e}")
+    release_content_hash(filename)
+
+def run_analysis_job(job_id: str, filename: str, file_path: str, queued_at: str, analysis_ready: bool = False) -> bool:
+    """
+    Entry point executed inside a pool worker process.
+    Records running/completed/failed status and timings on the job record.
+    """
+    started = pd.Timestamp.now()
+    _update_job(job_id, {
+        "status": "running",
+        "started_at": started.isoformat(),
+        "queue_wait_s": round((started - pd.Timestamp(queued_at)).total_seconds(), 3)
+    })
+
+    try:
+        succeeded = process_uploaded_file(
+            filename, file_path, progress_callback=make_progress_reporter(job_id), analysis_ready=analysis_ready
+        )
+    finally:
+        # Pool workers are long-lived: drop the frames this job cached, so an idle worker
+        # does not hold memory outside the ANALYSIS_MAX_INFLIGHT_MB admission budget
+        invalidate_dataframe_cache(file_path)
+
+    finished = pd.Timestamp.now()
+    _update_job(job_id, {
+        "status": "completed" if succeeded else "failed",
+        "finished_at": finished.isoformat(),
+        "duration_s": round((finished - started).total_seconds(), 3)
+    })
+    return succeeded
+
+def _create_executor():
+    # spawn: workers must not inherit the parent's MongoClient or threads
+    return ProcessPoolExecutor(
+        max_workers=ANALYSIS_MAX_WORKERS,
+        mp_context=multiprocessing.get_context("spawn")
+    )
+
+def _can_admit(file_size: int) -> bool:
+    """
+    Admission control: a job may start if a worker is free and the in-flight
+    file size stays within budget, or if nothing else is running.
+    """
+    if not _running:
+        return True
+    if len(_running) >= ANALYSIS_MAX_WORKERS:
+        return False
+    return sum(_running.values()) + file_size <= ANALYSIS_MAX_INFLIGHT_MB * 1024 * 1024
+
+def _replace_broken_executor(broken):
+    """
+    Swaps in a fresh pool for one that broke because a worker process died.
+    Call with _condition held.
+    """
+    global _executor
+    # Only the first caller replaces it; None means the application is shutting down
+    if _executor is broken:
+        _executor = _create_executor()
+        broken.shutdown(wait=False, cancel_futures=True)
+
+def _on_job_done(job: dict, executor, future):
+    error = None if future.cancelled() else future.exception()
+    with _condition:
+        _running.pop(job["job_id"], None)
+        if isinstance(error, BrokenProcessPool):
+            _replace_broken_executor(executor)
+        _condition.notify_all()
+
+    if error is not None:
+        # The worker process itself died (e.g. OOM-killed); the job never reported back.
+        # Every job running in the pool at the time fails with it, and so do their files.
+        print(f"Analysis job {job['job_id']} crashed: {error}")
+        _update_job(job["job_id"], {"status": "failed", "finished_at": _now(), "error": str(error)})
+        mark_file_failed(job["filename"], error)
+
+def _dispatch_loop():
+    """
+    Hands queued jobs to the process pool in submission order as admission allows.
+    """
+    while True:
+        with _condition:
+            while not _pending or not _can_admit(_pending[0]["file_size"]):
+                _condition.wait()
+            if _executor is None:
+                return
+            job = _pending.popleft()
+            _running[job["job_id"]] = job["file_size"]
+            executor = _executor
+
+        try:
+            options = {"analysis_ready": True} if job.get("analysis_ready") else {}
+            future = executor.submit(run_analysis_job, job["job_id"], job["filename"], job["file_path"], job["queued_at"], **options)
+        except (BrokenProcessPool, RuntimeError) as e:
+            # The pool broke (or is shutting down) before the job started: put it back
+            # at the head of the queue and retry on a fresh pool
+            print(f"Could not submit analysis job {job['job_id']}: {e!r}")
+            with _condition:
+                _running.pop(job["job_id"], None)
+                _pending.appendleft(job)
+                if isinstance(e, BrokenProcessPool):
+                    _replace_broken_executor(executor)
+            continue
+        future.add_done_callback(lambda f, job=job, executor=executor: _on_job_done(job, executor, f))
+
+def _ensure_started():
+    global _executor, _dispatcher
+    if _executor is None:
+        _executor = _create_executor()
+    if _dispatcher is None or not _dispatcher.is_alive():
+        _dispatcher = threading.Thread(target=_dispatch_loop, name="analysis-job-dispatcher", daemon=True)
+        _dispatcher.start()
+
+def new_analysis_job(filename: str, file_size: int, analysis_ready: bool = False) -> dict:
+    """
+    Builds the record of a newly queued analysis job.
+    analysis_ready: see process_uploaded_file().
+    """
+    job = {
+        "job_id": uuid.uuid4().hex,
+        "file_path": filename,
+        "file_size": file_size,
+        "status": "queued",
+        "queued_at": _now()
+    }
+    if analysis_ready:
+        job["analysis_ready"] = True
+    return job
+
+def enqueue_analysis_job(job: dict, file_path: str):
+    """
+    Hands a job (from new_analysis_job) to the executor's FIFO queue.
+    """
+    with _condition:
+        _ensure_started()
+        _pending.append({
+            "job_id": job["job_id"],
+            "filename": job["file_path"],
+            "file_path": file_path,
+            "file_size": job["file_size"],
+            "queued_at": job["queued_at"],
+            "analysis_ready": job.get("analysis_ready", False)
+        })
+        _condition.notify_all()
+
+def submit_analysis_job(filename: str, file_path: str, file_size: int) -> str:
+    """
+    Queues a background analysis for an uploaded file and returns its job ID.
+    """
+    job = new_analysis_job(filename, file_size)
+    try:
+        # insert_one adds an _id to the dict it is given, so pass a copy
+        db.analysis_jobs.insert_one(dict(job))
+    except Exception as e:
+        print(f"Database error recording analysis job {job['job_id']}: {e}")
+
+    enqueue_analysis_job(job, file_path)
+    return job["job_id"]
+
+def recover_interrupted_jobs() -> int:
+    """
+    Requeues, in their original order, the jobs a previous run of the application left
+    queued or running: the queue itself only lives in memory. Jobs whose file is gone
+    are failed. Called once at startup; assumes a single job executor per deployment.
+    Returns the number of jobs requeued.
+    """
+    try:
+        jobs = list(db.analysis_jobs.find({"status": {"$in": ["queued", "running"]}}, {"_id": 0}).sort("queued_at", 1))
+    except Exception as e:
+        print(f"Database error fetching interrupted analysis jobs: {e}")
+        return 0
+
+    requeued = 0
+    for job in jobs:
+        file_path = os.path.join(UPLOAD_DIR, job["file_path"])
+        if not os.path.exists(file_path):
+            _update_job(job["job_id"], {"status": "failed", "finished_at": _now(), "error": "File no longer exists"})
+            mark_file_failed(job["file_path"], "File no longer exists")
+            continue
+        print(f"Requeueing interrupted analysis job {job['job_id']} for {job['file_path']}")
+        _update_job(job["job_id"], {"status": "queued", "requeued_at": _now()})
+        enqueue_analysis_job({**job, "file_size": job.get("file_size") or os.path.getsize(file_path)}, file_path)
+        requeued += 1
+    return requeued
+
+def get_queue_stats() -> dict:
+    """
+    Current queue depth and in-flight work of this process' job executor.
+    """
+    with _condition:
+        return {
+            "queued": len(_pending),
+            "running": len(_running),
+            "running_mb": round(sum(_running.values()) / (1024 * 1024), 2),
+            "max_workers": ANALYSIS_MAX_WORKERS,
+            "max_inflight_mb": ANALYSIS_MAX_INFLIGHT_MB
+        }
+
+def shutdown_executor():
+    """
+    Stops the process pool; called when the application shuts down.
+    """
+    global _executor
+    with _condition:
+        executor, _executor = _executor, None
+        _condition.notify_all()
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
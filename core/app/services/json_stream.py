@@ -0,0 +1,134 @@
+import json
+
+# Incremental parser for a JSON object that arrives in pieces (e.g. a streamed
+# LLM reply). It reports each top-level field as soon as its value is complete,
+# and each element of a top-level array as soon as that element is complete,
+# so clients can render long replies progressively.
+# Anything before the opening "{" (such as a markdown code fence) is skipped.
+
+def new_json_stream_state() -> dict:
+    """
+    Creates an empty parser state.
+    """
+    return {
+        "text": "",
+        "pos": 0,
+        "depth": 0,
+        "started": False,
+        "finished": False,
+        "in_string": False,
+        "escape": False,
+        "expect": "key",
+        "key": None,
+        "key_start": None,
+        "value_start": None,
+        "in_array": False,
+        "item_start": None,
+        "item_index": 0
+    }
+
+def _parse_span(text: str, start: int, end: int):
+    try:
+        return True, json.loads(text[start:end])
+    except ValueError:
+        return False, None
+
+def _finish_value(state: dict, end: int, events: list):
+    if state["key"] is not None and state["value_start"] is not None:
+        ok, value = _parse_span(state["text"], state["value_start"], end)
+        if ok:
+            events.append({"event": "field", "data": {"key": state["key"], "value": value}})
+    state["key"] = None
+    state["value_start"] = None
+    state["in_array"] = False
+
+def _finish_item(state: dict, end: int, events: list):
+    if state["item_start"] is not None:
+        ok, value = _parse_span(state["text"], state["item_start"], end)
+        if ok:
+            events.append({"event": "item", "data": {"key": state["key"], "index": state["item_index"], "value": value}})
+        state["item_index"] += 1
+    state["item_start"] = None
+
+def feed_json_stream(state: dict, text: str) -> list:
+    """
+    Consumes the next piece of text and returns the events it completes:
+    {"event": "item", "data": {"key", "index", "value"}} for each finished element of a
+    top-level array and {"event": "field", "data": {"key", "value"}} for each finished field.
+    """
+    events = []
+    state["text"] += text
+    source = state["text"]
+
+    for i in range(state["pos"], len(source)):
+        c = source[i]
+        if state["finished"]:
+            break
+        if not state["started"]:
+            if c == "{":
+                state["started"] = True
+                state["depth"] = 1
+            continue
+
+        if state["in_string"]:
+            if state["escape"]:
+                state["escape"] = False
+            elif c == "\\":
+                state["escape"] = True
+            elif c == '"':
+                state["in_string"] = False
+                if state["depth"] == 1 and state["expect"] == "key":
+                    _, state["key"] = _parse_span(source, state["key_start"], i + 1)
+            continue
+
+        depth = state["depth"]
+        if c == '"':
+            state["in_string"] = True
+            if depth == 1 and state["expect"] == "key":
+                state["key_start"] = i
+            elif depth == 1 and state["value_start"] is None:
+                state["value_start"] = i
+            elif depth == 2 and state["in_array"] and state["item_start"] is None:
+                state["item_start"] = i
+            continue
+        if c.isspace():
+            continue
+
+        if depth == 1:
+            if c == ":":
+                state["expect"] = "value"
+            elif c == ",":
+                _finish_value(state, i, events)
+                state["expect"] = "key"
+            elif c == "}":
+                _finish_value(state, i, events)
+                state["depth"] = 0
+                state["finished"] = True
+            else:
+                if state["value_start"] is None:
+                    state["value_start"] = i
+                if c in "[{":
+                    state["depth"] = 2
+                    state["in_array"] = c == "["
+                    state["item_start"] = None
+                    state["item_index"] = 0
+            continue
+
+        if depth == 2 and state["in_array"]:
+            if c == ",":
+                _finish_item(state, i, events)
+                continue
+            if c == "]":
+                _finish_item(state, i, events)
+                state["depth"] = 1
+                continue
+            if state["item_start"] is None:
+                state["item_start"] = i
+
+        if c in "[{":
+            state["depth"] += 1
+        elif c in "]}":
+            state["depth"] -= 1
+
+    state["pos"] = len(source)
+    return events
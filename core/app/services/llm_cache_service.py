@@ -0,0 +1,98 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from app.config import LLM_CACHE_DIR, LLM_CACHE_TTL_SECONDS, LLM_CACHE_PRUNE_INTERVAL_SECONDS
+
+# LLM results are cached on disk under a hash of (model, prompt template, prompt
+# content), so refreshing a dashboard does not re-bill and re-wait for Gemini.
+# The cache is used through llm_service.aquery_llm_json(), which also lets concurrent
+# requests for the same key share a single in-flight call.
+# Failed calls (None) are never cached. Expired entries are pruned periodically
+# when new results are stored.
+
+_last_prune = {"at": 0.0}
+
+def llm_cache_key(model: str, template: str, prompt_text: str) -> str:
+    """
+    Cache key of an LLM call. The prompt text embeds the profile, so a changed
+    profile, template or model gives a new key.
+    """
+    payload = json.dumps({"model": model, "template": template, "prompt": prompt_text}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _cache_path(key: str) -> str:
+    return os.path.join(LLM_CACHE_DIR, f"{key}.json")
+
+def _read_entry(path: str):
+    """
+    The {"expires_at", "value"} entry stored at path, or None if missing or malformed.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(entry, dict) or not isinstance(entry.get("expires_at"), (int, float)) or "value" not in entry:
+        return None
+    return entry
+
+def _remove_entry(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def get_cached_llm_result(key: str):
+    """
+    The cached result for `key`, or None if missing, malformed or expired.
+    """
+    entry = _read_entry(_cache_path(key))
+    if entry is None:
+        return None
+    if entry["expires_at"] < time.time():
+        _remove_entry(_cache_path(key))
+        return None
+    return entry["value"]
+
+def prune_llm_cache(force: bool = False) -> int:
+    """
+    Deletes expired and malformed cache entries; returns how many.
+    Runs at most once per LLM_CACHE_PRUNE_INTERVAL_SECONDS unless forced.
+    """
+    now = time.time()
+    if not force and now - _last_prune["at"] < LLM_CACHE_PRUNE_INTERVAL_SECONDS:
+        return 0
+    _last_prune["at"] = now
+
+    try:
+        names = os.listdir(LLM_CACHE_DIR)
+    except FileNotFoundError:
+        return 0
+
+    removed = 0
+    for name in names:
+        if not name.endswith(".json"):
+            continue
+        path = os.path.join(LLM_CACHE_DIR, name)
+        entry = _read_entry(path)
+        if entry is None or entry["expires_at"] < now:
+            _remove_entry(path)
+            removed += 1
+    return removed
+
+def set_cached_llm_result(key: str, value, ttl_seconds: int = LLM_CACHE_TTL_SECONDS):
+    """
+    Stores a result under `key` for ttl_seconds. Errors are logged, never raised.
+    """
+    try:
+        os.makedirs(LLM_CACHE_DIR, exist_ok=True)
+        path = _cache_path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"expires_at": time.time() + ttl_seconds, "value": value}, f, default=str)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Could not write LLM cache entry {key}: {e}")
+    prune_llm_cache()
@@ -0,0 +1,171 @@
+import os
+import json
+import time
+import random
+import asyncio
+import weakref
+from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain_core.messages import HumanMessage
+from app.config import GEMINI_BASE_URL, LLM_CALL_TIMEOUT_SECONDS, LLM_MAX_CONCURRENCY, LLM_MAX_RETRIES, LLM_RETRY_BASE_SECONDS
+from app.services.llm_cache_service import llm_cache_key, get_cached_llm_result, set_cached_llm_result
+
+# Async access to Gemini for the async request handlers.
+# One long-lived client per configuration is shared by all calls (so HTTP
+# connections are reused), at most LLM_MAX_CONCURRENCY calls run at once per
+# event loop, every call has a deadline that covers its retries, and transient
+# failures are retried with jittered exponential backoff (outside the semaphore).
+
+LLM_MODEL = "gemini-2.5-flash"
+
+_clients = {}
+_semaphores = weakref.WeakKeyDictionary()
+_inflight = weakref.WeakKeyDictionary()
+
+def _api_key():
+    return os.getenv("GOOGLE_API_KEY") or os.getenv("GEMINI_API_KEY")
+
+def get_llm_client(json_mode: bool = False):
+    """
+    The shared Gemini client, or None if no API key is configured.
+    json_mode asks for structured JSON output (response_mime_type application/json).
+    """
+    api_key = _api_key()
+    if not api_key:
+        return None
+    key = (api_key, json_mode, GEMINI_BASE_URL)
+    if key not in _clients:
+        options = {"response_mime_type": "application/json"} if json_mode else {}
+        if GEMINI_BASE_URL:
+            options["base_url"] = GEMINI_BASE_URL
+        # Retries and deadlines are handled here, not by the client
+        _clients[key] = ChatGoogleGenerativeAI(
+            model=LLM_MODEL,
+            google_api_key=api_key,
+            max_retries=0,
+            timeout=LLM_CALL_TIMEOUT_SECONDS,
+            **options
+        )
+    return _clients[key]
+
+def _semaphore() -> asyncio.Semaphore:
+    # Semaphores belong to one event loop, so keep one per loop
+    loop = asyncio.get_running_loop()
+    if loop not in _semaphores:
+        _semaphores[loop] = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+    return _semaphores[loop]
+
+def parse_llm_json(text: str):
+    """
+    Parses a JSON reply, stripping a markdown code fence if the model added one.
+    """
+    json_str = text.strip()
+    if json_str.startswith("```json"):
+        json_str = json_str[7:-3]
+    elif json_str.startswith("```"):
+        json_str = json_str[3:-3]
+    return json.loads(json_str)
+
+def _is_transient(error: Exception) -> bool:
+    """
+    Whether a failed call is worth retrying: rate limiting (429), request timeouts
+    (408), server errors (5xx) and network failures (the HTTP client's errors wrap
+    an OSError). Authentication and invalid-request errors are not.
+    """
+    while error is not None:
+        code = getattr(error, "code", None)
+        if isinstance(code, int):
+            return code in (408, 429) or code >= 500
+        if isinstance(error, (OSError, asyncio.TimeoutError)):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+async def ainvoke_llm(prompt_text: str, json_mode: bool = False, timeout: float = LLM_CALL_TIMEOUT_SECONDS) -> str:
+    """
+    Sends one prompt and returns the reply text.
+    Retries transient failures (see _is_transient) up to LLM_MAX_RETRIES times with
+    full-jitter exponential backoff, all within `timeout` seconds. Raises the last
+    error (asyncio.TimeoutError when the deadline passes) and RuntimeError if no
+    API key is configured.
+    """
+    client = get_llm_client(json_mode)
+    if client is None:
+        raise RuntimeError("GOOGLE_API_KEY or GEMINI_API_KEY not found in environment variables.")
+
+    deadline = time.monotonic() + timeout
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        if deadline - time.monotonic() <= 0:
+            raise asyncio.TimeoutError(f"LLM call exceeded its {timeout}s deadline")
+        try:
+            async with _semaphore():
+                response = await asyncio.wait_for(
+                    client.ainvoke([HumanMessage(content=prompt_text)]), deadline - time.monotonic()
+                )
+            return response.content
+        except Exception as e:
+            backoff = random.uniform(0, LLM_RETRY_BASE_SECONDS * 2 ** attempt)
+            if attempt == LLM_MAX_RETRIES or not _is_transient(e) or time.monotonic() + backoff >= deadline:
+                raise
+            print(f"LLM call failed (attempt {attempt + 1}), retrying in {backoff:.2f}s: {e}")
+        # Back off without holding a concurrency slot
+        await asyncio.sleep(backoff)
+
+async def astream_llm(prompt_text: str, json_mode: bool = False, timeout: float = LLM_CALL_TIMEOUT_SECONDS):
+    """
+    Sends one prompt and yields the reply text piece by piece as it arrives.
+    The whole stream shares one `timeout` deadline; it is not retried, since pieces may
+    already have been passed on. Raises like ainvoke_llm().
+    """
+    client = get_llm_client(json_mode)
+    if client is None:
+        raise RuntimeError("GOOGLE_API_KEY or GEMINI_API_KEY not found in environment variables.")
+
+    deadline = time.monotonic() + timeout
+    async with _semaphore():
+        stream = client.astream([HumanMessage(content=prompt_text)]).__aiter__()
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError(f"LLM stream exceeded its {timeout}s deadline")
+                try:
+                    chunk = await asyncio.wait_for(stream.__anext__(), remaining)
+                except StopAsyncIteration:
+                    return
+                if chunk.text:
+                    yield chunk.text
+        finally:
+            await stream.aclose()
+
+async def aquery_llm_json(prompt_text: str, template: str = None, json_mode: bool = False):
+    """
+    Queries Gemini and returns the parsed JSON reply, or None on failure.
+    With a template name the LLM result cache is used and identical concurrent
+    calls on this event loop share one request.
+    """
+    if template is None:
+        try:
+            return parse_llm_json(await ainvoke_llm(prompt_text, json_mode))
+        except Exception as e:
+            print(f"Error querying Gemini: {e!r}")
+            return None
+
+    key = llm_cache_key(LLM_MODEL, template, prompt_text)
+    cached = get_cached_llm_result(key)
+    if cached is not None:
+        return cached
+
+    loop = asyncio.get_running_loop()
+    inflight = _inflight.setdefault(loop, {})
+    if key not in inflight:
+        async def call():
+            try:
+                result = await aquery_llm_json(prompt_text, json_mode=json_mode)
+                if result is not None:
+                    set_cached_llm_result(key, result)
+                return result
+            finally:
+                inflight.pop(key, None)
+        inflight[key] = asyncio.ensure_future(call())
+    # shield: one caller going away must not cancel the call for the others
+    return await asyncio.shield(inflight[key])
@@ -0,0 +1,138 @@
+import pymongo
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+from pymongo.errors import PyMongoError, BulkWriteError
+import pandas as pd
+from app.config import db, MONGO_STARTUP_PING_TIMEOUT_SECONDS
+from app.services.artifact_service import put_artifact, delete_artifact, retire_artifact
+from app.services.file_upload_service import summarize_analysis
+
+# Index definitions and batch write helpers for the MongoDB collections.
+# Lookups by file_path / job_id are on every request path, so they must never
+# fall back to a collection scan.
+
+INDEXES = {
+    "uploaded_files": [
+        ([("file_path", ASCENDING)], {"unique": True, "name": "file_path_unique"}),
+        ([("status", ASCENDING)], {"name": "status"}),
+        ([("processed_at", DESCENDING)], {"name": "processed_at"}),
+        # One live record per content: records of failed or vanished files
+        # drop their content_hash (see release_content_hash) and leave the index
+        ([("content_hash", ASCENDING)], {
+            "unique": True,
+            "name": "content_hash_unique",
+            "partialFilterExpression": {"content_hash": {"$type": "string"}}
+        })
+    ],
+    "analysis_jobs": [
+        ([("job_id", ASCENDING)], {"unique": True, "name": "job_id_unique"}),
+        ([("file_path", ASCENDING), ("queued_at", DESCENDING)], {"name": "file_path_queued_at"})
+    ],
+    "upload_sessions": [
+        ([("upload_id", ASCENDING)], {"unique": True, "name": "upload_id_unique"})
+    ]
+}
+
+def ensure_indexes() -> bool:
+    """
+    Creates the collection indexes if they do not exist yet (idempotent); called on startup.
+    Logs instead of failing when the DB is unreachable or an index cannot be built
+    (e.g. existing duplicate file_path records), so the API still starts.
+    Returns True if every index is in place.
+    The DB is pinged once with a short timeout first, so an unreachable server costs
+    MONGO_STARTUP_PING_TIMEOUT_SECONDS rather than a server-selection timeout per index.
+    """
+    try:
+        with pymongo.timeout(MONGO_STARTUP_PING_TIMEOUT_SECONDS):
+            db.command("ping")
+    except PyMongoError as e:
+        print(f"Database unreachable, skipping index creation: {e}")
+        return False
+
+    # Failed records written before content_hash became unique still hold their hash
+    try:
+        db.uploaded_files.update_many(
+            {"status": "failed", "content_hash": {"$exists": True}},
+            {"$rename": {"content_hash": "failed_content_hash"}}
+        )
+    except PyMongoError as e:
+        print(f"Could not release content hashes of failed files: {e}")
+
+    ok = True
+    for collection, indexes in INDEXES.items():
+        for keys, options in indexes:
+            try:
+                db[collection].create_index(keys, **options)
+            except PyMongoError as e:
+                print(f"Could not create index {options['name']} on {collection}: {e}")
+                ok = False
+    return ok
+
+def _bulk_result(result) -> dict:
+    return {
+        "matched": result.matched_count,
+        "modified": result.modified_count,
+        "upserted": result.upserted_count
+    }
+
+def bulk_upsert_files(records: list) -> dict:
+    """
+    Inserts or updates many file records in one round trip, keyed by file_path.
+    Each record is a dict with at least "file_path"; its other fields are $set.
+    Returns matched/modified/upserted counts.
+    """
+    operations = []
+    for record in records:
+        fields = {key: value for key, value in record.items() if key != "file_path"}
+        operations.append(UpdateOne({"file_path": record["file_path"]}, {"$set": fields}, upsert=True))
+    if not operations:
+        return {"matched": 0, "modified": 0, "upserted": 0}
+    # Unordered: one bad record does not stop the rest of the batch
+    return _bulk_result(db.uploaded_files.bulk_write(operations, ordered=False))
+
+def bulk_update_file_analysis(results: dict, status: str = "completed") -> dict:
+    """
+    Stores many analysis results in one round trip.
+    `results` maps file_path to {"analysis": ..., "source_signature": ...}.
+    Each analysis goes to the artifact store; the artifacts it replaces are retired
+    (deleted after a grace period). Artifacts of records that failed to write are
+    deleted again. Returns matched/modified/upserted counts.
+    """
+    if not results:
+        return {"matched": 0, "modified": 0, "upserted": 0}
+
+    previous = db.uploaded_files.find(
+        {"file_path": {"$in": list(results)}, "analysis_ref": {"$exists": True}},
+        {"_id": 0, "file_path": 1, "analysis_ref": 1}
+    )
+    previous_refs = {record["file_path"]: record["analysis_ref"] for record in previous}
+
+    processed_at = pd.Timestamp.now().isoformat()
+    records = [
+        {
+            "file_path": filename,
+            "analysis_ref": put_artifact("analysis", result["analysis"]),
+            "analysis_summary": summarize_analysis(result["analysis"]),
+            "source_signature": result.get("source_signature"),
+            "status": status,
+            "processed_at": processed_at
+        }
+        for filename, result in results.items()
+    ]
+    try:
+        counts = bulk_upsert_files(records)
+    except Exception as e:
+        # Unordered batch: only the records listed in the write errors were not stored
+        if isinstance(e, BulkWriteError):
+            failed = {error["index"] for error in e.details.get("writeErrors", [])}
+        else:
+            failed = set(range(len(records)))
+        for index in failed:
+            delete_artifact(records[index]["analysis_ref"])
+        for index, record in enumerate(records):
+            if index not in failed and record["file_path"] in previous_refs:
+                retire_artifact(previous_refs[record["file_path"]])
+        raise
+
+    for artifact_id in previous_refs.values():
+        retire_artifact(artifact_id)
+    return counts
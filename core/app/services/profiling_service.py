@@ -0,0 +1,313 @@
+import numpy as np
+import pandas as pd
+from app.services import sketches
+
+# Streaming column profiler.
+# A profile state is built up chunk by chunk with update_profile_state(), can be
+# merged with merge_profile_states(), and is turned into the same summary schema
+# as generate_statistical_summary() by finalize_profile_state().
+
+SAMPLE_SIZE = 5
+HEAD_ROWS = 100
+
+def new_profile_state() -> dict:
+    """
+    Creates an empty profile state.
+    """
+    return {"columns": {}, "rows": 0, "memory_bytes": 0, "head_rows": []}
+
+def _merge_dtype(current: str, new: str) -> str:
+    """
+    Combines the dtypes pandas inferred for the same column in different chunks of
+    the same kind (numeric or not), following the promotion pandas would apply.
+    """
+    if current is None or current == new:
+        return new
+    try:
+        current_dtype, new_dtype = np.dtype(current), np.dtype(new)
+    except TypeError:
+        return "object"
+    numeric_kinds = "iuf"
+    if current_dtype.kind in numeric_kinds and new_dtype.kind in numeric_kinds:
+        return str(np.result_type(current_dtype, new_dtype))
+    return "object"
+
+def _new_column_state() -> dict:
+    """
+    Creates the accumulators for one column.
+    """
+    return {
+        "dtype": None,
+        "pinned": False,
+        "missing": 0,
+        "coerced": 0,
+        "count": 0,
+        "moments": {"n": 0, "mean": 0.0, "m2": 0.0},
+        "min": None,
+        "max": None,
+        "samples": [],
+        "distinct": sketches.hll_new(),
+        "quantiles": sketches.kll_new(),
+        "top": sketches.topk_new()
+    }
+
+def _merge_moments(moments: dict, other: dict) -> dict:
+    """
+    Merges two count/mean/M2 accumulators (Chan et al. parallel form of Welford's algorithm).
+    """
+    total = moments["n"] + other["n"]
+    if total == 0:
+        return dict(moments)
+    delta = other["mean"] - moments["mean"]
+    return {
+        "n": total,
+        "mean": moments["mean"] + delta * other["n"] / total,
+        "m2": moments["m2"] + other["m2"] + delta * delta * moments["n"] * other["n"] / total
+    }
+
+def _is_numeric(dtype) -> bool:
+    """
+    True for dtypes profiled with numeric stats (describe() treats bools as categorical).
+    """
+    try:
+        dtype = pd.api.types.pandas_dtype(dtype)
+    except TypeError:
+        return False
+    return pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype)
+
+def _as_text(series: pd.Series) -> pd.Series:
+    """
+    Non-null values as the text a CSV reader would have kept for them
+    (whole floats without the ".0" pandas adds when a column has gaps).
+    """
+    values = series.dropna()
+    if pd.api.types.is_float_dtype(values.dtype) and len(values) and bool((values % 1 == 0).all()):
+        values = values.astype("int64")
+    return values.astype(str).reindex(series.index).astype(object)
+
+def _conform_series(series: pd.Series, col_state: dict) -> pd.Series:
+    """
+    Pins a column to the kind (numeric or not) of the first chunk that has values for it,
+    so every accumulator and sketch of the column sees one kind of value. Chunks of the
+    other kind are converted: text that does not parse as a number becomes missing (and is
+    counted in `coerced`), numbers in a text column become text.
+    """
+    dtype = str(series.dtype)
+    if not col_state["pinned"]:
+        has_values = bool(series.notna().any())
+        if has_values or col_state["dtype"] is None:
+            col_state["dtype"] = dtype
+        col_state["pinned"] = has_values
+        return series
+    if _is_numeric(col_state["dtype"]) == _is_numeric(series.dtype):
+        col_state["dtype"] = _merge_dtype(col_state["dtype"], dtype)
+        return series
+    if _is_numeric(col_state["dtype"]):
+        converted = pd.to_numeric(series, errors="coerce")
+        col_state["coerced"] += int(series.notna().sum() - converted.notna().sum())
+        return converted
+    return _as_text(series)
+
+def update_profile_state(state: dict, chunk: pd.DataFrame, track_memory: bool = True):
+    """
+    Folds one chunk of rows into the profile state in place.
+    track_memory=False skips the (deep, hence costly) memory accounting when the
+    caller already knows the size of the data.
+    """
+    if len(state["head_rows"]) < HEAD_ROWS:
+        state["head_rows"].extend(head_records(chunk, HEAD_ROWS - len(state["head_rows"])))
+
+    state["rows"] += len(chunk)
+    if track_memory:
+        state["memory_bytes"] += int(chunk.memory_usage(deep=True).sum())
+
+    for col in chunk.columns:
+        col_state = state["columns"].setdefault(col, _new_column_state())
+        series = _conform_series(chunk[col], col_state)
+
+        non_null = series.dropna()
+        col_state["missing"] += len(series) - len(non_null)
+        col_state["count"] += len(non_null)
+
+        if len(col_state["samples"]) < SAMPLE_SIZE:
+            for value in non_null.unique()[:SAMPLE_SIZE].tolist():
+                if value not in col_state["samples"] and len(col_state["samples"]) < SAMPLE_SIZE:
+                    col_state["samples"].append(value)
+
+        if _is_numeric(series.dtype):
+            if len(non_null):
+                values = non_null.to_numpy(dtype=np.float64)
+                sketches.hll_add(col_state["distinct"], sketches.hash_values(values))
+                mean = float(values.mean())
+                col_state["moments"] = _merge_moments(
+                    col_state["moments"],
+                    {"n": len(values), "mean": mean, "m2": float(((values - mean) ** 2).sum())}
+                )
+                chunk_min, chunk_max = float(values.min()), float(values.max())
+                col_state["min"] = chunk_min if col_state["min"] is None else min(col_state["min"], chunk_min)
+                col_state["max"] = chunk_max if col_state["max"] is None else max(col_state["max"], chunk_max)
+                sketches.kll_add(col_state["quantiles"], values)
+        else:
+            # One hash pass serves both sketches: HLL only needs the distinct values
+            counts = non_null.value_counts()
+            sketches.hll_add(col_state["distinct"], sketches.hash_values(counts.index.to_numpy()))
+            sketches.topk_add_counts(col_state["top"], counts)
+
+def _values_as_missing(col_state: dict) -> dict:
+    """
+    A column state whose non-null values are all counted as coerced to missing.
+    """
+    empty = _new_column_state()
+    empty["dtype"] = col_state["dtype"]
+    empty["missing"] = col_state["missing"] + col_state["count"]
+    empty["coerced"] = col_state["coerced"] + col_state["count"]
+    return empty
+
+def merge_profile_states(a: dict, b: dict) -> dict:
+    """
+    Merges two profile states (e.g. built from different chunks or files) into a new one.
+    Head rows are taken from `a` first. A column that is numeric in one state and not in
+    the other keeps the kind of `a`; the values from `b` then count as coerced to missing.
+    """
+    merged = new_profile_state()
+    merged["rows"] = a["rows"] + b["rows"]
+    merged["memory_bytes"] = a["memory_bytes"] + b["memory_bytes"]
+    merged["head_rows"] = (a["head_rows"] + b["head_rows"])[:HEAD_ROWS]
+
+    for col in list(a["columns"]) + [c for c in b["columns"] if c not in a["columns"]]:
+        left = a["columns"].get(col) or _new_column_state()
+        right = b["columns"].get(col) or _new_column_state()
+        if left["pinned"] and right["pinned"] and _is_numeric(left["dtype"]) != _is_numeric(right["dtype"]):
+            right = _values_as_missing(right)
+        col_state = _new_column_state()
+        pinned = [side for side in (left, right) if side["pinned"]]
+        if len(pinned) == 2:
+            col_state["dtype"] = _merge_dtype(left["dtype"], right["dtype"])
+        else:
+            col_state["dtype"] = (pinned or [left])[0]["dtype"] or right["dtype"]
+        col_state["pinned"] = bool(pinned)
+        col_state["missing"] = left["missing"] + right["missing"]
+        col_state["coerced"] = left["coerced"] + right["coerced"]
+        col_state["count"] = left["count"] + right["count"]
+        col_state["moments"] = _merge_moments(left["moments"], right["moments"])
+        mins = [v for v in (left["min"], right["min"]) if v is not None]
+        maxs = [v for v in (left["max"], right["max"]) if v is not None]
+        col_state["min"] = min(mins) if mins else None
+        col_state["max"] = max(maxs) if maxs else None
+        col_state["samples"] = (left["samples"] + [v for v in right["samples"] if v not in left["samples"]])[:SAMPLE_SIZE]
+        col_state["distinct"] = sketches.hll_merge(left["distinct"], right["distinct"])
+        col_state["quantiles"] = sketches.kll_merge(left["quantiles"], right["quantiles"])
+        col_state["top"] = sketches.topk_merge(left["top"], right["top"])
+        merged["columns"][col] = col_state
+
+    return merged
+
+def json_safe_value(value):
+    """
+    Converts numpy/pandas scalars (including timestamps) to plain JSON-serializable values.
+    """
+    if isinstance(value, (pd.Timestamp, pd.Timedelta)):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+def json_safe_records(df: pd.DataFrame) -> list:
+    """
+    Rows as JSON-safe records, with missing values as None.
+    Works for categorical, datetime and Arrow-backed columns alike.
+    """
+    rows = df.astype(object)
+    rows = rows.where(rows.notna(), None)
+    return [
+        {col: json_safe_value(value) for col, value in row.items()}
+        for row in rows.to_dict(orient="records")
+    ]
+
+def head_records(df: pd.DataFrame, limit: int = HEAD_ROWS) -> list:
+    """
+    First `limit` rows as JSON-safe records (see json_safe_records()).
+    """
+    return json_safe_records(df.head(limit))
+
+def profile_dataframe(df: pd.DataFrame, chunk_rows: int = 100000) -> dict:
+    """
+    Builds a profile state for an in-memory DataFrame by folding it in slices,
+    so sketches replace the sorts and hash tables of describe()/nunique().
+    """
+    state = new_profile_state()
+    for start in range(0, len(df), chunk_rows):
+        update_profile_state(state, df.iloc[start:start + chunk_rows], track_memory=False)
+    return state
+
+def _column_error_bounds(col_state: dict, numeric: bool) -> dict:
+    """
+    Error bounds of the sketched statistics of one column.
+    """
+    bounds = {"unique_values_relative_error": round(sketches.hll_relative_error(col_state["distinct"]), 4)}
+    if numeric:
+        bounds["quantile_rank_error"] = round(sketches.kll_rank_error(col_state["quantiles"]), 6)
+    else:
+        bounds["freq_max_undercount"] = int(col_state["top"]["error"])
+    if col_state["coerced"]:
+        bounds["coerced_to_missing"] = int(col_state["coerced"])
+    return bounds
+
+def finalize_profile_state(state: dict) -> dict:
+    """
+    Turns a profile state into {'metadata', 'summary', 'memory_usage_mb', 'head_rows', 'row_count',
+    'summary_error_bounds'}, using the same per-column keys as generate_statistical_summary().
+    summary_error_bounds holds, per column, the standard relative error of unique_values,
+    the worst-case normalized rank error of the quartiles and the maximum undercount of freq,
+    plus the number of values that did not match the column's kind and were counted as
+    missing (coerced_to_missing), if any.
+    """
+    metadata = {}
+    summary = {}
+    error_bounds = {}
+
+    for col, col_state in state["columns"].items():
+        dtype = col_state["dtype"] or "object"
+        metadata[col] = dtype
+        col_summary = {}
+        distinct = int(round(sketches.hll_estimate(col_state["distinct"])))
+
+        if _is_numeric(dtype):
+            moments = col_state["moments"]
+            if moments["n"]:
+                q25, q50, q75 = sketches.kll_quantiles(col_state["quantiles"], [0.25, 0.5, 0.75])
+                col_summary["count"] = float(moments["n"])
+                col_summary["mean"] = moments["mean"]
+                if moments["n"] > 1:
+                    col_summary["std"] = float(np.sqrt(moments["m2"] / (moments["n"] - 1)))
+                col_summary["min"] = col_state["min"]
+                col_summary["25%"] = q25
+                col_summary["50%"] = q50
+                col_summary["75%"] = q75
+                col_summary["max"] = col_state["max"]
+            else:
+                col_summary["count"] = 0.0
+        else:
+            col_summary["count"] = col_state["count"]
+            if col_state["count"]:
+                col_summary["unique"] = distinct
+            # An all-distinct column can leave the Misra-Gries summary empty
+            most_common = sketches.topk_most_common(col_state["top"])
+            if most_common:
+                col_summary["top"] = json_safe_value(most_common[0][0])
+                col_summary["freq"] = int(most_common[0][1])
+
+        col_summary["missing_values"] = int(col_state["missing"])
+        col_summary["unique_values"] = distinct
+        col_summary["samples"] = [json_safe_value(v) for v in col_state["samples"]]
+        summary[col] = col_summary
+        error_bounds[col] = _column_error_bounds(col_state, _is_numeric(dtype))
+
+    return {
+        "metadata": metadata,
+        "summary": summary,
+        "memory_usage_mb": round(state["memory_bytes"] / (1024 * 1024), 2),
+        "head_rows": state["head_rows"],
+        "row_count": state["rows"],
+        "summary_error_bounds": error_bounds
+    }
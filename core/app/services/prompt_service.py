@@ -0,0 +1,148 @@
+import re
+import json
+import math
+from app.config import LLM_PROMPT_TOKEN_BUDGET
+
+# Compact, token-budgeted serialization of a file profile for LLM prompts.
+# Columns are ranked by how useful they are for charts and insights, each is
+# written as one minified JSON line with rounded numbers and without stats the
+# model can derive (count, duplicate distinct counts, numeric samples), and
+# columns that do not fit the budget are listed by name only.
+
+CHARS_PER_TOKEN = 4
+SIGNIFICANT_DIGITS = 4
+MAX_SAMPLES = 3
+MAX_TEXT_CHARS = 32
+TEMPORAL_NAME_PATTERN = re.compile(r"date|time|timestamp|_at$", re.IGNORECASE)
+# "id", "user_id", "order key", "uuid", camelCase "userId" / "RowID"
+ID_NAME_PATTERN = re.compile(r"(?i:(^|[_\s])(id|uuid|key)$)|[a-z](Id|ID)$")
+
+# Summary keys renamed to shorter ones in the compact form
+STAT_NAMES = {
+    "mean": "mean", "std": "std", "min": "min", "25%": "p25", "50%": "p50", "75%": "p75", "max": "max",
+    "unique": "unique", "top": "top", "freq": "freq", "first": "first", "last": "last"
+}
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count of a prompt fragment (about 4 characters per token).
+    """
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+def _compact_value(value):
+    """
+    Rounds floats to a few significant digits and truncates long strings.
+    """
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, float):
+        if not math.isfinite(value):
+            return str(value)
+        rounded = float(f"{value:.{SIGNIFICANT_DIGITS}g}")
+        return int(rounded) if rounded.is_integer() else rounded
+    if isinstance(value, str) and len(value) > MAX_TEXT_CHARS:
+        return value[:MAX_TEXT_CHARS] + "…"
+    return value
+
+def _is_numeric_summary(stats: dict) -> bool:
+    return "mean" in stats
+
+def _column_score(name: str, dtype: str, stats: dict, row_count: int) -> float:
+    """
+    Relevance of a column for the prompt: numeric and temporal columns and
+    low-cardinality categories first; ID-like, constant and mostly empty columns last.
+    """
+    rows = row_count or (stats.get("count", 0) + stats.get("missing_values", 0)) or 1
+    score = 1.0 - min(stats.get("missing_values", 0) / rows, 1.0)
+    distinct = stats.get("unique_values", stats.get("unique", 0))
+    temporal = "datetime" in str(dtype) or bool(TEMPORAL_NAME_PATTERN.search(str(name)))
+
+    numeric = _is_numeric_summary(stats)
+    # Free text or identifiers: little to chart or aggregate on. Numbers that are
+    # (nearly) all distinct count as identifiers only if integral or named like one,
+    # so continuous measures keep their numeric bonus.
+    id_like = bool(distinct) and distinct >= 0.95 * rows and (
+        not numeric or "int" in str(dtype).lower() or bool(ID_NAME_PATTERN.search(str(name)))
+    )
+
+    if temporal:
+        score += 0.75
+    elif id_like:
+        score *= 0.3
+    elif numeric:
+        score += 0.5
+    elif distinct and distinct <= 50:
+        score += 0.25
+    if distinct is not None and distinct <= 1:
+        score *= 0.1
+    return score
+
+def compact_column(name: str, dtype: str, stats: dict) -> dict:
+    """
+    Compact form of one column's summary.
+    """
+    column = {"col": name, "type": str(dtype)}
+    for key, short in STAT_NAMES.items():
+        if key in stats and stats[key] is not None:
+            column[short] = _compact_value(stats[key])
+    if column.get("freq") == 1:
+        # Every value is distinct: the "most frequent" value says nothing
+        column.pop("top", None)
+        column.pop("freq")
+    if "unique" not in column and stats.get("unique_values") is not None:
+        column["unique"] = stats["unique_values"]
+    if stats.get("missing_values"):
+        column["missing"] = stats["missing_values"]
+    if not _is_numeric_summary(stats) and stats.get("samples") and column.get("unique", 0) > 1:
+        column["samples"] = [_compact_value(v) for v in stats["samples"][:MAX_SAMPLES]]
+    return column
+
+def compact_profile(analysis_result: dict, token_budget: int = LLM_PROMPT_TOKEN_BUDGET) -> dict:
+    """
+    Serializes the metadata and summary of an analysis result within token_budget.
+    Returns {"text", "estimated_tokens", "columns_included", "columns_total"}; text
+    holds one JSON object per column, most relevant columns first, followed by the
+    names of the columns left out.
+    """
+    metadata = analysis_result.get("metadata", {}) or {}
+    summary = analysis_result.get("summary", {}) or {}
+    row_count = analysis_result.get("row_count")
+    names = list(metadata) + [name for name in summary if name not in metadata]
+
+    ranked = sorted(
+        names,
+        key=lambda name: _column_score(name, metadata.get(name, ""), summary.get(name, {}), row_count),
+        reverse=True
+    )
+
+    header = f"rows: {row_count}\n" if row_count is not None else ""
+    lines = [header] if header else []
+    used = estimate_tokens(header)
+    included = 0
+    for name in ranked:
+        line = json.dumps(compact_column(name, metadata.get(name, ""), summary.get(name, {})), separators=(",", ":"), default=str) + "\n"
+        cost = estimate_tokens(line)
+        if used + cost > token_budget:
+            break
+        lines.append(line)
+        used += cost
+        included += 1
+
+    omitted = ranked[included:]
+    if omitted:
+        note = f"omitted columns ({len(omitted)}): "
+        for name in omitted:
+            addition = f"{name}, "
+            if used + estimate_tokens(note + addition) > token_budget:
+                note += "…"
+                break
+            note += addition
+        lines.append(note.rstrip(", ") + "\n")
+
+    text = "".join(lines)
+    return {
+        "text": text,
+        "estimated_tokens": estimate_tokens(text),
+        "columns_included": included,
+        "columns_total": len(names)
+    }
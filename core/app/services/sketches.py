@@ -0,0 +1,217 @@
+import copy
+import numpy as np
+import pandas as pd
+
+# Mergeable summary sketches used by the streaming profiler.
+# Every sketch is a plain dict of numpy arrays / Python values so it can be
+# pickled to worker processes and merged across chunks or files.
+
+HLL_PRECISION = 12
+KLL_CAPACITY = 512
+TOPK_CAPACITY = 64
+
+def hash_values(values: np.ndarray) -> np.ndarray:
+    """
+    Returns stable 64-bit hashes for an array of non-null values.
+    Callers pass numeric values as float64 so 1 and 1.0 from different chunks collide.
+    """
+    return pd.util.hash_array(np.asarray(values))
+
+# --- HyperLogLog (approximate distinct count) ---
+
+def hll_new(precision: int = HLL_PRECISION) -> dict:
+    """
+    Creates an empty HyperLogLog sketch with 2**precision registers.
+    """
+    return {"p": precision, "registers": np.zeros(1 << precision, dtype=np.uint8)}
+
+def hll_add(sketch: dict, hashes: np.ndarray):
+    """
+    Adds pre-computed 64-bit hashes to the sketch in place.
+    """
+    if len(hashes) == 0:
+        return
+    p = sketch["p"]
+    index = (hashes >> np.uint64(64 - p)).astype(np.int64)
+    # Rank = position of the first set bit in the next 32 bits after the index bits
+    remainder = ((hashes >> np.uint64(32 - p)) & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    bit_length = np.where(remainder > 0, np.floor(np.log2(np.maximum(remainder, 1))) + 1, 0)
+    rank = (33 - bit_length).astype(np.uint8)
+    np.maximum.at(sketch["registers"], index, rank)
+
+def hll_merge(a: dict, b: dict) -> dict:
+    """
+    Merges two sketches of the same precision into a new sketch.
+    """
+    return {"p": a["p"], "registers": np.maximum(a["registers"], b["registers"])}
+
+def hll_estimate(sketch: dict) -> float:
+    """
+    Estimates the number of distinct values, with linear counting for small cardinalities.
+    """
+    registers = sketch["registers"]
+    m = len(registers)
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / np.sum(np.power(2.0, -registers.astype(np.float64)))
+    zeros = int(np.count_nonzero(registers == 0))
+    if estimate <= 2.5 * m and zeros > 0:
+        estimate = m * np.log(m / zeros)
+    return float(estimate)
+
+def hll_relative_error(sketch: dict) -> float:
+    """
+    Standard error of the HyperLogLog estimate.
+    """
+    return 1.04 / np.sqrt(len(sketch["registers"]))
+
+# --- KLL-style compactor sketch (approximate quantiles) ---
+
+def kll_new(capacity: int = KLL_CAPACITY, seed: int = 0) -> dict:
+    """
+    Creates an empty quantile sketch. Level h holds items of weight 2**h.
+    Compactions draw from the sketch's own generator, so the same input always
+    gives the same sketch.
+    """
+    return {"k": capacity, "levels": [np.empty(0)], "n": 0, "error_weight": 0, "rng": np.random.default_rng(seed)}
+
+def _kll_compact(sketch: dict):
+    """
+    Halves every over-full level, promoting every other sorted item to the next level.
+    Each compaction at level h shifts any rank by at most 2**h, which is tracked
+    in error_weight to give a deterministic error bound.
+    """
+    h = 0
+    while h < len(sketch["levels"]):
+        level = sketch["levels"][h]
+        if len(level) > sketch["k"]:
+            level = np.sort(level)
+            # Keep one item back if the level is odd so the weights stay exact
+            leftover = level[:1] if len(level) % 2 else level[:0]
+            level = level[len(leftover):]
+            offset = int(sketch["rng"].integers(2))
+            promoted = level[offset::2]
+            sketch["levels"][h] = leftover
+            if h + 1 == len(sketch["levels"]):
+                sketch["levels"].append(np.empty(0))
+            sketch["levels"][h + 1] = np.concatenate([sketch["levels"][h + 1], promoted])
+            sketch["error_weight"] += 1 << h
+        h += 1
+
+def kll_add(sketch: dict, values: np.ndarray):
+    """
+    Adds numeric values to the sketch in place.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) == 0:
+        return
+    sketch["levels"][0] = np.concatenate([sketch["levels"][0], values])
+    sketch["n"] += len(values)
+    _kll_compact(sketch)
+
+def kll_merge(a: dict, b: dict) -> dict:
+    """
+    Merges two quantile sketches into a new sketch.
+    """
+    depth = max(len(a["levels"]), len(b["levels"]))
+    levels = []
+    for h in range(depth):
+        level_a = a["levels"][h] if h < len(a["levels"]) else np.empty(0)
+        level_b = b["levels"][h] if h < len(b["levels"]) else np.empty(0)
+        levels.append(np.concatenate([level_a, level_b]))
+    merged = {
+        "k": a["k"],
+        "levels": levels,
+        "n": a["n"] + b["n"],
+        "error_weight": a["error_weight"] + b["error_weight"],
+        "rng": copy.deepcopy(a["rng"])
+    }
+    _kll_compact(merged)
+    return merged
+
+def kll_quantiles(sketch: dict, quantiles: list) -> list:
+    """
+    Returns approximate values at the given quantiles (0..1), or None for an empty sketch.
+    """
+    if sketch["n"] == 0:
+        return [None for _ in quantiles]
+    items = np.concatenate(sketch["levels"])
+    weights = np.concatenate([np.full(len(level), 1 << h) for h, level in enumerate(sketch["levels"])])
+    order = np.argsort(items, kind="mergesort")
+    items, cumulative = items[order], np.cumsum(weights[order])
+    total = cumulative[-1]
+    results = []
+    for q in quantiles:
+        # Linear interpolation between neighbouring items, matching pandas' default
+        position = q * (total - 1)
+        lower = int(np.searchsorted(cumulative, np.floor(position) + 1))
+        upper = int(np.searchsorted(cumulative, np.ceil(position) + 1))
+        fraction = position - np.floor(position)
+        results.append(float(items[lower] + (items[upper] - items[lower]) * fraction))
+    return results
+
+def kll_rank_error(sketch: dict) -> float:
+    """
+    Upper bound on the normalized rank error of any quantile returned by the sketch.
+    """
+    return sketch["error_weight"] / sketch["n"] if sketch["n"] else 0.0
+
+# --- Misra-Gries (approximate top-k frequencies) ---
+
+def topk_new(capacity: int = TOPK_CAPACITY) -> dict:
+    """
+    Creates an empty Misra-Gries summary tracking at most `capacity` counters.
+    """
+    return {"k": capacity, "counters": {}, "n": 0, "error": 0}
+
+def _topk_trim(sketch: dict):
+    """
+    Reduces the summary back to k counters by subtracting the (k+1)-th largest count.
+    Every reported frequency underestimates the true one by at most `error`.
+    """
+    counters = sketch["counters"]
+    if len(counters) <= sketch["k"]:
+        return
+    counts = sorted(counters.values(), reverse=True)
+    decrement = counts[sketch["k"]]
+    sketch["counters"] = {value: count - decrement for value, count in counters.items() if count > decrement}
+    sketch["error"] += decrement
+
+def topk_add(sketch: dict, series: pd.Series):
+    """
+    Adds the non-null values of a Series to the summary in place.
+    """
+    topk_add_counts(sketch, series.value_counts(dropna=True))
+
+def topk_add_counts(sketch: dict, counts: pd.Series):
+    """
+    Adds pre-computed value counts (as returned by value_counts(), sorted descending)
+    to the summary in place.
+    """
+    sketch["n"] += int(counts.sum())
+    # Reduce the chunk to its own k-counter summary first (vectorized) so only
+    # k values are merged in Python, even for high-cardinality columns
+    if len(counts) > sketch["k"]:
+        decrement = int(counts.iloc[sketch["k"]])
+        counts = counts[counts > decrement] - decrement
+        sketch["error"] += decrement
+    counters = sketch["counters"]
+    for value, count in counts.items():
+        counters[value] = counters.get(value, 0) + int(count)
+    _topk_trim(sketch)
+
+def topk_merge(a: dict, b: dict) -> dict:
+    """
+    Merges two summaries into a new one (counts add, then trim back to k).
+    """
+    counters = dict(a["counters"])
+    for value, count in b["counters"].items():
+        counters[value] = counters.get(value, 0) + count
+    merged = {"k": a["k"], "counters": counters, "n": a["n"] + b["n"], "error": a["error"] + b["error"]}
+    _topk_trim(merged)
+    return merged
+
+def topk_most_common(sketch: dict, limit: int = 1) -> list:
+    """
+    Returns up to `limit` (value, estimated_count) pairs ordered by estimated count.
+    """
+    return sorted(sketch["counters"].items(), key=lambda item: item[1], reverse=True)[:limit]
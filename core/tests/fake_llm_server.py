@@ -0,0 +1,131 @@
+import sys
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for the Gemini generateContent / streamGenerateContent API, for tests
+# and offline development.
+# Point the app at it with GEMINI_BASE_URL=http://127.0.0.1:<port> (any GEMINI_API_KEY):
+#     python tests/fake_llm_server.py 8089
+
+CANNED_REPLIES = [
+    ("Plan a dashboard", {
+        "rules": [{"type": "bar", "title": "Fake chart", "x": "x", "y": "y", "description": "Fake rule"}],
+        "insights": {"summary": "Fake summary.", "trends": ["Fake trend"], "data_quality": {"score": 100, "alerts": []}, "stat_highlights": []},
+        "aggregations": [{"title": "Fake aggregation", "group_by": ["x"], "aggregations": {"y": "mean"}, "description": "Fake"}]
+    }),
+    ("aggregation queries", [{"title": "Fake aggregation", "group_by": ["x"], "aggregations": {"y": "mean"}, "description": "Fake"}]),
+    ("visualizations", [{"type": "bar", "title": "Fake chart", "x": "x", "y": "y", "description": "Fake rule"}]),
+    ("comprehensive analysis", {"summary": "Fake summary.", "trends": ["Fake trend"], "data_quality": {"score": 100, "alerts": []}, "stat_highlights": []})
+]
+
+def canned_reply(prompt_text: str) -> str:
+    """
+    Default responder: a plausible JSON reply chosen by the kind of prompt.
+    """
+    for marker, reply in CANNED_REPLIES:
+        if marker in prompt_text:
+            return json.dumps(reply)
+    return "{}"
+
+def _response_payload(prompt_text: str, text: str, finish_reason) -> dict:
+    candidate = {"content": {"parts": [{"text": text}], "role": "model"}, "index": 0}
+    if finish_reason:
+        candidate["finishReason"] = finish_reason
+    return {
+        "candidates": [candidate],
+        "usageMetadata": {"promptTokenCount": len(prompt_text) // 4, "candidatesTokenCount": 1, "totalTokenCount": len(prompt_text) // 4 + 1}
+    }
+
+# Error statuses the fake server can answer with, as the Gemini API reports them
+FAILURE_STATUSES = {
+    400: "INVALID_ARGUMENT",
+    403: "PERMISSION_DENIED",
+    429: "RESOURCE_EXHAUSTED",
+    500: "INTERNAL",
+    503: "UNAVAILABLE"
+}
+
+class _FakeGeminiHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        prompt_text = "".join(
+            part.get("text", "") for content in body.get("contents", []) for part in content.get("parts", [])
+        )
+        with server.lock:
+            server.prompts.append(prompt_text)
+            fail = server.failures_left > 0
+            if fail:
+                server.failures_left -= 1
+
+        if server.delay:
+            time.sleep(server.delay)
+        if fail:
+            status = server.failure_status
+            self._send(status, {"error": {"code": status, "message": "Fake failure", "status": FAILURE_STATUSES[status]}})
+            return
+
+        reply = server.responder(prompt_text)
+        if ":streamGenerateContent" in self.path:
+            self._send_stream(prompt_text, reply)
+            return
+        self._send(200, _response_payload(prompt_text, reply, "STOP"))
+
+    def _send_stream(self, prompt_text: str, reply: str):
+        # alt=sse framing: one "data: <GenerateContentResponse>" event per piece
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        pieces = [reply[i:i + self.server.stream_chunk_chars] for i in range(0, len(reply), self.server.stream_chunk_chars)] or [""]
+        for i, piece in enumerate(pieces):
+            finish_reason = "STOP" if i == len(pieces) - 1 else None
+            self.wfile.write(f"data: {json.dumps(_response_payload(prompt_text, piece, finish_reason))}\r\n\r\n".encode("utf-8"))
+            self.wfile.flush()
+            if self.server.stream_delay and finish_reason is None:
+                time.sleep(self.server.stream_delay)
+        self.close_connection = True
+
+    def _send(self, status: int, payload: dict):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_fake_llm_server(responder=canned_reply, delay: float = 0.0, failures: int = 0, port: int = 0,
+                          stream_chunk_chars: int = 16, stream_delay: float = 0.0, failure_status: int = 503):
+    """
+    Starts the fake server on a background thread and returns it; its base URL is server.base_url.
+    responder(prompt_text) -> reply text; every request waits `delay` seconds and the
+    first `failures` requests get a `failure_status` error (503 by default).
+    Prompts received are recorded in server.prompts.
+    Streamed replies are sent in pieces of `stream_chunk_chars`, `stream_delay` seconds apart.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), _FakeGeminiHandler)
+    server.daemon_threads = True
+    server.responder = responder
+    server.delay = delay
+    server.failures_left = failures
+    server.failure_status = failure_status
+    server.prompts = []
+    server.stream_chunk_chars = stream_chunk_chars
+    server.stream_delay = stream_delay
+    server.lock = threading.Lock()
+    server.base_url = f"http://127.0.0.1:{server.server_port}"
+    threading.Thread(target=server.serve_forever, name="fake-llm-server", daemon=True).start()
+    return server
+
+def stop_fake_llm_server(server):
+    server.shutdown()
+    server.server_close()
+
+if __name__ == "__main__":
+    fake_server = start_fake_llm_server(port=int(sys.argv[1]) if len(sys.argv) > 1 else 8089)
+    print(f"Fake LLM server listening on {fake_server.base_url}")
+    threading.Event().wait()
@@ -2,7 +2,9 @@
 import pytest
 import pandas as pd
 import numpy as np
-from app.services.ai_service import extract_metadata, generate_statistical_summary
+import os
+import gzip
+from app.services.ai_service import detect_file_format, extract_metadata, generate_statistical_summary, get_cached_dataframe, invalidate_dataframe_cache, get_dataframe_cache_stats, load_dataframe, write_columnar_sidecar, get_columnar_sidecar_path, optimize_dataframe_dtypes, analyze_file, execute_aggregation_rule, detect_anomalies, detect_anomalies_by_group, detect_file_anomalies
 
 def test_extract_metadata():
     df = pd.DataFrame({
@@ -46,3 +48,229 @@ def test_generate_statistical_summary_with_nulls():
     # Count in describe() usually excludes NaNs, so count should be 2
     assert summary['A']['count'] == 2
     assert summary['A']['missing_values'] == 1
+
+def test_get_cached_dataframe_hits_and_invalidates(tmp_path):
+    file_path = tmp_path / "cached.csv"
+    file_path.write_text("A,B\n1,x\n2,y\n")
+    invalidate_dataframe_cache()
+    before = get_dataframe_cache_stats()
+
+    first = get_cached_dataframe(str(file_path))
+    second = get_cached_dataframe(str(file_path))
+    stats = get_dataframe_cache_stats()
+    assert first is second
+    assert stats['misses'] == before['misses'] + 1
+    assert stats['hits'] == before['hits'] + 1
+
+    # A rewritten file has a new mtime/size and must be parsed again
+    file_path.write_text("A,B\n1,x\n2,y\n3,z\n")
+    os.utime(file_path, ns=(0, 10**9))
+    assert len(get_cached_dataframe(str(file_path))) == 3
+
+    invalidate_dataframe_cache(str(file_path))
+    assert get_dataframe_cache_stats()['entries'] == 0
+
+def test_load_dataframe_prefers_columnar_sidecar(tmp_path):
+    file_path = tmp_path / "sensors.csv"
+    file_path.write_text("DeviceID,Temperature,Status\nd1,20.5,ok\nd2,21.0,ok\n")
+    df = load_dataframe(str(file_path))
+
+    sidecar_path = write_columnar_sidecar(str(file_path), df)
+    assert sidecar_path == get_columnar_sidecar_path(str(file_path))
+    assert os.path.exists(sidecar_path)
+
+    # Column-pruned read from the sidecar; unknown columns are left out
+    pruned = load_dataframe(str(file_path), columns=["Temperature", "Missing"])
+    assert list(pruned.columns) == ["Temperature"]
+    assert pruned['Temperature'].dtype == 'float64'
+
+    # A source file modified after the sidecar was written is parsed again
+    file_path.write_text("DeviceID,Temperature,Status\nd1,20.5,ok\n")
+    os.utime(file_path, (os.path.getmtime(sidecar_path) + 10,) * 2)
+    assert len(load_dataframe(str(file_path))) == 1
+
+def test_detect_file_format_csv_variants(tmp_path):
+    semicolon = tmp_path / "export_no_ext"
+    semicolon.write_text("A;B\n1;x\n2;y\n")
+    detected = detect_file_format(str(semicolon))
+    assert detected['format'] == 'csv'
+    assert detected['delimiter'] == ';'
+    assert list(load_dataframe(str(semicolon)).columns) == ['A', 'B']
+
+    compressed = tmp_path / "export.csv.gz"
+    with gzip.open(compressed, "wt") as f:
+        f.write("A,B\n1,x\n2,y\n")
+    detected = detect_file_format(str(compressed))
+    assert detected['format'] == 'csv'
+    assert detected['compression'] == 'gzip'
+    assert len(load_dataframe(str(compressed))) == 2
+
+def test_detect_file_format_json_and_excel(tmp_path):
+    records = tmp_path / "records.json"
+    records.write_text('[{"A": 1}, {"A": 2}]')
+    assert detect_file_format(str(records)) == {'format': 'json', 'compression': None, 'encoding': 'utf-8', 'lines': False}
+    assert len(load_dataframe(str(records))) == 2
+
+    json_lines = tmp_path / "records_no_ext"
+    json_lines.write_text('{"A": 1}\n{"A": 2}\n{"A": 3}\n')
+    assert detect_file_format(str(json_lines))['lines'] is True
+    assert len(load_dataframe(str(json_lines))) == 3
+
+    workbook = tmp_path / "book.xlsx"
+    pd.DataFrame({'A': [1, 2]}).to_excel(workbook, index=False)
+    assert detect_file_format(str(workbook))['format'] == 'excel'
+    assert load_dataframe(str(workbook))['A'].tolist() == [1, 2]
+
+def test_load_dataframe_reports_csv_errors(tmp_path):
+    broken = tmp_path / "broken.csv"
+    broken.write_text('A,B\n1,"unterminated\n')
+    with pytest.raises(ValueError, match="CSV"):
+        load_dataframe(str(broken))
+
+def test_generate_statistical_summary_matches_describe():
+    df = pd.DataFrame({
+        'F': [1.5, np.nan, 3.0, 2.25, 2.25],
+        'I': [5, 1, 4, 4, 2],
+        'N': pd.array([1, None, 3, 3, None], dtype='Int64'),
+        'S': ['a', 'b', None, 'a', 'a'],
+        'T': pd.to_datetime(['2023-01-01', '2023-01-03', None, '2023-01-02', '2023-01-02'])
+    })
+    summary = generate_statistical_summary(df)
+    desc = df[['F', 'I', 'N', 'S']].describe(include='all').to_dict()
+
+    for col in ['F', 'I', 'N', 'S']:
+        expected = {k: v for k, v in desc[col].items() if pd.notna(v)}
+        actual = {k: v for k, v in summary[col].items() if k in expected}
+        assert actual == expected
+        assert summary[col]['unique_values'] == df[col].nunique()
+        assert summary[col]['missing_values'] == df[col].isnull().sum()
+
+    assert summary['T']['min'] == '2023-01-01T00:00:00'
+    assert summary['T']['50%'] == '2023-01-02T00:00:00'
+    assert summary['T']['samples'][0] == '2023-01-01T00:00:00'
+
+def test_samples_of_low_cardinality_columns_come_from_the_block_pass():
+    rows = 1500
+    df = pd.DataFrame({
+        'Status': ['ok'] * 1200 + ['bad'] * 300,
+        'Level': [1] * 1100 + [2, 3, 4, 5] * 100,
+        'Flag': [True] * rows
+    })
+    summary = generate_statistical_summary(df)
+
+    assert summary['Status']['samples'] == ['ok', 'bad']
+    assert summary['Level']['samples'] == [1, 2, 3, 4, 5]
+    assert summary['Flag']['samples'] == [True]
+
+def test_optimize_dataframe_dtypes():
+    df = pd.DataFrame({
+        'Timestamp': ['2023-01-01 00:00:00', '2023-01-01 00:01:00', None, '2023-01-01 00:03:00'] * 25,
+        'DeviceID': ['Machine_A', 'Machine_B'] * 50,
+        'Reading': [20.1, 20.2, 20.3, None] * 25,
+        'Code': [1, 2, 3, 4] * 25,
+        'Note': [f"free text {i}" for i in range(100)]
+    })
+    optimized = optimize_dataframe_dtypes(df, arrow_strings=True)
+
+    assert str(optimized['Timestamp'].dtype) == 'datetime64[ns]'
+    assert optimized['Timestamp'].isna().sum() == 25
+    assert str(optimized['DeviceID'].dtype) == 'category'
+    assert optimized['Reading'].dtype == 'float64'
+    assert optimized['Code'].dtype == 'uint8'
+    assert str(optimized['Note'].dtype) == 'string'
+    stats = optimized.attrs['memory_optimization']
+    assert stats['after_mb'] <= stats['before_mb']
+    assert stats['conversions']['DeviceID'] == 'object -> category'
+    # The input frame is left untouched
+    assert df['DeviceID'].dtype == object
+
+def test_analyze_file_with_optimized_dtypes(tmp_path):
+    file_path = tmp_path / "devices.csv"
+    file_path.write_text("DeviceID,Status,Value\n" + "".join(f"d{i % 3},ok,{i}\n" for i in range(30)))
+
+    result = analyze_file(str(file_path), optimize_dtypes=True)
+    assert result['metadata']['DeviceID'] == 'category'
+    assert result['summary']['DeviceID']['unique'] == 3
+    assert result['summary']['DeviceID']['freq'] == 10
+    assert 'memory_optimization' in result
+
+    df = optimize_dataframe_dtypes(load_dataframe(str(file_path)))
+    aggregated = execute_aggregation_rule(df, {"group_by": ["DeviceID", "Status"], "aggregations": {"Value": "sum"}})
+    assert aggregated['count'] == 3
+
+def test_detect_anomalies_by_group_judges_rows_against_their_group():
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        "DeviceID": ["A"] * 60 + ["B"] * 60 + ["C"] * 3 + [None] * 2,
+        "value": np.concatenate([rng.normal(10, 0.5, 60), rng.normal(50, 0.5, 60), [10, 50, 90], [10, 500]])
+    })
+    # A reading that is normal for device B is an outlier for device A
+    df.loc[59, "value"] = 50
+
+    result = detect_anomalies_by_group(df, "DeviceID", n_jobs=1, min_group_rows=10)
+
+    assert 59 in result["indices"]
+    assert result["skipped_groups"] == 1
+    assert result["ungrouped_rows"] == 2
+    assert {group["group"] for group in result["groups"]} == {"A", "B"}
+    assert all(record["DeviceID"] in ("A", "B") for record in result["anomalies"])
+    with pytest.raises(ValueError):
+        detect_anomalies_by_group(df, "missing")
+
+def test_anomaly_scan_jobs_fall_back_to_one_without_a_free_slot():
+    from app.services import ai_service
+    with ai_service._anomaly_scan_jobs(1) as jobs:
+        assert jobs == 1
+    held = []
+    while ai_service._parallel_scan_slots.acquire(blocking=False):
+        held.append(True)
+    try:
+        with ai_service._anomaly_scan_jobs(4) as jobs:
+            assert jobs == 1
+    finally:
+        for _ in held:
+            ai_service._parallel_scan_slots.release()
+    with ai_service._anomaly_scan_jobs(4) as jobs:
+        assert jobs == 4
+
+def test_detect_anomalies_sampled_fit_scores_every_row():
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({"value": np.concatenate([rng.normal(10, 1, 2999), [1000]])})
+
+    full = detect_anomalies(df, mode="full")
+    sampled = detect_anomalies(df, mode="sampled", sample_rows=500, chunk_rows=1000, n_jobs=1, contamination="0.01")
+
+    for result in (full, sampled):
+        assert 2999 in result["indices"]
+        assert len(result["scores"]) == result["count"]
+        assert all(score < result["threshold"] for score in result["scores"])
+    assert full["threshold"] == -0.5
+    assert sampled["fit_rows"] == 500
+    assert sampled["score_quantiles"]["min"] <= sampled["threshold"] <= sampled["score_quantiles"]["max"]
+
+def test_detect_file_anomalies_scans_file_in_chunks(tmp_path):
+    rng = np.random.default_rng(0)
+    values = np.concatenate([rng.normal(10, 1, 20000), [1000]])
+    file_path = tmp_path / "readings.csv"
+    pd.DataFrame({"DeviceID": "A", "value": values}).to_csv(file_path, index=False)
+
+    result = detect_file_anomalies(str(file_path), sample_rows=500, chunk_rows=3000, n_jobs=1, contamination="0.01")
+
+    assert 20000 in result["indices"]
+    assert result["fit_rows"] == 500
+    assert len(result["anomalies"]) == len(result["scores"]) == result["count"]
+    # Indices are positions in the whole file, not within a chunk
+    assert np.allclose([record["value"] for record in result["anomalies"]], values[result["indices"]])
+    # The score sketch is seeded, so a repeated scan reports the same quantiles
+    assert detect_file_anomalies(str(file_path), sample_rows=500, chunk_rows=3000, n_jobs=1, contamination="0.01") == result
+    with pytest.raises(ValueError):
+        detect_file_anomalies(str(file_path), mode="full")
+
+def test_detect_anomalies_threshold_and_validation():
+    df = pd.DataFrame({"value": [10.0, 10.5, 9.5, 10.2, 9.8, 10.1, 1000.0]})
+    strict = detect_anomalies(df, mode="full", threshold=-1.0)
+    assert strict["count"] == 0 and strict["threshold"] == -1.0
+    with pytest.raises(ValueError):
+        detect_anomalies(df, contamination="0.9")
+    with pytest.raises(ValueError):
+        detect_anomalies(df, mode="fast")
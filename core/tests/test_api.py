@@ -2,8 +2,14 @@
 from fastapi.testclient import TestClient
 from app.main import app
 import os
+import json
 import shutil
+import asyncio
+import hashlib
 import pytest
+from unittest.mock import patch, AsyncMock
+from pymongo.errors import DuplicateKeyError
+from app.services.file_upload_service import classify_columns_async
 
 client = TestClient(app)
 
@@ -18,7 +24,9 @@ def setup_and_teardown():
     with open(TEST_FILE_PATH, "w") as f:
         f.write("col1,col2\n1,a\n2,b\n3,c")
     
-    yield
+    # No MongoDB in unit tests: behave as if the file has no stored record
+    with patch("app.services.file_upload_service.get_file_record", return_value=None):
+        yield
     
     # Teardown: Remove the dummy file
     if os.path.exists(TEST_FILE_PATH):
@@ -37,3 +45,426 @@ def test_analyze_file_endpoint():
 def test_analyze_file_endpoint_not_found():
     response = client.post("/datamind_ai/analysis/non_existent_file.csv")
     assert response.status_code == 404
+
+def test_analyze_file_endpoint_serves_stored_profile():
+    from app.services.file_upload_service import get_source_signature
+    stored = {"metadata": {"col1": "stored"}, "summary": {}, "memory_usage_mb": 0.0, "head_rows": []}
+    record = {
+        "file_path": TEST_FILENAME,
+        "status": "completed",
+        "analysis": stored,
+        "source_signature": get_source_signature(TEST_FILE_PATH)
+    }
+    with patch("app.services.file_upload_service.get_file_record", return_value=record), \
+         patch("app.services.file_upload_service.analyze_file") as mock_analyze:
+        response = client.post(f"/datamind_ai/analysis/{TEST_FILENAME}")
+
+    assert response.status_code == 200
+    assert response.json()["metadata"]["col1"] == "stored"
+    mock_analyze.assert_not_called()
+
+def test_analyze_file_endpoint_rejects_exact_summary_above_streaming_threshold():
+    with patch("app.services.ai_service.STREAMING_PROFILE_THRESHOLD_MB", 0), \
+         patch("app.services.ai_service.get_cached_dataframe") as mock_load:
+        response = client.post(f"/datamind_ai/analysis/{TEST_FILENAME}?summary_mode=exact")
+
+    assert response.status_code == 400
+    assert "exact" in response.json()["detail"]
+    mock_load.assert_not_called()
+
+def test_analyze_file_endpoint_reports_queued_analysis_as_pending():
+    record = {"file_path": TEST_FILENAME, "status": "processing"}
+    job = {"job_id": "j1", "file_path": TEST_FILENAME, "status": "queued"}
+    with patch("app.services.file_upload_service.get_file_record", return_value=record), \
+         patch("app.services.file_upload_service.get_latest_job_for_file", return_value=job), \
+         patch("app.services.file_upload_service.analyze_file") as mock_analyze:
+        response = client.post(f"/datamind_ai/analysis/{TEST_FILENAME}")
+
+    assert response.status_code == 202
+    assert response.json()["status"] == "pending"
+    assert response.json()["job"]["status"] == "queued"
+    mock_analyze.assert_not_called()
+
+def test_analyze_file_endpoint_waits_for_running_analysis():
+    from app.services.file_upload_service import get_source_signature
+    processing = {"file_path": TEST_FILENAME, "status": "processing"}
+    completed = {
+        "file_path": TEST_FILENAME,
+        "status": "completed",
+        "analysis": {"metadata": {"col1": "stored"}},
+        "source_signature": get_source_signature(TEST_FILE_PATH)
+    }
+    with patch("app.services.file_upload_service.get_file_record", side_effect=[processing, completed]), \
+         patch("app.services.file_upload_service.get_latest_job_for_file", return_value={"status": "running"}), \
+         patch("app.services.file_upload_service.ANALYSIS_POLL_INTERVAL_SECONDS", 0), \
+         patch("app.services.file_upload_service.analyze_file") as mock_analyze:
+        response = client.post(f"/datamind_ai/analysis/{TEST_FILENAME}")
+
+    assert response.status_code == 200
+    assert response.json()["metadata"]["col1"] == "stored"
+    mock_analyze.assert_not_called()
+
+def test_analyze_file_endpoint_recomputes_stale_profile():
+    record = {
+        "file_path": TEST_FILENAME,
+        "status": "completed",
+        "analysis": {"metadata": {"col1": "stored"}},
+        "source_signature": {"mtime_ns": 0, "size": 0}
+    }
+    with patch("app.services.file_upload_service.get_file_record", return_value=record), \
+         patch("app.services.file_upload_service.update_file_analysis") as mock_update:
+        response = client.post(f"/datamind_ai/analysis/{TEST_FILENAME}")
+
+    assert response.status_code == 200
+    assert response.json()["metadata"]["col1"] == "int64"
+    mock_update.assert_called_once()
+
+def test_file_status_endpoint():
+    status = {"file_name": TEST_FILENAME, "status": "processing", "processed_at": None,
+              "job": {"status": "running", "progress": {"phase": "profiling", "rows_processed": 2}}}
+    with patch("app.routes.file_upload.get_file_status", return_value=status):
+        response = client.get(f"/datamind_ai/sheets/status/{TEST_FILENAME}")
+
+    assert response.status_code == 200
+    assert response.json()["job"]["progress"]["phase"] == "profiling"
+    assert "analysis" not in response.json()
+
+def test_file_status_events_stream_until_done():
+    running = {"file_name": TEST_FILENAME, "status": "processing", "job": {"status": "running", "progress": {"phase": "profiling"}}}
+    done = {"file_name": TEST_FILENAME, "status": "completed", "job": {"status": "completed", "progress": {"phase": "writing_sidecar"}}}
+    with patch("app.routes.file_upload.get_file_status_async", AsyncMock(side_effect=[running, running, done])), \
+         patch("app.routes.file_upload.STATUS_EVENTS_POLL_SECONDS", 0):
+        response = client.get(f"/datamind_ai/sheets/status/{TEST_FILENAME}/events")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [line for line in response.text.splitlines() if line.startswith("event:")]
+    assert events == ["event: progress", "event: done"]
+
+def test_insights_stream_sends_events():
+    async def fake_stream(analysis_result):
+        yield {"event": "field", "data": {"key": "summary", "value": "Streamed."}}
+        yield {"event": "done", "data": {"insights": {"summary": "Streamed."}, "cached": False}}
+
+    with patch("app.routes.data_analysis.stream_ai_insights_async", fake_stream):
+        response = client.get(f"/datamind_ai/analysis/{TEST_FILENAME}/insights/stream")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [line for line in response.text.splitlines() if line.startswith("event:")]
+    assert events == ["event: field", "event: done"]
+
+def test_get_columns_reuses_classification_for_same_schema(tmp_path):
+    other_path = os.path.join(TEST_UPLOAD_DIR, "test_columns_same_schema")
+    with open(other_path, "w") as f:
+        f.write("col2 , col1\nb,1")
+    classification = {"col1": {"min": 0, "max": 5, "ideal": 2, "unit": ""}}
+    fake_llm = AsyncMock(return_value=json.dumps(classification))
+    try:
+        with patch("app.services.llm_cache_service.LLM_CACHE_DIR", str(tmp_path)), \
+             patch("app.services.file_upload_service.db") as mock_db, \
+             patch("app.services.llm_service.ainvoke_llm", fake_llm):
+            mock_db.uploaded_files.find_one.return_value = None
+            first = client.get("/datamind_ai/sheets/get-columns", params={"filename": TEST_FILENAME})
+            second = client.get("/datamind_ai/sheets/get-columns", params={"filename": "test_columns_same_schema"})
+    finally:
+        os.remove(other_path)
+
+    assert first.json()["columns"] == classification
+    # Shared through the prompt cache, returned in this file's spelling
+    assert second.json()["columns"] == {" col1": classification["col1"]}
+    assert fake_llm.await_count == 1
+    stored = mock_db.uploaded_files.update_one.call_args_list[0][0][1]["$set"]["column_classification"]
+    assert stored["parameters"] == classification
+
+def test_get_columns_serves_classification_stored_on_record():
+    from app.services.file_upload_service import column_set_signature
+    stored = {"signature": column_set_signature(["col1", "col2"]), "parameters": {"col2": {"unit": "mg/L"}}}
+    with patch("app.services.file_upload_service.db") as mock_db, \
+         patch("app.services.llm_service.ainvoke_llm", AsyncMock()) as fake_llm:
+        mock_db.uploaded_files.find_one.return_value = {"column_classification": stored}
+        response = client.get("/datamind_ai/sheets/get-columns", params={"filename": TEST_FILENAME})
+
+    assert response.json()["columns"] == stored["parameters"]
+    fake_llm.assert_not_awaited()
+
+def test_column_classification_cache_key_includes_prompt(tmp_path):
+    from app.services.file_upload_service import _column_classification_prompt
+    from app.services.llm_service import LLM_MODEL
+    from app.services.llm_cache_service import llm_cache_key
+    # Same header in another order and spacing: same prompt, same cache entry
+    assert _column_classification_prompt(["b ", "a"]) == _column_classification_prompt(["a", " b"])
+    with patch("app.services.llm_cache_service.LLM_CACHE_DIR", str(tmp_path)), \
+         patch("app.services.file_upload_service._column_classification_prompt", return_value="changed prompt"), \
+         patch("app.services.llm_service.get_cached_llm_result", return_value=None) as mock_get, \
+         patch("app.services.llm_service.ainvoke_llm", AsyncMock(return_value="{}")):
+        asyncio.run(classify_columns_async(["a", "b"]))
+    assert mock_get.call_args.args[0] == llm_cache_key(LLM_MODEL, "column_classification", "changed prompt")
+
+def test_grouped_anomalies_reject_unknown_group_column():
+    response = client.post(f"/datamind_ai/analysis/{TEST_FILENAME}/anomalies", params={"group_by": "missing"})
+    assert response.status_code == 400
+
+def test_grouped_anomalies_reject_options_and_large_files():
+    response = client.post(f"/datamind_ai/analysis/{TEST_FILENAME}/anomalies", params={"group_by": "DeviceID", "mode": "full"})
+    assert response.status_code == 400
+    assert "group_by" in response.json()["detail"]
+
+    with patch("app.services.ai_service.STREAMING_PROFILE_THRESHOLD_MB", 0), \
+         patch("app.services.file_upload_service.detect_anomalies_by_group") as mock_grouped:
+        response = client.post(f"/datamind_ai/analysis/{TEST_FILENAME}/anomalies", params={"group_by": "DeviceID"})
+    assert response.status_code == 400
+    mock_grouped.assert_not_called()
+
+def test_anomalies_with_options_are_scanned_on_demand():
+    response = client.post(f"/datamind_ai/analysis/{TEST_FILENAME}/anomalies", params={"mode": "full", "contamination": "0.3"})
+    assert response.status_code == 200
+    assert response.json()["contamination"] == 0.3
+    assert len(response.json()["scores"]) == response.json()["count"]
+
+    response = client.post(f"/datamind_ai/analysis/{TEST_FILENAME}/anomalies", params={"contamination": "lots"})
+    assert response.status_code == 400
+
+def test_scans_and_aggregations_serialize_optimized_timestamps():
+    # With the dtype optimizer on, the Timestamp column is loaded as datetime64
+    rows = ["Timestamp,DeviceID,value"] + [
+        f"2024-01-01 {i % 24:02d}:00:00,{'AB'[i % 2]},{1000 if i in (38, 39) else 10 + i % 3}" for i in range(40)
+    ]
+    with open(TEST_FILE_PATH, "w") as f:
+        f.write("\n".join(rows))
+
+    with patch("app.services.ai_service.OPTIMIZE_DTYPES_ON_LOAD", True):
+        full = client.post(f"/datamind_ai/analysis/{TEST_FILENAME}/anomalies", params={"mode": "full", "contamination": "0.1"})
+        grouped = client.post(f"/datamind_ai/analysis/{TEST_FILENAME}/anomalies", params={"group_by": "DeviceID"})
+        aggregated = client.post(
+            f"/datamind_ai/analysis/{TEST_FILENAME}/aggregations/execute",
+            json={"group_by": ["Timestamp"], "aggregations": {"value": "mean"}}
+        )
+
+    for response in (full, grouped):
+        assert response.status_code == 200
+        assert response.json()["count"] > 0
+        assert all(record["Timestamp"].startswith("2024-01-01T") for record in response.json()["anomalies"])
+    assert aggregated.status_code == 200
+    assert aggregated.json()["data"][0]["Timestamp"] == "2024-01-01T00:00:00"
+
+def test_get_files_paginates_with_cursor():
+    from bson import ObjectId
+    ids = [ObjectId() for _ in range(3)]
+    documents = [{"_id": oid, "file_path": f"file-{i}", "status": "completed"} for i, oid in enumerate(ids)]
+    with patch("app.routes.file_upload.get_uploaded_files", return_value=iter(documents)) as mock_find:
+        response = client.get("/datamind_ai/sheets/get-files?limit=2")
+
+    assert response.status_code == 200
+    data = response.json()
+    assert [f["file_path"] for f in data["files"]] == ["file-0", "file-1"]
+    assert data["next_cursor"] == str(ids[1])
+    assert mock_find.call_args.kwargs["include_analysis"] is False
+
+def test_get_files_reports_db_failures():
+    def failing_cursor(fail_after):
+        yield from ({"_id": f"id-{i}", "file_path": f"file-{i}"} for i in range(fail_after))
+        raise ConnectionError("DB went away")
+
+    with patch("app.routes.file_upload.get_uploaded_files", return_value=failing_cursor(0)):
+        response = client.get("/datamind_ai/sheets/get-files")
+    assert response.status_code == 500
+
+    with patch("app.routes.file_upload.get_uploaded_files", return_value=failing_cursor(2)):
+        response = client.get("/datamind_ai/sheets/get-files")
+    data = response.json()
+    assert [f["file_path"] for f in data["files"]] == ["file-0", "file-1"]
+    assert data["next_cursor"] is None and "DB went away" in data["error"]
+
+def test_get_files_rejects_invalid_cursor():
+    response = client.get("/datamind_ai/sheets/get-files?cursor=not-an-id")
+    assert response.status_code == 400
+
+def test_upload_file_uses_async_persistence():
+    with patch("app.routes.file_upload.find_file_by_hash_async", AsyncMock(return_value=None)), \
+         patch("app.routes.file_upload.save_uploaded_file_async", AsyncMock()) as mock_save, \
+         patch("app.routes.file_upload.submit_analysis_job_async", AsyncMock(return_value="job-1")) as mock_submit:
+        response = client.post("/datamind_ai/sheets/upload-file", files={"file": ("data.csv", b"a,b\n1,2\n", "text/csv")})
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["job_id"] == "job-1"
+    assert mock_save.await_args.args[0] == data["file_name"]
+    assert len(mock_save.await_args.args[1]) == 64
+    mock_submit.assert_awaited_once()
+    os.remove(os.path.join(TEST_UPLOAD_DIR, data["file_name"]))
+
+def test_upload_of_duplicate_content_reuses_existing_file():
+    existing = {"file_path": TEST_FILENAME, "status": "completed"}
+    before = set(os.listdir(TEST_UPLOAD_DIR))
+    with patch("app.routes.file_upload.find_file_by_hash_async", AsyncMock(return_value=existing)) as mock_find, \
+         patch("app.routes.file_upload.submit_analysis_job_async", AsyncMock()) as mock_submit:
+        response = client.post("/datamind_ai/sheets/upload-file", files={"file": ("copy.csv", b"col1,col2\n1,a\n", "text/csv")})
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["file_name"] == TEST_FILENAME
+    assert data["duplicate"] is True
+    mock_submit.assert_not_called()
+    # The hash is computed while the chunks are written, and the new copy is discarded
+    assert mock_find.await_args.args[0] == hashlib.sha256(b"col1,col2\n1,a\n").hexdigest()
+    assert set(os.listdir(TEST_UPLOAD_DIR)) == before
+
+def test_concurrent_duplicate_upload_loses_on_unique_hash():
+    existing = {"file_path": TEST_FILENAME, "status": "processing"}
+    before = set(os.listdir(TEST_UPLOAD_DIR))
+    # The other upload registers between our lookup and our insert
+    with patch("app.routes.file_upload.find_file_by_hash_async", AsyncMock(side_effect=[None, existing])), \
+         patch("app.routes.file_upload.save_uploaded_file_async", AsyncMock(side_effect=DuplicateKeyError("content_hash_unique"))), \
+         patch("app.routes.file_upload.submit_analysis_job_async", AsyncMock()) as mock_submit:
+        response = client.post("/datamind_ai/sheets/upload-file", files={"file": ("copy.csv", b"col1,col2\n1,a\n", "text/csv")})
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["file_name"] == TEST_FILENAME
+    assert data["duplicate"] is True
+    mock_submit.assert_not_called()
+    assert set(os.listdir(TEST_UPLOAD_DIR)) == before
+
+def test_resumable_upload_flow():
+    sessions = {}
+
+    async def create(session):
+        sessions[session["upload_id"]] = dict(session)
+
+    async def get(upload_id):
+        return sessions.get(upload_id)
+
+    async def update(upload_id, fields):
+        sessions[upload_id].update(fields)
+
+    async def claim(upload_id, from_status, to_status):
+        session = sessions.get(upload_id)
+        if session is None or session["status"] != from_status:
+            return None
+        session["status"] = to_status
+        return dict(session)
+
+    content = b"col1,col2\n1,a\n2,b\n3,c\n"
+    with patch("app.routes.file_upload.create_upload_session_async", create), \
+         patch("app.routes.file_upload.get_upload_session_async", get), \
+         patch("app.routes.file_upload.update_upload_session_async", update), \
+         patch("app.routes.file_upload.claim_upload_session_async", claim), \
+         patch("app.routes.file_upload.delete_upload_sessions_created_before_async", AsyncMock(return_value=0)) as mock_expire, \
+         patch("app.routes.file_upload.find_file_by_hash_async", AsyncMock(return_value=None)), \
+         patch("app.routes.file_upload.save_uploaded_file_async", AsyncMock()), \
+         patch("app.routes.file_upload.submit_analysis_job_async", AsyncMock(return_value="job-1")) as mock_submit:
+        response = client.post("/datamind_ai/sheets/uploads", json={"filename": "data.csv", "total_size": len(content), "chunk_size": 10})
+        assert response.status_code == 200
+        upload_id = response.json()["upload_id"]
+        chunks = [content[i:i + 10] for i in range(0, len(content), 10)]
+        # Starting an upload clears out expired session records
+        mock_expire.assert_awaited_once()
+
+        def put(index, data, checksum=None):
+            return client.put(
+                f"/datamind_ai/sheets/uploads/{upload_id}/chunks/{index}?offset={index * 10}",
+                content=data,
+                headers={"X-Chunk-SHA256": checksum or hashlib.sha256(data).hexdigest()}
+            )
+
+        assert put(0, chunks[0]).status_code == 200
+        assert put(1, chunks[1], checksum="0" * 64).status_code == 400
+        assert client.get(f"/datamind_ai/sheets/uploads/{upload_id}").json()["missing_chunks"] == [1, 2]
+        assert client.post(f"/datamind_ai/sheets/uploads/{upload_id}/finalize").status_code == 400
+        # A failed finalize hands the session back for the missing chunks
+        assert sessions[upload_id]["status"] == "uploading"
+
+        for index in (1, 2):
+            assert put(index, chunks[index]).status_code == 200
+        response = client.post(f"/datamind_ai/sheets/uploads/{upload_id}/finalize")
+
+        assert response.status_code == 200
+        assert response.json()["job_id"] == "job-1"
+        file_path = os.path.join(TEST_UPLOAD_DIR, response.json()["file_name"])
+        with open(file_path, "rb") as f:
+            assert f.read() == content
+        mock_submit.assert_awaited_once()
+        assert client.post(f"/datamind_ai/sheets/uploads/{upload_id}/finalize").status_code == 409
+        assert put(0, chunks[0]).status_code == 409
+    os.remove(file_path)
+
+def test_large_resumable_upload_is_profiled_while_chunks_arrive():
+    sessions = {}
+
+    async def create(session):
+        sessions[session["upload_id"]] = dict(session)
+
+    async def get(upload_id):
+        return sessions.get(upload_id)
+
+    async def claim(upload_id, from_status, to_status):
+        sessions[upload_id]["status"] = to_status
+        return dict(sessions[upload_id])
+
+    content = b"col1,col2\n" + b"".join(f"{i},{i % 7}\n".encode() for i in range(50))
+    with patch("app.services.chunked_upload_service.STREAMING_PROFILE_THRESHOLD_MB", 0), \
+         patch("app.routes.file_upload.create_upload_session_async", create), \
+         patch("app.routes.file_upload.get_upload_session_async", get), \
+         patch("app.routes.file_upload.update_upload_session_async", AsyncMock()), \
+         patch("app.routes.file_upload.claim_upload_session_async", claim), \
+         patch("app.routes.file_upload.delete_upload_sessions_created_before_async", AsyncMock(return_value=0)), \
+         patch("app.routes.file_upload.find_file_by_hash_async", AsyncMock(return_value=None)), \
+         patch("app.routes.file_upload.save_uploaded_file_async", AsyncMock()), \
+         patch("app.routes.file_upload.update_file_analysis") as mock_store, \
+         patch("app.routes.file_upload.submit_analysis_job_async", AsyncMock(return_value="job-1")) as mock_submit:
+        upload_id = client.post(
+            "/datamind_ai/sheets/uploads", json={"filename": "data.csv", "total_size": len(content), "chunk_size": 100}
+        ).json()["upload_id"]
+        for index in range(0, len(content), 100):
+            data = content[index:index + 100]
+            client.put(
+                f"/datamind_ai/sheets/uploads/{upload_id}/chunks/{index // 100}?offset={index}",
+                content=data,
+                headers={"X-Chunk-SHA256": hashlib.sha256(data).hexdigest()}
+            )
+        response = client.post(f"/datamind_ai/sheets/uploads/{upload_id}/finalize")
+
+    assert response.status_code == 200
+    assert response.json()["profile_ready"] is True
+    stored = mock_store.call_args.args[1]
+    assert stored["row_count"] == 50 and stored["profile_mode"] == "streaming"
+    assert mock_submit.call_args.kwargs["analysis_ready"] is True
+    os.remove(os.path.join(TEST_UPLOAD_DIR, response.json()["file_name"]))
+
+def test_cancel_upload_discards_staged_chunks():
+    claimed = {"upload_id": "u1", "status": "cancelled"}
+    with patch("app.routes.file_upload.claim_upload_session_async", AsyncMock(side_effect=[claimed, None])), \
+         patch("app.routes.file_upload.get_upload_session_async", AsyncMock(return_value=claimed)), \
+         patch("app.routes.file_upload.discard_upload") as mock_discard:
+        response = client.delete("/datamind_ai/sheets/uploads/u1")
+        again = client.delete("/datamind_ai/sheets/uploads/u1")
+
+    assert response.status_code == 200
+    assert response.json()["status"] == "cancelled"
+    mock_discard.assert_called_once_with("u1")
+    assert again.status_code == 409
+
+def test_failed_finalize_discards_staged_chunks():
+    session = {"upload_id": "u1", "status": "uploading", "file_name": "data-sheet-x.csv", "created_at": "2099-01-01T00:00:00"}
+    with patch("app.routes.file_upload.get_upload_session_async", AsyncMock(return_value=session)), \
+         patch("app.routes.file_upload.claim_upload_session_async", AsyncMock(return_value=dict(session, status="finalizing"))), \
+         patch("app.routes.file_upload.update_upload_session_async", AsyncMock()) as mock_update, \
+         patch("app.routes.file_upload.assemble_upload", side_effect=OSError("disk full")), \
+         patch("app.routes.file_upload.discard_upload") as mock_discard:
+        with pytest.raises(OSError):
+            client.post("/datamind_ai/sheets/uploads/u1/finalize")
+
+    mock_update.assert_awaited_once_with("u1", {"status": "failed"})
+    mock_discard.assert_called_once_with("u1")
+
+def test_finalize_is_rejected_while_another_finalize_holds_the_session():
+    session = {"upload_id": "u1", "status": "uploading", "created_at": "2099-01-01T00:00:00"}
+    with patch("app.routes.file_upload.get_upload_session_async", AsyncMock(side_effect=[session, dict(session, status="finalizing")])), \
+         patch("app.routes.file_upload.claim_upload_session_async", AsyncMock(return_value=None)), \
+         patch("app.routes.file_upload.assemble_upload") as mock_assemble:
+        response = client.post("/datamind_ai/sheets/uploads/u1/finalize")
+
+    assert response.status_code == 409
+    assert "finalizing" in response.json()["message"]
+    mock_assemble.assert_not_called()
@@ -0,0 +1,54 @@
+import pytest
+import pandas as pd
+from unittest.mock import patch, MagicMock
+from app.services import artifact_service, file_upload_service
+
+@pytest.fixture
+def artifact_dir(tmp_path):
+    with patch.object(artifact_service, "ARTIFACT_DIR", str(tmp_path)):
+        yield tmp_path
+
+def test_put_and_get_artifact_round_trip(artifact_dir):
+    data = {"summary": {"col1": {"mean": 2.0}}, "head_rows": [{"ts": pd.Timestamp("2024-01-01")}]}
+    artifact_id = artifact_service.put_artifact("analysis", data)
+
+    assert artifact_id.startswith("analysis-")
+    assert (artifact_dir / f"{artifact_id}.json.gz").exists()
+    loaded = artifact_service.get_artifact(artifact_id)
+    assert loaded["summary"] == data["summary"]
+    assert loaded["head_rows"][0]["ts"] == "2024-01-01 00:00:00"
+
+    artifact_service.delete_artifact(artifact_id)
+    assert artifact_service.get_artifact(artifact_id) is None
+
+def test_artifact_ids_cannot_escape_the_store(artifact_dir):
+    with pytest.raises(ValueError):
+        artifact_service.get_artifact("../../config")
+
+def test_update_file_analysis_stores_pointer_and_replaces_old_artifact(artifact_dir):
+    old_id = artifact_service.put_artifact("analysis", {"metadata": {}})
+    mock_db = MagicMock()
+    mock_db.uploaded_files.find_one_and_update.return_value = {"analysis_ref": old_id}
+    analysis = {"metadata": {"a": "int64", "b": "object"}, "summary": {}, "row_count": 3, "head_rows": []}
+
+    with patch.object(file_upload_service, "db", mock_db):
+        file_upload_service.update_file_analysis("file.csv", analysis)
+
+    update = mock_db.uploaded_files.find_one_and_update.call_args.args[1]
+    assert "analysis" not in update["$set"]
+    assert update["$set"]["analysis_summary"] == {"row_count": 3, "column_count": 2}
+    assert artifact_service.get_artifact(update["$set"]["analysis_ref"]) == analysis
+    # The replaced artifact stays readable until the grace period is over
+    assert artifact_service.get_artifact(old_id) == {"metadata": {}}
+    assert artifact_service.sweep_retired_artifacts(grace_seconds=3600, force=True) == 0
+    assert artifact_service.sweep_retired_artifacts(grace_seconds=0, force=True) == 1
+    assert artifact_service.get_artifact(old_id) is None
+
+def test_failed_record_update_deletes_new_artifact(artifact_dir):
+    mock_db = MagicMock()
+    mock_db.uploaded_files.find_one_and_update.side_effect = ConnectionError("down")
+
+    with patch.object(file_upload_service, "db", mock_db), pytest.raises(ConnectionError):
+        file_upload_service.update_file_analysis("file.csv", {"metadata": {}, "row_count": 0})
+
+    assert not list(artifact_dir.glob("*.json.gz"))
@@ -0,0 +1,112 @@
+import os
+import time
+import hashlib
+import pytest
+from unittest.mock import patch
+from app.services import chunked_upload_service as uploads
+
+@pytest.fixture(autouse=True)
+def staging_dir(tmp_path):
+    with patch.object(uploads, "UPLOAD_STAGING_DIR", str(tmp_path / ".partial")):
+        yield tmp_path
+
+def _sha(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def test_chunks_in_any_order_assemble_into_the_file(staging_dir):
+    content = b"col1,col2\n" + b"1,a\n" * 10
+    session = uploads.new_upload_session("data.csv", len(content), chunk_size=16, sha256=_sha(content))
+    chunks = [content[i:i + 16] for i in range(0, len(content), 16)]
+    assert session["chunk_count"] == len(chunks)
+    assert session["file_name"].endswith(".csv")
+
+    for index in reversed(range(1, len(chunks))):
+        uploads.write_chunk(session, index, index * 16, chunks[index], _sha(chunks[index]))
+    assert uploads.upload_progress(session)["missing_chunks"] == [0]
+    with pytest.raises(ValueError, match="missing"):
+        uploads.assemble_upload(session, str(staging_dir / "out.csv"))
+
+    uploads.write_chunk(session, 0, 0, chunks[0], _sha(chunks[0]))
+    ingested = uploads.assemble_upload(session, str(staging_dir / "out.csv"))
+
+    assert (staging_dir / "out.csv").read_bytes() == content
+    assert ingested["content_hash"] == _sha(content)
+    assert uploads.received_chunks(session["upload_id"]) == []
+
+def test_write_chunk_rejects_bad_checksum_offset_and_size():
+    session = uploads.new_upload_session("data.csv", 20, chunk_size=16)
+    with pytest.raises(ValueError, match="Checksum"):
+        uploads.write_chunk(session, 0, 0, b"x" * 16, _sha(b"y" * 16))
+    with pytest.raises(ValueError, match="offset"):
+        uploads.write_chunk(session, 1, 8, b"x" * 4, _sha(b"x" * 4))
+    with pytest.raises(ValueError, match="bytes"):
+        uploads.write_chunk(session, 1, 16, b"x" * 3, _sha(b"x" * 3))
+    assert uploads.received_chunks(session["upload_id"]) == []
+
+def test_chunk_written_during_assembly_does_not_change_the_snapshot(staging_dir):
+    content = b"a" * 16 + b"b" * 4
+    session = uploads.new_upload_session("data.csv", len(content), chunk_size=16)
+    uploads.write_chunk(session, 0, 0, content[:16], _sha(content[:16]))
+
+    # Chunk 1 arrives only after finalize took its snapshot: the assembly fails on the
+    # snapshot and the late chunk is kept for the next finalize
+    real_assemble = uploads._assemble_snapshot
+    def assemble_with_late_write(*args):
+        uploads.write_chunk(session, 1, 16, content[16:], _sha(content[16:]))
+        return real_assemble(*args)
+
+    with patch.object(uploads, "_assemble_snapshot", assemble_with_late_write), pytest.raises(ValueError, match="missing"):
+        uploads.assemble_upload(session, str(staging_dir / "out.csv"))
+    assert uploads.received_chunks(session["upload_id"]) == [0, 1]
+
+    uploads.assemble_upload(session, str(staging_dir / "out.csv"))
+    assert (staging_dir / "out.csv").read_bytes() == content
+
+def test_sweep_removes_only_expired_staging_dirs(staging_dir):
+    session = uploads.new_upload_session("data.csv", 4, chunk_size=4)
+    uploads.write_chunk(session, 0, 0, b"abcd", _sha(b"abcd"))
+    abandoned = staging_dir / ".partial" / "abandoned"
+    abandoned.mkdir()
+    old = time.time() - (uploads.UPLOAD_SESSION_TTL_HOURS + 1) * 3600
+    os.utime(abandoned, (old, old))
+
+    assert uploads.sweep_expired_uploads() == 1
+    assert not abandoned.exists()
+    assert uploads.received_chunks(session["upload_id"]) == [0]
+
+def _profiled_upload(content: bytes, chunk_size: int):
+    session = uploads.new_upload_session("data.csv", len(content), chunk_size=chunk_size)
+    chunks = [content[i:i + chunk_size] for i in range(0, len(content), chunk_size)]
+
+    def put(index, data=None):
+        data = chunks[index] if data is None else data
+        uploads.write_chunk(session, index, index * chunk_size, data, _sha(data))
+        uploads.advance_upload_profile(session, index)
+
+    return session, chunks, put
+
+def test_contiguous_chunks_are_profiled_as_they_arrive(staging_dir):
+    content = b"id,value\n" + b"".join(f"{i},{i * 2}\n".encode() for i in range(100))
+    session, chunks, put = _profiled_upload(content, 64)
+    # Out of order: the profile catches up once the gap before the later chunks is filled
+    for index in [1, 2, 0] + list(range(3, len(chunks))):
+        put(index)
+
+    ingested = uploads.assemble_upload(session, str(staging_dir / "out.csv"))
+
+    assert ingested["analysis"]["row_count"] == 100
+    assert ingested["analysis"]["summary"]["value"]["max"] == 198
+    assert uploads._upload_profiles == {}
+
+def test_resent_chunk_drops_the_upload_profile(staging_dir):
+    content = b"id,value\n" + b"".join(f"{i},{i * 2}\n".encode() for i in range(100))
+    session, chunks, put = _profiled_upload(content, 64)
+    for index in range(len(chunks)):
+        put(index)
+    # Same size and offset, different bytes: the folded profile no longer matches the file
+    put(0, chunks[0].replace(b"0,0", b"0,9"))
+
+    ingested = uploads.assemble_upload(session, str(staging_dir / "out.csv"))
+
+    assert ingested["analysis"] is None
+    assert ingested["content_hash"] == _sha(chunks[0].replace(b"0,0", b"0,9") + content[64:])
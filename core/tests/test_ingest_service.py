@@ -0,0 +1,46 @@
+import gzip
+import hashlib
+import pytest
+from unittest.mock import patch
+from app.services import ingest_service
+from app.services.ai_service import analyze_file_streaming
+
+CSV_CONTENT = b"id,value,note\n" + b"".join(
+    f'{i},{i * 1.5},"line {i}\nwith ""quotes"", and a newline"\n'.encode() for i in range(200)
+)
+
+def test_upload_is_hashed_while_written(tmp_path):
+    path = tmp_path / "upload.csv"
+    ingest = ingest_service.new_upload_ingest(str(path))
+    for start in range(0, len(CSV_CONTENT), 61):
+        ingest_service.ingest_chunk(ingest, CSV_CONTENT[start:start + 61])
+    ingested = ingest_service.finish_upload_ingest(ingest)
+
+    assert path.read_bytes() == CSV_CONTENT
+    assert ingested == {"file_size": len(CSV_CONTENT), "content_hash": hashlib.sha256(CSV_CONTENT).hexdigest()}
+
+def _stream_profile(tmp_path, content, piece_bytes):
+    head_path = tmp_path / "0.part"
+    head_path.write_bytes(content[:piece_bytes])
+    profile = ingest_service.new_stream_profile(str(head_path))
+    for start in range(0, len(content), piece_bytes):
+        ingest_service.feed_stream_profile(profile, content[start:start + piece_bytes])
+    return ingest_service.finish_stream_profile(profile)
+
+def test_stream_profile_matches_streaming_analysis(tmp_path):
+    # Small blocks so rows (and quoted newlines) straddle block boundaries
+    with patch.object(ingest_service, "PROFILE_BLOCK_BYTES", 97):
+        analysis = _stream_profile(tmp_path, CSV_CONTENT, 61)
+
+    path = tmp_path / "upload.csv"
+    path.write_bytes(CSV_CONTENT)
+    expected = analyze_file_streaming(str(path))
+    assert analysis["row_count"] == 200
+    assert analysis["profile_mode"] == "streaming"
+    assert analysis["metadata"] == expected["metadata"]
+    assert analysis["summary"]["value"]["mean"] == pytest.approx(expected["summary"]["value"]["mean"])
+    assert analysis["summary"]["note"]["count"] == 200
+    assert analysis["head_rows"][0]["note"] == 'line 0\nwith "quotes", and a newline'
+
+def test_compressed_upload_is_not_stream_profiled(tmp_path):
+    assert _stream_profile(tmp_path, gzip.compress(CSV_CONTENT), 1024) is None
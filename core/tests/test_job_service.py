@@ -0,0 +1,172 @@
+
+import os
+import threading
+import time
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from unittest.mock import patch, MagicMock
+import pytest
+from app.services import job_service
+
+@pytest.fixture
+def thread_executor():
+    # Run jobs on threads instead of spawned processes and keep the DB out of the way
+    executor = ThreadPoolExecutor(max_workers=4)
+    with patch.object(job_service, "_create_executor", return_value=executor), \
+         patch.object(job_service, "db", MagicMock()), \
+         patch.object(job_service, "ANALYSIS_MAX_WORKERS", 4):
+        yield
+        job_service.shutdown_executor()
+
+def test_jobs_are_admitted_in_order_within_size_budget(thread_executor):
+    events = []
+    lock = threading.Lock()
+
+    def fake_job(job_id, filename, file_path, queued_at):
+        with lock:
+            events.append(("start", filename))
+        time.sleep(0.05)
+        with lock:
+            events.append(("end", filename))
+        return True
+
+    mb = 1024 * 1024
+    with patch.object(job_service, "run_analysis_job", side_effect=fake_job), \
+         patch.object(job_service, "ANALYSIS_MAX_INFLIGHT_MB", 3):
+        job_service.submit_analysis_job("big-1", "app/uploads/big-1", 2 * mb)
+        job_service.submit_analysis_job("big-2", "app/uploads/big-2", 2 * mb)
+        job_service.submit_analysis_job("small", "app/uploads/small", 1 * mb)
+
+        deadline = time.monotonic() + 5
+        while len(events) < 6 and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    starts = [name for kind, name in events if kind == "start"]
+    assert starts == ["big-1", "big-2", "small"]
+    # Two 2 MB files never run together under a 3 MB budget
+    assert events.index(("end", "big-1")) < events.index(("start", "big-2"))
+    # The small file is admitted alongside big-2 once it reaches the head of the queue
+    assert events.index(("start", "small")) < events.index(("end", "big-2"))
+
+def _crash_or_record(job_id, filename, file_path, queued_at):
+    # Runs in a pool worker: "crash" jobs kill their process, others leave a marker file
+    if filename == "crash":
+        os._exit(1)
+    open(file_path, "w").close()
+    return True
+
+def test_pool_is_replaced_after_a_worker_dies(tmp_path):
+    # fork so workers see this test's stand-in for run_analysis_job
+    def fork_executor():
+        return ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("fork"))
+
+    marker = tmp_path / "after-crash"
+    with patch.object(job_service, "_create_executor", side_effect=fork_executor) as mock_create, \
+         patch.object(job_service, "run_analysis_job", _crash_or_record), \
+         patch.object(job_service, "_update_job") as mock_update, \
+         patch.object(job_service, "update_file_analysis") as mock_update_file, \
+         patch.object(job_service, "release_content_hash") as mock_release, \
+         patch.object(job_service, "db", MagicMock()), \
+         patch.object(job_service, "ANALYSIS_MAX_WORKERS", 1):
+        try:
+            crashed_id = job_service.submit_analysis_job("crash", str(tmp_path / "unused"), 1)
+            deadline = time.monotonic() + 30
+            while not mock_update.called and time.monotonic() < deadline:
+                time.sleep(0.05)
+            job_service.submit_analysis_job("after", str(marker), 1)
+
+            while not marker.exists() and time.monotonic() < deadline:
+                time.sleep(0.05)
+            stats = job_service.get_queue_stats()
+        finally:
+            job_service.shutdown_executor()
+
+    assert marker.exists()
+    assert mock_create.call_count == 2
+    job_id, fields = mock_update.call_args_list[0].args
+    assert job_id == crashed_id and fields["status"] == "failed"
+    # The crashed job's file is failed too and no longer claims its content hash
+    assert mock_update_file.call_args.args[0] == "crash"
+    assert mock_update_file.call_args.kwargs["status"] == "failed"
+    mock_release.assert_called_once_with("crash")
+    assert stats["queued"] == 0
+
+def test_job_submitted_to_a_broken_pool_is_requeued():
+    broken = MagicMock()
+    broken.submit.side_effect = BrokenProcessPool("A worker died")
+    ran = threading.Event()
+    with patch.object(job_service, "_create_executor", side_effect=[broken, ThreadPoolExecutor(max_workers=1)]), \
+         patch.object(job_service, "run_analysis_job", side_effect=lambda *args: ran.set()), \
+         patch.object(job_service, "db", MagicMock()):
+        try:
+            job_service.submit_analysis_job("file.csv", "app/uploads/file.csv", 1)
+            assert ran.wait(5)
+        finally:
+            job_service.shutdown_executor()
+    broken.shutdown.assert_called_once()
+
+def test_interrupted_jobs_are_requeued_at_startup(tmp_path):
+    (tmp_path / "kept.csv").write_text("a\n1\n")
+    jobs = [
+        {"job_id": "j1", "file_path": "kept.csv", "file_size": 4, "status": "running", "queued_at": "2024-01-01T00:00:00"},
+        {"job_id": "j2", "file_path": "gone.csv", "file_size": 4, "status": "queued", "queued_at": "2024-01-01T00:00:01"}
+    ]
+    db = MagicMock()
+    db.analysis_jobs.find.return_value.sort.return_value = jobs
+    with patch.object(job_service, "db", db), \
+         patch.object(job_service, "UPLOAD_DIR", str(tmp_path)), \
+         patch.object(job_service, "enqueue_analysis_job") as mock_enqueue, \
+         patch.object(job_service, "_update_job") as mock_update, \
+         patch.object(job_service, "mark_file_failed") as mock_failed:
+        assert job_service.recover_interrupted_jobs() == 1
+
+    mock_enqueue.assert_called_once()
+    assert mock_enqueue.call_args.args == (jobs[0], str(tmp_path / "kept.csv"))
+    assert [(call.args[0], call.args[1]["status"]) for call in mock_update.call_args_list] == [("j1", "queued"), ("j2", "failed")]
+    assert mock_failed.call_args.args[0] == "gone.csv"
+
+def test_run_analysis_job_records_status_and_timings():
+    with patch.object(job_service, "process_uploaded_file", return_value=False), \
+         patch.object(job_service, "invalidate_dataframe_cache") as mock_invalidate, \
+         patch.object(job_service, "_update_job") as mock_update:
+        assert job_service.run_analysis_job("job-1", "file.csv", "app/uploads/file.csv", "2024-01-01T00:00:00") is False
+
+    mock_invalidate.assert_called_once_with("app/uploads/file.csv")
+
+    running, finished = mock_update.call_args_list
+    assert running.args[1]["status"] == "running"
+    assert "queue_wait_s" in running.args[1]
+    assert finished.args[1]["status"] == "failed"
+    assert "duration_s" in finished.args[1]
+
+def test_profile_stored_at_upload_is_not_recomputed():
+    stored = {"profile_mode": "streaming", "row_count": 10, "metadata": {"a": "int64"}}
+    with patch.object(job_service, "get_source_signature", return_value={}), \
+         patch.object(job_service, "get_file_record", return_value={"analysis": stored}), \
+         patch.object(job_service, "load_file_analysis", return_value=stored), \
+         patch.object(job_service, "analyze_file") as mock_analyze, \
+         patch.object(job_service, "update_file_analysis") as mock_update, \
+         patch.object(job_service, "write_columnar_sidecar_chunked") as mock_sidecar, \
+         patch.object(job_service, "detect_file_anomalies", return_value={}), \
+         patch.object(job_service, "update_file_anomalies"):
+        assert job_service.process_uploaded_file("file.csv", "app/uploads/file.csv", analysis_ready=True) is True
+
+    mock_analyze.assert_not_called()
+    mock_update.assert_not_called()
+    mock_sidecar.assert_called_once_with("app/uploads/file.csv", {"a": "int64"})
+
+def test_progress_reporter_throttles_and_estimates_eta():
+    with patch.object(job_service, "_update_job") as mock_update:
+        report = job_service.make_progress_reporter("job-1", interval=60)
+        report("parsing")
+        report("profiling", rows_processed=100, fraction=0.5)
+        # Same phase within the interval is not written again
+        report("profiling", rows_processed=200, fraction=0.6)
+
+    assert mock_update.call_count == 2
+    progress = mock_update.call_args.args[1]["progress"]
+    assert progress["phase"] == "profiling"
+    assert progress["rows_processed"] == 100
+    assert progress["percent"] == 50.0
+    assert progress["eta_s"] is not None
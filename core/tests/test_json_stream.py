@@ -0,0 +1,29 @@
+import json
+from app.services.json_stream import new_json_stream_state, feed_json_stream
+
+def test_fields_and_items_are_reported_as_soon_as_they_complete():
+    reply = {
+        "summary": "Text with \"quotes\", commas and {braces}.",
+        "trends": ["first", {"nested": [1, 2]}],
+        "data_quality": {"score": 90, "alerts": []}
+    }
+    text = "```json\n" + json.dumps(reply, indent=2) + "\n```"
+    state = new_json_stream_state()
+
+    events = []
+    for i in range(0, len(text), 5):
+        events.extend(feed_json_stream(state, text[i:i + 5]))
+
+    assert events[0] == {"event": "field", "data": {"key": "summary", "value": reply["summary"]}}
+    assert events[1] == {"event": "item", "data": {"key": "trends", "index": 0, "value": "first"}}
+    assert events[2] == {"event": "item", "data": {"key": "trends", "index": 1, "value": {"nested": [1, 2]}}}
+    assert events[3]["data"] == {"key": "trends", "value": reply["trends"]}
+    assert events[4]["data"] == {"key": "data_quality", "value": reply["data_quality"]}
+    assert len(events) == 5
+
+def test_incomplete_values_are_held_back():
+    state = new_json_stream_state()
+    assert feed_json_stream(state, '{"summary": "half a sent') == []
+    assert feed_json_stream(state, 'ence", "trends": ["a"') == [
+        {"event": "field", "data": {"key": "summary", "value": "half a sentence"}}
+    ]
@@ -0,0 +1,68 @@
+import os
+import asyncio
+import pytest
+from unittest.mock import patch, AsyncMock
+from app.services import llm_cache_service
+from app.services.ai_service import (
+    generate_ai_insights_async, generate_visualization_rules_async, generate_aggregation_rules_async, generate_dashboard_plan_async
+)
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path):
+    with patch.object(llm_cache_service, "LLM_CACHE_DIR", str(tmp_path)):
+        yield tmp_path
+
+def test_stored_results_are_served_until_they_expire():
+    key = llm_cache_service.llm_cache_key("model", "template", "prompt")
+    assert key != llm_cache_service.llm_cache_key("other-model", "template", "prompt")
+    assert llm_cache_service.get_cached_llm_result(key) is None
+
+    llm_cache_service.set_cached_llm_result(key, {"summary": "ok"})
+    assert llm_cache_service.get_cached_llm_result(key) == {"summary": "ok"}
+
+    llm_cache_service.set_cached_llm_result(key, ["rule"], ttl_seconds=-1)
+    assert llm_cache_service.get_cached_llm_result(key) is None
+
+def test_insights_are_cached_per_profile():
+    # Fake LLM call: answers offline and counts calls
+    fake_llm = AsyncMock(return_value='{"summary": "Sensor data", "trends": []}')
+
+    profile = {"metadata": {"Temp": "float64"}, "summary": {"Temp": {"mean": 21.5}}}
+    with patch("app.services.llm_service.ainvoke_llm", fake_llm):
+        assert asyncio.run(generate_ai_insights_async(profile))["summary"] == "Sensor data"
+        assert asyncio.run(generate_ai_insights_async(profile))["summary"] == "Sensor data"
+        assert fake_llm.await_count == 1
+
+        asyncio.run(generate_ai_insights_async({"metadata": {"Temp": "float64"}, "summary": {"Temp": {"mean": 30.0}}}))
+        assert fake_llm.await_count == 2
+
+def test_dashboard_plan_fills_per_artifact_caches():
+    fake_llm = AsyncMock(return_value=(
+        '{"rules": [{"type": "bar", "x": "Device"}],'
+        ' "insights": {"summary": "Sensor data", "trends": []},'
+        ' "aggregations": [{"group_by": ["Device"], "aggregations": {"Temp": "mean"}}]}'
+    ))
+
+    profile = {"metadata": {"Device": "object", "Temp": "float64"}, "summary": {"Temp": {"mean": 21.5}}}
+    with patch("app.services.llm_service.ainvoke_llm", fake_llm):
+        plan = asyncio.run(generate_dashboard_plan_async(profile))
+
+        assert plan["rules"][0]["type"] == "bar"
+        assert plan["insights"]["summary"] == "Sensor data"
+        assert fake_llm.await_args.args[1] is True  # json_mode
+        # The per-artifact endpoints are now served without further LLM calls
+        assert asyncio.run(generate_visualization_rules_async(profile)) == plan["rules"]
+        assert asyncio.run(generate_ai_insights_async(profile)) == plan["insights"]
+        assert asyncio.run(generate_aggregation_rules_async(profile)) == plan["aggregations"]
+        assert fake_llm.await_count == 1
+
+def test_malformed_entries_are_misses_and_pruned(cache_dir):
+    key = llm_cache_service.llm_cache_key("model", "template", "prompt")
+    (cache_dir / f"{key}.json").write_text('{"value": ["rule"]}')
+    (cache_dir / "broken.json").write_text("[1, 2")
+    llm_cache_service.set_cached_llm_result("expired", ["old"], ttl_seconds=-1)
+    llm_cache_service.set_cached_llm_result("fresh", ["new"])
+
+    assert llm_cache_service.get_cached_llm_result(key) is None
+    assert llm_cache_service.prune_llm_cache(force=True) == 3
+    assert sorted(os.listdir(cache_dir)) == ["fresh.json"]
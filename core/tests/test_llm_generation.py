@@ -1,19 +1,17 @@
-
 import pytest
-import os
-from app.services.ai_service import generate_visualization_rules
-from unittest.mock import patch, MagicMock
-from langchain_core.messages import AIMessage
+import asyncio
+from app.services import llm_cache_service
+from app.services.ai_service import generate_visualization_rules_async
+from unittest.mock import patch, AsyncMock
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path):
+    with patch.object(llm_cache_service, "LLM_CACHE_DIR", str(tmp_path)):
+        yield tmp_path
 
-@patch('app.services.ai_service.ChatGoogleGenerativeAI')
-@patch.dict(os.environ, {"GEMINI_API_KEY": "dummy_key"})
-def test_generate_visualization_rules(mock_llm_class):
-    # Mock the LLM instance and its invoke method
-    mock_llm_instance = MagicMock()
-    mock_llm_class.return_value = mock_llm_instance
-    
+def test_generate_visualization_rules():
     # Mock response content
-    mock_response = AIMessage(content='''
+    reply = '''
     [
         {
             "type": "bar",
@@ -23,27 +21,23 @@ def test_generate_visualization_rules(mock_llm_class):
             "description": "A test chart"
         }
     ]
-    ''')
-    mock_llm_instance.invoke.return_value = mock_response
+    '''
 
     # Dummy analysis result
     analysis_result = {
         "metadata": {"Category": "object", "Value": "int64"},
         "summary": {"Category": {"unique": 3}, "Value": {"mean": 10}}
     }
-    
-    rules = generate_visualization_rules(analysis_result)
-    
+
+    with patch("app.services.llm_service.ainvoke_llm", AsyncMock(return_value=reply)):
+        rules = asyncio.run(generate_visualization_rules_async(analysis_result))
+
     assert len(rules) == 1
     assert rules[0]['type'] == 'bar'
     assert rules[0]['x'] == 'Category'
 
-@patch('app.services.ai_service.ChatGoogleGenerativeAI')
-def test_generate_visualization_rules_error_handling(mock_llm_class):
+def test_generate_visualization_rules_error_handling():
     # Simulate an exception
-    mock_llm_instance = MagicMock()
-    mock_llm_class.return_value = mock_llm_instance
-    mock_llm_instance.invoke.side_effect = Exception("API Error")
-    
-    rules = generate_visualization_rules({})
+    with patch("app.services.llm_service.ainvoke_llm", AsyncMock(side_effect=Exception("API Error"))):
+        rules = asyncio.run(generate_visualization_rules_async({}))
     assert rules == []
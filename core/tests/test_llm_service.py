@@ -0,0 +1,140 @@
+import os
+import json
+import time
+import asyncio
+import threading
+import pytest
+from unittest.mock import patch
+from app.services import llm_service, llm_cache_service
+from fake_llm_server import start_fake_llm_server, stop_fake_llm_server, canned_reply
+from app.services.ai_service import generate_dashboard_plan_async, stream_ai_insights_async
+
+@pytest.fixture
+def fake_llm(tmp_path):
+    servers = []
+
+    def start(**options):
+        server = start_fake_llm_server(**options)
+        servers.append(server)
+        llm_service._clients.clear()
+        patcher = patch.object(llm_service, "GEMINI_BASE_URL", server.base_url)
+        patcher.start()
+        return server
+
+    with patch.dict(os.environ, {"GEMINI_API_KEY": "fake-key"}), \
+         patch.object(llm_cache_service, "LLM_CACHE_DIR", str(tmp_path)), \
+         patch.object(llm_service, "LLM_RETRY_BASE_SECONDS", 0.01):
+        yield start
+        patch.stopall()
+        llm_service._clients.clear()
+        for server in servers:
+            stop_fake_llm_server(server)
+
+def test_transient_failures_are_retried(fake_llm):
+    server = fake_llm(failures=1)
+    reply = asyncio.run(llm_service.aquery_llm_json("Suggest 3 to 5 insightful visualizations"))
+    assert reply[0]["type"] == "bar"
+    assert len(server.prompts) == 2
+
+@pytest.mark.parametrize("status", [400, 403])
+def test_permanent_failures_are_not_retried(fake_llm, status):
+    server = fake_llm(failures=3, failure_status=status)
+    assert asyncio.run(llm_service.aquery_llm_json("Suggest 3 to 5 insightful visualizations")) is None
+    assert len(server.prompts) == 1
+
+def test_rate_limited_calls_are_retried(fake_llm):
+    server = fake_llm(failures=1, failure_status=429)
+    assert asyncio.run(llm_service.aquery_llm_json("Suggest 3 to 5 insightful visualizations"))[0]["type"] == "bar"
+    assert len(server.prompts) == 2
+
+def test_backoff_does_not_hold_a_concurrency_slot(fake_llm):
+    fake_llm(failures=1)
+
+    async def retry_while_another_call_runs():
+        # One slot: the retrying call's backoff must leave it to the second call
+        with patch.object(llm_service, "LLM_RETRY_BASE_SECONDS", 1.0), \
+             patch.object(llm_service, "LLM_MAX_CONCURRENCY", 1), \
+             patch("app.services.llm_service.random.uniform", side_effect=lambda low, high: high):
+            first = asyncio.ensure_future(llm_service.ainvoke_llm("first prompt"))
+            await asyncio.sleep(0.2)
+            started = time.monotonic()
+            await llm_service.ainvoke_llm("second prompt")
+            second_duration = time.monotonic() - started
+            await first
+            return second_duration
+
+    assert asyncio.run(retry_while_another_call_runs()) < 0.4
+
+def test_calls_are_cut_off_at_their_deadline(fake_llm):
+    fake_llm(delay=1.0)
+    started = time.monotonic()
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(llm_service.ainvoke_llm("slow prompt", timeout=0.3))
+    assert time.monotonic() - started < 0.9
+
+def test_concurrency_is_bounded_by_the_semaphore(fake_llm):
+    state = {"active": 0, "peak": 0}
+    lock = threading.Lock()
+
+    def responder(prompt_text):
+        with lock:
+            state["active"] += 1
+            state["peak"] = max(state["peak"], state["active"])
+        time.sleep(0.1)
+        with lock:
+            state["active"] -= 1
+        return "[]"
+
+    fake_llm(responder=responder)
+
+    async def fan_out():
+        return await asyncio.gather(*(llm_service.aquery_llm_json(f"prompt {i}") for i in range(6)))
+
+    with patch.object(llm_service, "LLM_MAX_CONCURRENCY", 2):
+        assert asyncio.run(fan_out()) == [[]] * 6
+    assert state["peak"] == 2
+
+def test_identical_concurrent_calls_share_one_request(fake_llm):
+    server = fake_llm(delay=0.2)
+
+    async def fan_out():
+        return await asyncio.gather(*(llm_service.aquery_llm_json("Suggest 3 to 5 insightful visualizations", template="rules") for _ in range(4)))
+
+    results = asyncio.run(fan_out())
+    assert all(result == results[0] for result in results)
+    assert len(server.prompts) == 1
+
+def test_dashboard_plan_fans_out_for_missing_parts(fake_llm):
+    def responder(prompt_text):
+        if "Plan a dashboard" in prompt_text:
+            plan = json.loads(canned_reply(prompt_text))
+            del plan["aggregations"]
+            return json.dumps(plan)
+        return canned_reply(prompt_text)
+
+    server = fake_llm(responder=responder)
+    profile = {"metadata": {"x": "object", "y": "float64"}, "summary": {"y": {"mean": 1.0}}}
+    plan = asyncio.run(generate_dashboard_plan_async(profile))
+
+    assert plan["rules"][0]["title"] == "Fake chart"
+    assert plan["aggregations"][0]["group_by"] == ["x"]
+    assert len(server.prompts) == 2
+
+def test_insights_stream_forwards_fields_then_serves_from_cache(fake_llm):
+    server = fake_llm(stream_chunk_chars=8)
+    profile = {"metadata": {"x": "object", "y": "float64"}, "summary": {"y": {"mean": 1.0}}}
+
+    async def collect():
+        return [event async for event in stream_ai_insights_async(profile)]
+
+    events = asyncio.run(collect())
+    kinds = [event["event"] for event in events]
+    assert kinds.count("chunk") > 1
+    assert {"event": "field", "data": {"key": "summary", "value": "Fake summary."}} in events
+    assert {"event": "item", "data": {"key": "trends", "index": 0, "value": "Fake trend"}} in events
+    assert events[-1] == {"event": "done", "data": {"insights": json.loads(canned_reply("comprehensive analysis")), "cached": False}}
+
+    events = asyncio.run(collect())
+    assert [event["event"] for event in events] == ["done"]
+    assert events[0]["data"]["cached"] is True
+    assert len(server.prompts) == 1
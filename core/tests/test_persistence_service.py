@@ -0,0 +1,62 @@
+import asyncio
+from unittest.mock import patch, MagicMock, AsyncMock
+from pymongo.errors import ServerSelectionTimeoutError
+from app.services import persistence_service, job_service, async_persistence_service
+
+def test_ensure_indexes_creates_file_path_unique_index():
+    mock_db = MagicMock()
+    with patch.object(persistence_service, "db", mock_db):
+        assert persistence_service.ensure_indexes() is True
+
+    calls = mock_db["uploaded_files"].create_index.call_args_list
+    file_path_call = next(c for c in calls if c.kwargs["name"] == "file_path_unique")
+    assert file_path_call.args[0] == [("file_path", 1)]
+    assert file_path_call.kwargs["unique"] is True
+    hash_call = next(c for c in calls if c.kwargs["name"] == "content_hash_unique")
+    assert hash_call.kwargs["unique"] is True
+    assert hash_call.kwargs["partialFilterExpression"] == {"content_hash": {"$type": "string"}}
+
+def test_ensure_indexes_tolerates_unreachable_db():
+    mock_db = MagicMock()
+    mock_db.__getitem__.return_value.create_index.side_effect = ServerSelectionTimeoutError("down")
+    with patch.object(persistence_service, "db", mock_db):
+        assert persistence_service.ensure_indexes() is False
+
+def test_ensure_indexes_gives_up_after_one_failed_ping():
+    mock_db = MagicMock()
+    mock_db.command.side_effect = ServerSelectionTimeoutError("down")
+    with patch.object(persistence_service, "db", mock_db):
+        assert persistence_service.ensure_indexes() is False
+    mock_db.__getitem__.return_value.create_index.assert_not_called()
+
+def test_bulk_upsert_files_sends_one_unordered_batch():
+    mock_db = MagicMock()
+    mock_db.uploaded_files.bulk_write.return_value = MagicMock(matched_count=1, modified_count=1, upserted_count=1)
+    with patch.object(persistence_service, "db", mock_db):
+        result = persistence_service.bulk_upsert_files([
+            {"file_path": "a.csv", "status": "processing"},
+            {"file_path": "b.csv", "status": "completed"}
+        ])
+
+    operations = mock_db.uploaded_files.bulk_write.call_args.args[0]
+    assert mock_db.uploaded_files.bulk_write.call_args.kwargs["ordered"] is False
+    assert [op._filter for op in operations] == [{"file_path": "a.csv"}, {"file_path": "b.csv"}]
+    assert all(op._upsert for op in operations)
+    assert result == {"matched": 1, "modified": 1, "upserted": 1}
+
+def test_sync_and_async_file_status_match():
+    record = {"file_path": "a.csv", "status": "completed", "processed_at": "2024-01-01T00:00:00"}
+    job = {"job_id": "j1", "status": "completed"}
+
+    with patch.object(job_service, "get_file_status_record", return_value=record), \
+         patch.object(job_service, "get_latest_job_for_file", return_value=job):
+        sync_status = job_service.get_file_status("a.csv")
+
+    async_db = MagicMock()
+    async_db.uploaded_files.find_one = AsyncMock(return_value=record)
+    async_db.analysis_jobs.find_one = AsyncMock(return_value=job)
+    with patch.object(async_persistence_service, "async_db", async_db):
+        async_status = asyncio.run(async_persistence_service.get_file_status_async("a.csv"))
+
+    assert sync_status == async_status
+    assert async_db.analysis_jobs.find_one.call_args.kwargs["sort"] == job_service.LATEST_JOB_SORT
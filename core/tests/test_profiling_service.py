@@ -0,0 +1,107 @@
+
+import pytest
+import numpy as np
+import pandas as pd
+from app.services.ai_service import analyze_file, analyze_file_streaming
+from app.services.profiling_service import new_profile_state, update_profile_state, merge_profile_states, finalize_profile_state
+
+def _write_sensor_csv(path, rows=1000):
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        'DeviceID': [f"dev-{i % 4}" for i in range(rows)],
+        'Temperature': rng.normal(70, 5, rows),
+        'Count': np.arange(rows)
+    })
+    df.loc[::50, 'Temperature'] = np.nan
+    df.to_csv(path, index=False)
+    return df
+
+def _profile_in_chunks(df, chunk_rows=1000):
+    state = new_profile_state()
+    for start in range(0, len(df), chunk_rows):
+        update_profile_state(state, df.iloc[start:start + chunk_rows])
+    return state
+
+def test_streaming_profile_matches_in_memory_schema(tmp_path):
+    file_path = tmp_path / "sensors.csv"
+    df = _write_sensor_csv(file_path)
+
+    exact = analyze_file(str(file_path), streaming=False)
+    streamed = analyze_file_streaming(str(file_path), chunk_rows=128)
+
+    assert streamed['metadata'] == exact['metadata']
+    assert streamed['row_count'] == len(df)
+    assert len(streamed['head_rows']) == 100
+    for col in df.columns:
+        assert set(streamed['summary'][col]) == set(exact['summary'][col])
+
+    temperature = streamed['summary']['Temperature']
+    assert temperature['count'] == exact['summary']['Temperature']['count']
+    assert temperature['missing_values'] == 20
+    assert np.isclose(temperature['mean'], exact['summary']['Temperature']['mean'])
+    assert np.isclose(temperature['std'], exact['summary']['Temperature']['std'])
+    assert temperature['min'] == exact['summary']['Temperature']['min']
+    assert temperature['max'] == exact['summary']['Temperature']['max']
+    assert abs(temperature['50%'] - exact['summary']['Temperature']['50%']) < 1.0
+
+    device = streamed['summary']['DeviceID']
+    assert device['unique'] == 4
+    assert device['freq'] == 250
+    assert abs(streamed['summary']['Count']['unique_values'] - 1000) < 50
+
+def test_merge_profile_states_combines_chunks():
+    first, second = new_profile_state(), new_profile_state()
+    update_profile_state(first, pd.DataFrame({'A': [1, 2, 3]}))
+    update_profile_state(second, pd.DataFrame({'A': [4.5, None]}))
+
+    merged = finalize_profile_state(merge_profile_states(first, second))
+    assert merged['metadata']['A'] == 'float64'
+    assert merged['summary']['A']['count'] == 4
+    assert merged['summary']['A']['missing_values'] == 1
+    assert np.isclose(merged['summary']['A']['mean'], 2.625)
+    assert merged['summary']['A']['max'] == 4.5
+
+def test_column_kind_is_pinned_by_first_chunk():
+    state = new_profile_state()
+    update_profile_state(state, pd.DataFrame({'Level': [1.0, 2.0, None], 'Code': ['a', 'b', 'c']}))
+    update_profile_state(state, pd.DataFrame({'Level': ['3', 'n/a', None], 'Code': [7, 8, 9]}))
+
+    profile = finalize_profile_state(state)
+    level, code = profile['summary']['Level'], profile['summary']['Code']
+    # Numbers in text form still count; text that is not a number becomes missing
+    assert level['count'] == 3.0 and level['max'] == 3.0
+    assert level['missing_values'] == 3
+    assert profile['summary_error_bounds']['Level']['coerced_to_missing'] == 1
+    # A text column keeps counting later numeric chunks as text values
+    assert profile['metadata']['Code'] == 'object'
+    assert code['count'] == 6 and code['unique'] == 6
+
+def test_profiles_are_reproducible():
+    df = pd.DataFrame({'x': np.random.default_rng(1).normal(size=20000)})
+    first = finalize_profile_state(_profile_in_chunks(df))
+    second = finalize_profile_state(_profile_in_chunks(df))
+    assert first['summary']['x']['25%'] == second['summary']['x']['25%']
+    assert first['summary_error_bounds']['x']['quantile_rank_error'] > 0
+
+def test_analyze_file_summary_modes(tmp_path):
+    file_path = tmp_path / "sensors.csv"
+    _write_sensor_csv(file_path)
+
+    exact = analyze_file(str(file_path), summary_mode="exact")
+    sketched = analyze_file(str(file_path), summary_mode="sketch")
+
+    assert exact['summary_mode'] == 'exact'
+    assert 'summary_error_bounds' not in exact
+    assert sketched['summary_mode'] == 'sketch'
+    assert set(sketched['summary']) == set(exact['summary'])
+
+    bounds = sketched['summary_error_bounds']
+    assert 0 < bounds['Count']['unique_values_relative_error'] < 0.05
+    assert bounds['Temperature']['quantile_rank_error'] < 0.05
+    assert bounds['DeviceID']['freq_max_undercount'] == 0
+
+def test_analyze_file_rejects_unknown_summary_mode(tmp_path):
+    file_path = tmp_path / "sensors.csv"
+    _write_sensor_csv(file_path, rows=10)
+    with pytest.raises(ValueError):
+        analyze_file(str(file_path), summary_mode="fast")
@@ -0,0 +1,54 @@
+import json
+from app.services.prompt_service import compact_profile, estimate_tokens
+
+def _wide_profile(extra_columns: int) -> dict:
+    metadata = {"Timestamp": "object", "Temperature": "float64", "RowID": "object"}
+    summary = {
+        "Timestamp": {"count": 100, "unique": 100, "top": "2023-01-01", "freq": 1, "missing_values": 0, "unique_values": 100, "samples": ["2023-01-01"]},
+        "Temperature": {"count": 100.0, "mean": 70.151113333, "std": 5.81528949, "min": 52.6, "25%": 66.52, "50%": 70.07, "75%": 73.34, "max": 150.0,
+                        "missing_values": 0, "unique_values": 90, "samples": [63.4, 68.87]},
+        "RowID": {"count": 100, "unique": 100, "top": "r1", "freq": 1, "missing_values": 0, "unique_values": 100, "samples": ["r1", "r2"]}
+    }
+    for i in range(extra_columns):
+        metadata[f"Sensor_{i}"] = "float64"
+        summary[f"Sensor_{i}"] = {"count": 90.0, "mean": i * 1.123456, "std": 1.0, "min": 0.0, "25%": 0.5, "50%": 1.0, "75%": 1.5, "max": 2.0,
+                                  "missing_values": 10, "unique_values": 50, "samples": [0.1]}
+    return {"metadata": metadata, "summary": summary, "row_count": 100}
+
+def test_compact_profile_rounds_and_drops_redundant_stats():
+    profile = compact_profile(_wide_profile(0))
+    lines = [json.loads(line) for line in profile["text"].splitlines() if line.startswith("{")]
+    temperature = next(line for line in lines if line["col"] == "Temperature")
+
+    assert temperature["mean"] == 70.15
+    assert temperature["std"] == 5.815
+    assert "samples" not in temperature and "count" not in temperature and "missing" not in temperature
+    # Ranking: temporal and numeric columns before identifiers
+    assert [line["col"] for line in lines] == ["Timestamp", "Temperature", "RowID"]
+    assert "top" not in lines[-1]
+    assert profile["estimated_tokens"] == estimate_tokens(profile["text"])
+
+def test_integer_identifiers_rank_below_measures():
+    numeric = {"count": 100.0, "mean": 50.5, "std": 29.0, "min": 1, "25%": 25, "50%": 50, "75%": 75, "max": 100, "missing_values": 0}
+    profile = {
+        "metadata": {"order_id": "int64", "price": "float64", "code": "object", "region": "object"},
+        "summary": {
+            "order_id": dict(numeric, unique_values=100),
+            "price": dict(numeric, unique_values=100),
+            "code": {"count": 100, "unique": 100, "missing_values": 0, "unique_values": 100},
+            "region": {"count": 100, "unique": 4, "missing_values": 0, "unique_values": 4}
+        },
+        "row_count": 100
+    }
+    lines = [json.loads(line) for line in compact_profile(profile)["text"].splitlines() if line.startswith("{")]
+    assert [line["col"] for line in lines] == ["price", "region", "order_id", "code"]
+
+def test_compact_profile_respects_token_budget():
+    full = compact_profile(_wide_profile(300), token_budget=10 ** 6)
+    budgeted = compact_profile(_wide_profile(300), token_budget=500)
+
+    assert full["columns_included"] == full["columns_total"] == 303
+    assert budgeted["estimated_tokens"] <= 500
+    assert 0 < budgeted["columns_included"] < 303
+    assert "omitted columns" in budgeted["text"]
+    assert "RowID" not in budgeted["text"].split("omitted")[0]